@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Benchmark the main session apis against a simulated CommServe
+
+Reports calls per second, p50 and p99 latency per api, and peak RSS of
+the process. Results are only comparable between runs on one machine.
+
+    python benchmarks/bench_sessions.py --clients 20000 --jobs-per-client 100
+"""
+import argparse
+import itertools
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pinkopy import CommvaultSession  # noqa: E402
+from pinkopy.testing import Fleet, SimulatedCommServe  # noqa: E402
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return rss / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def run(name, func, args, duration):
+    """Call func on args in turn for up to duration seconds."""
+    latencies = []
+    start = time.perf_counter()
+    for arg in itertools.cycle(args):
+        t = time.perf_counter()
+        func(arg)
+        latencies.append(time.perf_counter() - t)
+        if t - start >= duration:
+            break
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print('{:<24} {:>8} {:>10.1f} {:>10.2f} {:>10.2f} {:>10.1f}'.format(
+        name, len(latencies), len(latencies) / elapsed,
+        percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, peak_rss_mb()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--subclients-per-client', type=int, default=3)
+    parser.add_argument('--jobs-per-client', type=int, default=100)
+    parser.add_argument('--dialect', choices=('json', 'legacy'), default='json')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds the server adds to each response')
+    parser.add_argument('--duration', type=float, default=3,
+                        help='seconds to run each benchmark')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--cache', action='store_true', help='keep the session cache on')
+    args = parser.parse_args(argv)
+
+    fleet = Fleet(clients=args.clients, subclients_per_client=args.subclients_per_client,
+                  jobs_per_client=args.jobs_per_client)
+    client_ids = fleet.client_ids()
+    job_ids = [int(client_id) * 1000000 for client_id in client_ids]
+    with SimulatedCommServe(fleet, dialect=args.dialect, latency=args.latency) as server:
+        with CommvaultSession(service=server.url, user='bench', pw='bench',
+                              use_cache=args.cache) as commvault:
+            print('{} clients, {} jobs, {} dialect'.format(
+                args.clients, args.clients * args.jobs_per_client, args.dialect))
+            print('{:<24} {:>8} {:>10} {:>10} {:>10} {:>10}'.format(
+                'api', 'calls', 'calls/s', 'p50 ms', 'p99 ms', 'rss MB'))
+            run('get_clients', lambda _: commvault.get_clients(), [None], args.duration)
+            run('get_client_properties', commvault.get_client_properties, client_ids,
+                args.duration)
+            run('get_subclients', commvault.get_subclients, client_ids, args.duration)
+            run('get_jobs', commvault.get_jobs, client_ids, args.duration)
+            run('get_jobs last=5', lambda c: commvault.get_jobs(c, last=5), client_ids,
+                args.duration)
+            run('iter_jobs last=5', lambda c: list(commvault.iter_jobs(c, last=5)),
+                client_ids, args.duration)
+            run('get_job_details', commvault.get_job_details, job_ids, args.duration)
+            batch = max(args.concurrency * 4, 1)
+            batches = [job_ids[n:n + batch] for n in range(0, len(job_ids), batch)]
+            run('get_job_details_many', lambda ids: list(commvault.get_job_details_many(
+                ids, max_workers=args.concurrency)), batches, args.duration)
+            sweep = [client_ids[n:n + batch] for n in range(0, len(client_ids), batch)]
+            run('iter_all_jobs', lambda ids: sum(1 for _ in commvault.iter_all_jobs(
+                client_ids=ids, last=5, concurrency=args.concurrency)), sweep, args.duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Benchmark startup of short-lived processes using pinkopy
+
+Runs a fresh interpreter per sample that imports pinkopy, opens a
+CommvaultSession against a simulated CommServe and makes one call, as a
+monitoring check would. Reports p50 and p90 of each phase and of the
+whole process.
+
+    python benchmarks/bench_startup.py --samples 50
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from pinkopy.testing import Fleet, SimulatedCommServe  # noqa: E402
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from pinkopy import CommvaultSession
+imported = time.perf_counter()
+commvault = CommvaultSession(service=sys.argv[1], user='bench', pw='bench')
+constructed = time.perf_counter()
+commvault.get_jobs('1', last=5)
+called = time.perf_counter()
+commvault.logout()
+print(json.dumps({'import': imported - start, 'construct': constructed - imported,
+                  'first call': called - constructed,
+                  'aiohttp loaded': 'aiohttp' in sys.modules}))
+"""
+PHASES = ('import', 'construct', 'first call', 'process')
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def sample(url):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    start = time.perf_counter()
+    out = subprocess.check_output([sys.executable, '-c', CHILD, url], env=env)
+    result = json.loads(out.decode('UTF-8').strip().splitlines()[-1])
+    result['process'] = time.perf_counter() - start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with SimulatedCommServe(Fleet(clients=10)) as server:
+        results = [sample(server.url) for _ in range(args.samples)]
+    print('{} samples, aiohttp loaded: {}'.format(
+        len(results), any(r['aiohttp loaded'] for r in results)))
+    print('{:<12} {:>10} {:>10}'.format('phase', 'p50 ms', 'p90 ms'))
+    for phase in PHASES:
+        values = [r[phase] for r in results]
+        print('{:<12} {:>10.1f} {:>10.1f}'.format(
+            phase, percentile(values, 50) * 1000, percentile(values, 90) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,12 +5,21 @@ pinkopy is a Python wrapper for the Commvault API
 __title__ = 'pinkopy'
 __author__ = 'Herkermer Sherwood'
 
-# bring the session handler into package namespace
+# bring the session handlers into package namespace
 from .commvault import CommvaultSession
 
-# only provide session handler in *
-__all__ = ['CommvaultSession']
+# only provide session handlers in *
+__all__ = ['AsyncCommvaultSession', 'CommvaultSession']
 
 # Set default logging handler to avoid "No handler found" warnings.
 import logging
 logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+
+def __getattr__(name):
+    # the asyncio session pulls in aiohttp, so it is only imported when
+    # asked for
+    if name == 'AsyncCommvaultSession':
+        from .aio import AsyncCommvaultSession
+        return AsyncCommvaultSession
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
@@ -0,0 +1,507 @@
+"""
+asyncio session for the Commvault API
+
+Requires aiohttp, available with the async extra.
+"""
+import asyncio
+from base64 import b64encode
+import logging
+import time
+from urllib.parse import urlencode, urljoin
+from xml.parsers.expat import ExpatError
+
+import requests
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .cache import SessionCache
+from .capabilities import FORMATS, XML, Capabilities
+from .decoders import Decoder
+from .clients import ClientIndex, parse_client_properties, parse_clients
+from .exceptions import PinkopyError, raise_requests_error
+from .jobs import JobSession, job_details_xml, parse_job_details, parse_jobs
+from .records import Client, JobDetail, JobSummary, Subclient
+from .subclients import parse_subclients
+
+log = logging.getLogger(__name__)
+
+
+class AsyncAuthenticator(object):
+    """Credential manager for asyncio sessions.
+
+    The coroutine counterpart of Authenticator. One login runs at a
+    time and callers holding a rejected token wait for it.
+
+    Args:
+        login (coroutine function): performs the login and returns a
+            new token
+        token (optional[str]): current token, if already logged in
+        token_ttl (optional[int]): seconds a token is known to live
+        refresh_margin (optional[int]): seconds before expiry at which
+            to refresh. Defaults to 60.
+
+    Returns:
+        authenticator object
+    """
+    def __init__(self, login, token=None, token_ttl=None, refresh_margin=60):
+        self.login = login
+        self.token_ttl = token_ttl
+        self.refresh_margin = refresh_margin
+        self.expires_at = None
+        self.logins = 0
+        self.token = None
+        self.__lock = None
+        if token:
+            self.set_token(token)
+
+    @property
+    def expiring(self):
+        """Boolean whether the token is within the refresh margin."""
+        if self.expires_at is None:
+            return False
+        return time.time() >= self.expires_at - self.refresh_margin
+
+    def set_token(self, token):
+        """Set token and restart its expiry clock.
+
+        Args:
+            token (str): Authtoken
+        """
+        self.token = token
+        if token is not None and self.token_ttl:
+            self.expires_at = time.time() + self.token_ttl
+        else:
+            self.expires_at = None
+
+    async def get_token(self):
+        """Current token, refreshed first if it is about to expire."""
+        token = self.token
+        if token is not None and self.expiring:
+            log.info('Commvault token near expiry. Refreshing.')
+            token = await self.refresh(stale=token)
+        return token
+
+    async def refresh(self, stale=None):
+        """Login again unless another caller already has.
+
+        Args:
+            stale (optional[str]): token that was rejected. If not
+                provided, always login.
+
+        Returns:
+            str: token
+        """
+        if self.__lock is None:
+            # created here so it binds to the running loop
+            self.__lock = asyncio.Lock()
+        async with self.__lock:
+            current = self.token
+            if stale is not None and current is not None and current != stale:
+                return current
+            token = await self.login()
+            self.logins += 1
+            self.set_token(token)
+            return token
+
+    def clear(self):
+        """Forget the token."""
+        self.set_token(None)
+
+
+class AsyncCommvaultSession(object):
+    """asyncio session wrapper for Commvault.
+
+    Mirrors CommvaultSession with coroutine methods. Requests share one
+    aiohttp connection pool and at most max_concurrency of them are in
+    flight at once. Use it as an async context manager, or await open
+    and logout yourself.
+
+    Args:
+        service (optional[str]): URL and path to root of api
+        user (str): Commvault username
+        pw (str): Commvault password
+        use_cache (optional[bool]): Use cache? Defaults to True
+        cache_ttl (optional[int]): Duration cache lives. Defaults to 1200.
+        cache_methods (optional[list]): List of methods to cache.
+        cache (optional[SessionCache]): cache for method results. One
+            is created if not provided.
+        token (optional[str]): Authtoken for header
+        token_ttl (optional[int]): seconds a token lives, used to
+            refresh it before it expires
+        max_concurrency (optional[int]): requests in flight at once.
+            Defaults to 100.
+        http (optional[aiohttp.ClientSession]): client session to use.
+            One is created on open if not provided.
+        use_records (optional[bool]): return compact records from
+            pinkopy.records instead of raw payloads. Defaults to False.
+        keep_raw (optional[bool]): keep the full payload in each record,
+            for record.raw and record[key]. Defaults to False.
+        capabilities (optional[Capabilities]): formats the CommServe is
+            known to use per route. One is created if not provided.
+        decoder (optional[Decoder]): decodes response bodies. Defaults
+            to a pinkopy.decoders.Decoder.
+
+    Returns:
+        session object
+    """
+    def __init__(self, service, user, pw, use_cache=True, cache_ttl=1200,
+                 cache_methods=None, token=None, token_ttl=None,
+                 max_concurrency=100, http=None, use_records=False, keep_raw=False,
+                 cache=None, capabilities=None, decoder=None):
+        if aiohttp is None:
+            raise ImportError('AsyncCommvaultSession requires aiohttp. '
+                              'Install pinkopy[async].')
+        self.service = service
+        self.user = user
+        self.pw = pw
+        self.use_cache = bool(use_cache)
+        self.use_records = bool(use_records)
+        self.keep_raw = bool(keep_raw)
+        self.cache_ttl = cache_ttl
+        self.cache_methods = cache_methods or ['get_client_properties',
+                                               'get_clients',
+                                               'get_job_details',
+                                               'get_jobs',
+                                               'get_subclients']
+        self.max_concurrency = max_concurrency
+        self.auth = AsyncAuthenticator(self._login, token=token, token_ttl=token_ttl)
+        self.base_headers = {
+            'Accept': 'application/json',
+            'Content-type': 'application/json'
+        }
+        self.http = http
+        self.__owns_http = http is None
+        self.__semaphore = None
+        self.cache = cache or SessionCache(ttl=cache_ttl)
+        self.capabilities = capabilities or Capabilities()
+        self.decoder = decoder or Decoder()
+        self.__index = None
+
+    # reuse the synchronous helpers that do no io
+    get_subclient_jobs = staticmethod(JobSession.get_subclient_jobs)
+    get_job_vmstatus = staticmethod(JobSession.get_job_vmstatus)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, traceback):
+        try:
+            await self.logout()
+        finally:
+            await self.close()
+
+    async def open(self):
+        """Create the connection pool and login if needed."""
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.http is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            self.http = aiohttp.ClientSession(connector=connector)
+        if not await self.auth.get_token():
+            await self.get_token()
+        return self
+
+    async def close(self):
+        """Close the connection pool if this session created it."""
+        if self.__owns_http and self.http is not None:
+            await self.http.close()
+            self.http = None
+
+    async def _cached(self, method_name, args, func):
+        """Await func(*args), through the cache if enabled for the method.
+
+        Args:
+            method_name (str): name of cached method
+            args (tuple): arguments for func
+            func (coroutine function): produces the value
+
+        Returns:
+            func's return value
+        """
+        if not self.use_cache or method_name not in self.cache_methods:
+            return await func(*args)
+        key = self.cache.key(method_name, *args)
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        value = await func(*args)
+        self.cache.set(key, value)
+        return value
+
+    def clear_cache(self):
+        """Drop all cached values."""
+        self.cache.clear()
+
+    async def request(self, method, path, headers=None, payload=None,
+                      payload_nondict=None, qstr_vals=None, service=None):
+        """Make request.
+
+        The body is read before returning, so the response may be
+        decoded after the connection is released.
+
+        Args:
+            method (str): HTTP method
+            path (str): request path
+            headers (optional[dict]): headers if provided else default
+            payload (optional[dict]): payload as dictionary
+            payload_nondict (optional[str]): payload raw data
+            qstr_vals (optional[dict]): query string parameters to add
+            service (optional[str]): URL and path to root of api
+
+        Returns:
+            aiohttp response object
+        """
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+            raise ValueError('HTTP method {} not supported'.format(method))
+        if self.http is None or self.__semaphore is None:
+            await self.open()
+        allowed_attempts = 3
+        attempt = 1
+        service = service if service else self.service
+        url = urljoin(service, path)
+        if qstr_vals is not None:
+            url += '?' + urlencode(qstr_vals)
+        kwargs = {}
+        if payload_nondict:
+            kwargs['data'] = payload_nondict
+        elif payload is not None and method != 'GET':
+            kwargs['json'] = payload
+        elif payload is not None:
+            kwargs['params'] = payload
+        try:
+            while True:
+                if headers:
+                    req_headers = headers
+                else:
+                    req_headers = dict(self.base_headers,
+                                       Authtoken=await self.auth.get_token())
+                token = req_headers.get('Authtoken')
+                async with self.__semaphore:
+                    async with self.http.request(method, url, headers=req_headers,
+                                                 **kwargs) as res:
+                        await res.read()
+                if res.status == 401 and token is not None:
+                    if attempt >= allowed_attempts:
+                        msg = ('Could not log back into Commvault after {} '
+                               'attempts. It could be down.'
+                               .format(allowed_attempts))
+                        raise_requests_error(401, msg)
+                    log.info('Commvault token logged out. Logging back in.')
+                    token = await self.auth.refresh(stale=token)
+                    if headers:
+                        headers = dict(headers, Authtoken=token)
+                    attempt += 1
+                elif res.status != 200:
+                    msg = '{} {} for url: {}'.format(res.status, res.reason, url)
+                    raise_requests_error(res.status, msg)
+                else:
+                    log.info('request: {} {}'.format(method, url))
+                    return res
+        except requests.HTTPError as err:
+            log.error(err)
+            raise
+        except Exception:
+            msg = 'Pinkopy request failed.'
+            log.exception(msg)
+            raise PinkopyError(msg)
+
+    async def decode(self, res):
+        """Decode response body, json or the xml older versions send.
+
+        Args:
+            res: aiohttp response object
+
+        Returns:
+            decoded body
+
+        Raises:
+            ValueError: if the body is neither json nor xml
+        """
+        # released responses give their read body as text, not bytes
+        content = await res.text()
+        try:
+            return self.decoder.json(content)
+        except ValueError:
+            pass
+        # turn wrong xml into json
+        try:
+            return self.decoder.xml(content)
+        except ExpatError as err:
+            raise ValueError('Invalid json or xml: {}'.format(err))
+
+    async def get_token(self):
+        """Login to Commvault and get token.
+
+        Returns:
+            str: token
+        """
+        return await self.auth.refresh()
+
+    async def _login(self):
+        """Post credentials to Commvault.
+
+        Returns:
+            str: token
+        """
+        path = 'Login'
+        payload = {
+            'mode': 4,
+            'username': self.user,
+            'password': b64encode(self.pw.encode('UTF-8')).decode('UTF-8')}
+        res = await self.request('POST', path, headers=self.base_headers, payload=payload)
+        data = await res.json(content_type=None)
+        if 'token' in data and data['token']:
+            return data['token']
+        else:
+            msg = 'Commvault user or pass incorrect'
+            raise_requests_error(401, msg)
+
+    async def logout(self):
+        """End session."""
+        path = 'Logout'
+        if self.auth.token is not None:
+            await self.request('POST', path)
+        self.auth.clear()
+        return None
+
+    async def get_clients(self):
+        """Get clients.
+
+        Returns:
+            list: clients
+        """
+        return await self._cached('get_clients', (), self._get_clients)
+
+    async def _get_clients(self):
+        res = await self.request('GET', 'Client')
+        clients = parse_clients(await self.decode(res))
+        if self.use_records:
+            clients = [Client.from_raw(client, keep_raw=self.keep_raw) for client in clients]
+        return clients
+
+    async def get_client(self, client_id):
+        """Get client.
+
+        Args:
+            client_id (str): client id
+
+        Returns:
+            dict: client
+        """
+        clients = await self.get_clients()
+        if self.__index is None or self.__index.clients is not clients:
+            self.__index = ClientIndex(clients)
+        client = self.__index.get(client_id)
+        if client is None:
+            msg = 'Client {} not in client list.'.format(client_id)
+            raise_requests_error(404, msg)
+        return client
+
+    async def get_client_properties(self, client_id):
+        """Get client properties.
+
+        Args:
+            client_id (str): client id
+
+        Returns:
+            dict: client properties
+        """
+        return await self._cached('get_client_properties', (str(client_id),),
+                                  self._get_client_properties)
+
+    async def _get_client_properties(self, client_id):
+        res = await self.request('GET', 'Client/{}'.format(client_id))
+        return parse_client_properties(await self.decode(res), client_id)
+
+    async def get_subclients(self, client_id):
+        """Get subclients.
+
+        Args:
+            client_id (str): client id for which to get subclients
+
+        Returns:
+            list: subclients
+        """
+        return await self._cached('get_subclients', (str(client_id),),
+                                  self._get_subclients)
+
+    async def _get_subclients(self, client_id):
+        res = await self.request('GET', 'Subclient', qstr_vals={'clientId': client_id})
+        subclients = parse_subclients(await self.decode(res), client_id)
+        if self.use_records:
+            subclients = [Subclient.from_raw(subclient, keep_raw=self.keep_raw)
+                          for subclient in subclients]
+        return subclients
+
+    async def get_jobs(self, client_id, job_filter=None, last=None):
+        """Get jobs.
+
+        Args:
+            client_id (str): client id for which to get jobs
+            job_filter (optional[str]): job filter, ex. backup, restore
+            last (optional[int]): get this many most recent jobs
+
+        Returns:
+            list: jobs
+        """
+        return await self._cached('get_jobs', (str(client_id), job_filter, last),
+                                  self._get_jobs)
+
+    async def _get_jobs(self, client_id, job_filter, last):
+        qstr_vals = {
+            'clientId': client_id
+        }
+        if job_filter is not None:
+            qstr_vals['jobFilter'] = job_filter
+        res = await self.request('GET', 'Job', qstr_vals=qstr_vals)
+        jobs = parse_jobs(await self.decode(res), last=last)
+        if self.use_records:
+            jobs = [JobSummary.from_raw(job, keep_raw=self.keep_raw) for job in jobs]
+        return jobs
+
+    async def get_job_details(self, job_id):
+        """Get details about a given job.
+
+        Args:
+            job_id (str): job id for which to get details
+
+        Returns:
+            dict: job details
+        """
+        return await self._cached('get_job_details', (str(job_id),),
+                                  self._get_job_details)
+
+    async def _get_job_details(self, job_id):
+        path = 'JobDetails'
+        key = (path, 'request')
+        error = None
+        # Commvault broke the json request on this route in some
+        # versions; the format that worked last is tried first.
+        for fmt in self.capabilities.order(key, FORMATS):
+            if fmt == XML:
+                headers = dict(self.base_headers, Authtoken=await self.auth.get_token())
+                headers['Content-type'] = 'application/xml'
+                res = await self.request('POST', path, headers=headers,
+                                         payload_nondict=job_details_xml(job_id))
+            else:
+                payload = {
+                    'JobManager_JobDetailRequest': {
+                        '@jobId': job_id
+                    }
+                }
+                res = await self.request('POST', path, payload=payload)
+            try:
+                job_details = parse_job_details(await self.decode(res), job_id)
+            except (KeyError, ValueError) as err:
+                error = err
+                continue
+            self.capabilities.learn(key, fmt)
+            break
+        else:
+            raise error
+        if self.use_records:
+            job_details = JobDetail.from_raw(job_details, keep_raw=self.keep_raw, job_id=job_id)
+        return job_details
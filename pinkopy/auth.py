@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Authenticator(object):
+    """Credential manager shared by sessions.
+
+    Holds the Authtoken for a CommvaultSession and all of its
+    subsessions. Only one login runs at a time; callers that find the
+    token rejected while another thread is logging in wait for that
+    login and then use its token rather than logging in again.
+
+    Args:
+        login (callable): performs the login and returns a new token
+        token (optional[str]): current token, if already logged in
+        token_ttl (optional[int]): seconds a token is known to live.
+            When set, the token is refreshed before it expires.
+        refresh_margin (optional[int]): seconds before expiry at which
+            to refresh. Defaults to 60.
+
+    Returns:
+        authenticator object
+    """
+    def __init__(self, login, token=None, token_ttl=None, refresh_margin=60):
+        self.login = login
+        self.token_ttl = token_ttl
+        self.refresh_margin = refresh_margin
+        self.expires_at = None
+        self.logins = 0
+        self.__token = None
+        self.__lock = threading.RLock()
+        if token:
+            self.set_token(token)
+
+    @property
+    def token(self):
+        """Current token, refreshed first if it is about to expire."""
+        token = self.__token
+        if token is not None and self.expiring:
+            log.info('Commvault token near expiry. Refreshing.')
+            token = self.refresh(stale=token)
+        return token
+
+    @property
+    def expiring(self):
+        """Boolean whether the token is within the refresh margin."""
+        if self.expires_at is None:
+            return False
+        return time.time() >= self.expires_at - self.refresh_margin
+
+    def set_token(self, token):
+        """Set token and restart its expiry clock.
+
+        Args:
+            token (str): Authtoken
+        """
+        with self.__lock:
+            self.__token = token
+            if token is not None and self.token_ttl:
+                self.expires_at = time.time() + self.token_ttl
+            else:
+                self.expires_at = None
+
+    def refresh(self, stale=None):
+        """Login again unless another caller already has.
+
+        Args:
+            stale (optional[str]): token that was rejected. If the
+                current token differs, it was refreshed while waiting
+                and is returned without logging in again. If not
+                provided, always login.
+
+        Returns:
+            str: token
+        """
+        with self.__lock:
+            current = self.__token
+            if stale is not None and current is not None and current != stale:
+                return current
+            token = self.login()
+            self.logins += 1
+            self.set_token(token)
+            return token
+
+    def clear(self):
+        """Forget the token."""
+        self.set_token(None)
@@ -7,15 +7,23 @@ try:
 except ImportError:
     from urllib import urlencode
     from urlparse import urljoin
-import xmltodict
 
-from cachetools.func import ttl_cache
 import requests
 
+from .auth import Authenticator
+from .cache import SessionCache
+from .capabilities import Capabilities
+from .decoders import Decoder
 from .exceptions import PinkopyError, raise_requests_error
+from .retry import RetryPolicy
+from .throttle import Governor, route_of
+from .transport import HTTPTransport
 
 log = logging.getLogger(__name__)
 
+# inventory that changes slowly enough to be worth keeping on disk
+PERSIST_METHODS = ['get_client_properties', 'get_clients', 'get_subclients']
+
 
 class BaseSession(object):
     """BaseSession
@@ -30,26 +38,121 @@ class BaseSession(object):
         cache_ttl (optional[int]): Duration cache lives. Defaults to 1200.
         cache_methods (optional[int]): List of methods to cache.
             Defaults provided by the inheriting classes.
+        cache (optional[SessionCache]): cache for method results.
+            Sessions sharing a cache share its budget and entries. One
+            is created if not provided.
+        cache_size (optional[int]): entries kept when creating a
+            cache. Defaults to 1024.
+        cache_bytes (optional[int]): approximate bytes kept when
+            creating a cache, used instead of cache_size if set.
+        cache_ttls (optional[dict]): duration cache lives by method
+            name when creating a cache, overriding cache_ttl.
+        cache_path (optional[str]): SQLite file in which to persist
+            inventory results (get_clients, get_client_properties and
+            get_subclients) across processes, when creating a cache.
+            Sessions returning raw payloads, records, or records with
+            their payloads keep separate entries in a shared file.
+        cache_refresh_ahead (optional[float]): fraction of the ttl
+            after which cached results are refreshed in the background
+            when read, when creating a cache.
+        cache_negative_ttl (optional[int]): duration not found (404)
+            errors of cached methods are cached, when creating a cache.
+            Defaults to None, meaning they are not cached.
         token (optional[str]): Authtoken for header
+        transport (optional[HTTPTransport]): transport used to send
+            requests. Sessions sharing a transport share its connection
+            pool. One is created if not provided.
+        pool_size (optional[int]): connections kept per host when
+            creating a transport. Defaults to 10.
+        auth (optional[Authenticator]): credential manager holding the
+            token. Sessions sharing one share a single login. One is
+            created if not provided.
+        token_ttl (optional[int]): seconds a token lives, used to
+            refresh it before it expires. Defaults to None, meaning
+            tokens are only refreshed once rejected.
+        use_records (optional[bool]): return compact records from
+            pinkopy.records instead of raw payloads. Defaults to False.
+        keep_raw (optional[bool]): keep the full payload in each record,
+            for record.raw and record[key]. Defaults to False.
+        governor (optional[Governor]): limits the rate and concurrency
+            of requests. Sessions sharing one share its limits. One is
+            created if rate_limit, max_in_flight or route_limits is set.
+        rate_limit (optional[float]): requests per second, when
+            creating a governor.
+        max_in_flight (optional[int]): requests outstanding at once,
+            when creating a governor.
+        route_limits (optional[dict]): limits by route when creating a
+            governor, ex. {'JobDetails': {'rate': 5, 'max_in_flight': 4}}
+        retry_policy (optional[RetryPolicy]): when to retry failed
+            idempotent requests. Sessions sharing one share its retry
+            budget. One is created if not provided.
+        retries (optional[int]): retries per request when creating a
+            retry policy. Defaults to 2; 0 disables retrying.
+        connect_timeout (optional[float]): seconds to wait for a
+            connection. Defaults to 10.
+        read_timeout (optional[float]): seconds to wait for the server
+            between bytes of the response. Defaults to 300.
+        instrument (optional[Instrument]): hooks called on requests,
+            retries, re-auths, parsing and cache lookups, ex. a
+            pinkopy.metrics.MetricsCollector. Defaults to None.
+        capabilities (optional[Capabilities]): formats the CommServe is
+            known to use per route. Sessions sharing one learn them
+            once. One is created if not provided.
+        decoder (optional[Decoder]): decodes response bodies. Defaults
+            to a pinkopy.decoders.Decoder using the fastest json library
+            installed.
 
     Returns:
         session object
     """
     def __init__(self, service, user, pw, use_cache=True, cache_ttl=1200,
-                 cache_methods=None, token=None):
+                 cache_methods=None, token=None, transport=None, pool_size=10,
+                 auth=None, token_ttl=None, use_records=False, keep_raw=False, cache=None,
+                 cache_size=1024, cache_bytes=None, cache_ttls=None, cache_path=None,
+                 cache_refresh_ahead=None, cache_negative_ttl=None, governor=None,
+                 rate_limit=None, max_in_flight=None, route_limits=None,
+                 retry_policy=None, retries=2, connect_timeout=10, read_timeout=300,
+                 instrument=None, capabilities=None, decoder=None):
         self.service = service
         self.user = user
         self.pw = pw
-        self.headers = {
-            'Authtoken': token,
+        self.__owns_transport = transport is None
+        self.transport = transport or HTTPTransport(pool_maxsize=pool_size)
+        self.governor = governor
+        if self.governor is None and (rate_limit or max_in_flight or route_limits):
+            self.governor = Governor(rate=rate_limit, max_in_flight=max_in_flight,
+                                     routes=route_limits)
+        self.retry_policy = retry_policy or RetryPolicy(attempts=retries + 1)
+        self.timeout = (connect_timeout, read_timeout)
+        self.instrument = instrument
+        self.capabilities = capabilities or Capabilities()
+        self.decoder = decoder or Decoder()
+        self.auth = auth or Authenticator(self._login, token=token, token_ttl=token_ttl)
+        self.base_headers = {
             'Accept': 'application/json',
             'Content-type': 'application/json'
         }
-        if not self.headers['Authtoken']:
+        if not self.auth.token:
             self.get_token()
+        self.__use_records = bool(use_records)
+        self.__keep_raw = bool(keep_raw)
         self.__use_cache = bool(use_cache)
         self.__cache_ttl = cache_ttl
         self.__cache_methods = cache_methods or []
+        self.cache = cache
+        if self.use_cache and self.cache is None:
+            store = None
+            if cache_path:
+                from .store import SQLiteStore
+                store = SQLiteStore(cache_path, namespace='{}|{}|{}'.format(
+                    service, user, self.__result_mode()))
+            self.cache = SessionCache(max_entries=cache_size, max_bytes=cache_bytes,
+                                      ttl=cache_ttl, ttls=cache_ttls, store=store,
+                                      persist_methods=PERSIST_METHODS,
+                                      refresh_ahead=cache_refresh_ahead,
+                                      negative_ttl=cache_negative_ttl)
+        if self.cache is not None and instrument is not None:
+            self.cache.instrument = instrument
 
         if self.use_cache:
             for method_name in set(self.cache_methods):
@@ -69,12 +172,35 @@ class BaseSession(object):
             try:
                 return not inspect.isfunction(method.cache_info)
             except AttributeError:
-                setattr(self, method_name, ttl_cache(ttl=self.cache_ttl)(method))
+                setattr(self, method_name, self.cache.wrap(method_name, method))
                 return True
         except AttributeError:
             # method doesn't exist on initializing class
             return False
 
+    @property
+    def headers(self):
+        """Default headers, including the current Authtoken."""
+        headers = {'Authtoken': self.auth.token}
+        headers.update(self.base_headers)
+        return headers
+
+    def __result_mode(self):
+        """Name of the form results are returned in."""
+        if not self.use_records:
+            return 'raw'
+        return 'records+raw' if self.keep_raw else 'records'
+
+    @property
+    def use_records(self):
+        """Boolean to return records or not."""
+        return self.__use_records
+
+    @property
+    def keep_raw(self):
+        """Boolean to keep full payloads in records or not."""
+        return self.__keep_raw
+
     @property
     def use_cache(self):
         """Boolean to use cache or not."""
@@ -94,12 +220,18 @@ class BaseSession(object):
         return self
 
     def __exit__(self, exception_type, exception_value, traceback):
-        self.logout()
+        try:
+            self.logout()
+        finally:
+            self.close()
 
     def request(self, method, path, attempt=None, headers=None, payload=None,
-                payload_nondict=None, qstr_vals=None, service=None):
+                payload_nondict=None, qstr_vals=None, service=None, stream=False):
         """Make request.
 
+        Connection errors, timeouts and responses asking to try again
+        later are retried as the retry policy allows.
+
         Args:
             method (str): HTTP method
             path (str): request path
@@ -109,57 +241,71 @@ class BaseSession(object):
             payload_nondict (optional[str]): payload raw data
             qstr_vals (optional[dict]): query string parameters to add
             service (optional[str]): URL and path to root of api
+            stream (optional[bool]): defer downloading the body until
+                it is read. Defaults to False.
 
         Returns:
             response object
         """
-        # We may need to recall the same request.
-        # Must pop self because it is passed implicitly and cannot be passed twice.
-        _context = {k: v for k, v in locals().items() if k is not 'self'}
         allowed_attempts = 3
         attempt = 1 if not attempt else attempt
         service = service if service else self.service
-        headers = headers if headers else self.headers
         url = urljoin(service, path)
+        if method == 'GET' and qstr_vals is not None:
+            url += '?' + urlencode(qstr_vals)
+        route = route_of(path)
+        tries = 1
+        self.retry_policy.budget.deposit()
         try:
-            if method == 'POST':
-                if payload_nondict:
-                    res = requests.post(url, headers=headers, data=payload_nondict)
+            while True:
+                req_headers = headers if headers else self.headers
+                token = req_headers.get('Authtoken')
+                try:
+                    res = self._send(method, url, req_headers, payload, payload_nondict,
+                                     stream=stream, route=route)
+                except (requests.ConnectionError, requests.Timeout) as err:
+                    delay = self.retry_policy.delay(method, route, tries)
+                    if delay is None:
+                        raise
+                    if self.instrument is not None:
+                        self.instrument.on_retry(route, type(err).__name__)
+                    log.warning('{} {} failed, retrying in {:.2f}s: {}'
+                                .format(method, url, delay, err))
+                    time.sleep(delay)
+                    tries += 1
+                    continue
+                if res.status_code == 401 and token is not None:
+                    if attempt >= allowed_attempts:
+                        # Commvault probably down, raise exception.
+                        msg = ('Could not log back into Commvault after {} '
+                               'attempts. It could be down.'
+                               .format(allowed_attempts))
+                        raise_requests_error(401, msg)
+                    # Token went bad, login again. If another caller
+                    # already did, its token is used instead.
+                    log.info('Commvault token logged out. Logging back in.')
+                    res.close()
+                    if self.instrument is not None:
+                        self.instrument.on_reauth(route)
+                    token = self.auth.refresh(stale=token)
+                    if headers:
+                        headers = dict(headers, Authtoken=token)
+                    attempt += 1
                 else:
-                    res = requests.post(url, headers=headers, json=payload)
-            elif method == 'GET':
-                if qstr_vals is not None:
-                    url += '?' + urlencode(qstr_vals)
-                res = requests.get(url, headers=headers, params=payload)
-            elif method == 'PUT':
-                res = requests.put(url, headers=headers, json=payload)
-            elif method == 'DELETE':
-                res = requests.delete(url, headers=headers)
-            else:
-                raise ValueError('HTTP method {} not supported'.format(method))
-            if (res.status_code == 401
-                and headers['Authtoken'] is not None
-                and attempt <= allowed_attempts):
-                # Token went bad, login again.
-                log.info('Commvault token logged out. Logging back in.')
-                # Delay is so I don't get into recursion trouble if I can't login right away.
-                time.sleep(5)
-                self.get_token()
-                # Recall the same function, after having logged back into Commvault.
-                attempt += 1
-                _context['attempt'] = attempt
-                return self.request(**_context)
-            elif attempt > allowed_attempts:
-                # Commvault probably down, raise exception.
-                msg = ('Could not log back into Commvault after {} '
-                       'attempts. It could be down.'
-                       .format(allowed_attempts))
-                raise_requests_error(401, msg)
-            elif res.status_code != 200:
-                res.raise_for_status()
-            else:
-                log.info('request: {} {}'.format(method, url))
-                return res
+                    if res.status_code != 200:
+                        res.close()
+                        delay = self.retry_policy.delay(method, route, tries, res=res)
+                        if delay is not None:
+                            if self.instrument is not None:
+                                self.instrument.on_retry(route, res.status_code)
+                            log.warning('{} {} returned {}, retrying in {:.2f}s'
+                                        .format(method, url, res.status_code, delay))
+                            time.sleep(delay)
+                            tries += 1
+                            continue
+                        res.raise_for_status()
+                    log.info('request: {} {}'.format(method, url))
+                    return res
         except requests.HTTPError as err:
             log.error(err)
             raise
@@ -168,23 +314,143 @@ class BaseSession(object):
             log.exception(msg)
             raise PinkopyError(msg)
 
+    def _send(self, method, url, headers, payload=None, payload_nondict=None,
+              stream=False, route=None):
+        """Send a single request over the transport.
+
+        If the session has a governor, waits for its turn first. The
+        request counts as in flight until the response headers arrive.
+        If it has an instrument, the attempt is reported to it.
+
+        Args:
+            method (str): HTTP method
+            url (str): full url including query string
+            headers (dict): headers
+            payload (optional[dict]): payload as dictionary
+            payload_nondict (optional[str]): payload raw data
+            stream (optional[bool]): defer downloading the body
+            route (optional[str]): route the governor limits the request
+                under, ex. Job. Defaults to None, meaning only limits
+                over all routes apply.
+
+        Returns:
+            response object
+        """
+        if self.governor is not None:
+            waited = self.governor.acquire(route)
+            if self.instrument is not None:
+                self.instrument.on_queue_wait(route, waited)
+        try:
+            if self.instrument is None:
+                return self.__send(method, url, headers, payload, payload_nondict, stream)
+            start = time.perf_counter()
+            try:
+                res = self.__send(method, url, headers, payload, payload_nondict, stream)
+            except Exception:
+                self.instrument.on_request(route, method, None, time.perf_counter() - start,
+                                           None)
+                raise
+            if stream:
+                size = res.headers.get('Content-Length')
+                size = int(size) if size and size.isdigit() else None
+            else:
+                size = len(res.content)
+            self.instrument.on_request(route, method, res.status_code,
+                                       time.perf_counter() - start, size)
+            return res
+        finally:
+            if self.governor is not None:
+                self.governor.release(route)
+
+    def __send(self, method, url, headers, payload, payload_nondict, stream):
+        if method == 'POST':
+            if payload_nondict:
+                return self.transport.request(method, url, headers=headers,
+                                              data=payload_nondict, stream=stream,
+                                              timeout=self.timeout)
+            return self.transport.request(method, url, headers=headers, json=payload,
+                                          stream=stream, timeout=self.timeout)
+        elif method == 'GET':
+            return self.transport.request(method, url, headers=headers, params=payload,
+                                          stream=stream, timeout=self.timeout)
+        elif method == 'PUT':
+            return self.transport.request(method, url, headers=headers, json=payload,
+                                          timeout=self.timeout)
+        elif method == 'DELETE':
+            return self.transport.request(method, url, headers=headers,
+                                          timeout=self.timeout)
+        raise ValueError('HTTP method {} not supported'.format(method))
+
+    def _parse_json(self, res, path):
+        """Decode a json response body.
+
+        Args:
+            res: response object
+            path (str): request path, for instrumentation
+
+        Returns:
+            decoded body
+        """
+        return self.__decode(res, path, 'json', self.decoder.json)
+
+    def _parse_xml(self, res, path):
+        """Decode an xml response body into a dict.
+
+        Args:
+            res: response object
+            path (str): request path, for instrumentation
+
+        Returns:
+            dict: decoded body
+        """
+        return self.__decode(res, path, 'xml', self.decoder.xml)
+
+    def __decode(self, res, path, fmt, decode):
+        """Decode the raw body of res once per format.
+
+        The result is kept on the response, so parsing it again, as
+        when falling back between dialects, costs nothing.
+        """
+        decoded = res.__dict__.setdefault('_pinkopy_decoded', {})
+        if fmt in decoded:
+            return decoded[fmt]
+        if self.instrument is None:
+            data = decode(res.content)
+        else:
+            start = time.perf_counter()
+            try:
+                data = decode(res.content)
+            finally:
+                self.instrument.on_parse(route_of(path), fmt, time.perf_counter() - start)
+        decoded[fmt] = data
+        return data
+
     def get_token(self):
         """Login to Commvault and get token.
 
+        Logs in even if a token is held. Other sessions sharing this
+        session's credential manager use the new token too.
+
+        Returns:
+            str: token
+        """
+        return self.auth.refresh()
+
+    def _login(self):
+        """Post credentials to Commvault.
+
         Returns:
             str: token
-                Also, sets Authtoken in default headers.
         """
         path = 'Login'
         payload = {
             'mode': 4,
             'username': self.user,
             'password': b64encode(self.pw.encode('UTF-8')).decode('UTF-8')}
-        res = self.request('POST', path, payload=payload)
-        data = res.json()
+        res = self.request('POST', path, headers=self.base_headers, payload=payload)
+        data = self._parse_json(res, path)
         if 'token' in data and data['token']:
-            self.headers['Authtoken'] = data['token']
-            return self.headers['Authtoken']
+            return data['token']
         else:
             msg = 'Commvault user or pass incorrect'
             raise_requests_error(401, msg)
@@ -193,5 +459,11 @@ class BaseSession(object):
         """End session."""
         path = 'Logout'
         self.request('POST', path)
-        self.headers['Authtoken'] = None
+        self.auth.clear()
+        self.close()
         return None
+
+    def close(self):
+        """Close the transport if this session created it."""
+        if self.__owns_transport:
+            self.transport.close()
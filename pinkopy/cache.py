@@ -0,0 +1,475 @@
+from collections import namedtuple
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+
+from cachetools import LRUCache
+import requests
+
+from .exceptions import raise_requests_error
+
+log = logging.getLogger(__name__)
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'currsize', 'maxsize',
+                                     'store_hits', 'coalesced'])
+
+
+def approx_size(value):
+    """Approximate size of a cached value in bytes.
+
+    Measured as the length of its json encoding, which is cheap enough
+    to do once per insert and close enough to budget memory by.
+    """
+    try:
+        return len(json.dumps(value, separators=(',', ':'), default=_default))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _default(obj):
+    # records keep their payload compressed
+    raw = getattr(obj, '_raw', None)
+    if raw is not None:
+        return '.' * len(raw)
+    return repr(obj)
+
+
+class _NotFound(object):
+    """Cached 404."""
+    __slots__ = ('msg',)
+
+    def __init__(self, msg):
+        self.msg = msg
+
+    def raise_error(self):
+        raise_requests_error(404, self.msg)
+
+
+class _Call(object):
+    """Call in flight."""
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesce concurrent identical calls.
+
+    While a call for a key is running, other callers with the same key
+    wait for it and share its result, or its exception, instead of
+    making the call themselves.
+
+    Returns:
+        single flight object
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """Call func unless a call for key is already running.
+
+        Args:
+            key (hashable): identifies the call
+            func (callable): makes the call
+            *args: passed to func
+            **kwargs: passed to func
+
+        Returns:
+            tuple: (func's return value, whether it was shared)
+        """
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.__calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+        try:
+            call.value = func(*args, **kwargs)
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.event.set()
+        return call.value, False
+
+
+class _LRUCache(LRUCache):
+    """LRUCache reporting evictions."""
+    def __init__(self, maxsize, getsizeof=None, on_evict=None):
+        super(_LRUCache, self).__init__(maxsize, getsizeof=getsizeof)
+        self.on_evict = on_evict
+
+    def popitem(self):
+        key, value = super(_LRUCache, self).popitem()
+        if self.on_evict is not None:
+            self.on_evict(key)
+        return key, value
+
+
+class SessionCache(object):
+    """Cache shared by sessions.
+
+    Replaces a ttl_cache per method with one bounded cache for all
+    methods of all sessions it is given to. The least recently used
+    entries are evicted once the budget is reached, each method may
+    have its own ttl, entries may be invalidated, and hits, misses and
+    evictions are counted per method. Concurrent misses for the same
+    call are coalesced into one call whose result they all share.
+
+    Args:
+        max_entries (optional[int]): entries kept. Defaults to 1024.
+        max_bytes (optional[int]): approximate bytes kept. If set, this
+            budget is used instead of max_entries.
+        ttl (optional[int]): seconds entries live. Defaults to 1200.
+        ttls (optional[dict]): seconds entries live by method name,
+            overriding ttl
+        store (optional[SQLiteStore]): persistent store behind the
+            cache. Results of persist_methods are written to it and
+            read from it when not in memory. A stored result that has
+            expired is still returned, while it is refreshed in the
+            background, for as long as the method's ttl, and never
+            more than the store's max_stale; after that it is fetched
+            again before returning.
+        persist_methods (optional[list]): methods kept in the store.
+            Defaults to all cached methods.
+        refresh_ahead (optional[float]): fraction of its ttl after which
+            an entry that is read is refreshed in the background, while
+            callers keep getting the cached value. Defaults to None,
+            meaning entries are only fetched again once expired.
+        negative_ttl (optional[int]): seconds a 404 raised by a cached
+            method is cached for, after which it is raised again
+            without calling the method. Defaults to None, meaning 404s
+            are not cached.
+        instrument (optional[Instrument]): told of each lookup through
+            its on_cache hook. Defaults to None.
+
+    Returns:
+        cache object
+    """
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=1200, ttls=None,
+                 store=None, persist_methods=None, refresh_ahead=None,
+                 negative_ttl=None, instrument=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.refresh_ahead = refresh_ahead
+        self.ttls = dict(ttls or {})
+        self.store = store
+        self.persist_methods = persist_methods
+        self.instrument = instrument
+        if max_bytes:
+            self.__data = _LRUCache(max_bytes, getsizeof=lambda entry: approx_size(entry[1]),
+                                    on_evict=self.__evicted)
+        else:
+            self.__data = _LRUCache(max_entries, on_evict=self.__evicted)
+        self.__lock = threading.RLock()
+        self.__signatures = {}
+        self.__stats = {}
+        self.__refreshing = set()
+        self.__flight = SingleFlight()
+
+    def __len__(self):
+        return len(self.__data)
+
+    def ttl_for(self, method_name):
+        """Seconds entries of a method live.
+
+        Args:
+            method_name (str): name of method
+
+        Returns:
+            int: ttl
+        """
+        return self.ttls.get(method_name, self.ttl)
+
+    def key(self, method_name, *args, **kwargs):
+        """Key for a call.
+
+        Arguments are bound to the method's signature when it is known,
+        so get_jobs('1') and get_jobs(client_id='1') share an entry.
+
+        Args:
+            method_name (str): name of method
+            *args: positional arguments of the call
+            **kwargs: keyword arguments of the call
+
+        Returns:
+            tuple: key
+        """
+        signature = self.__signatures.get(method_name)
+        if signature is not None:
+            try:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                return (method_name,) + tuple(bound.arguments.values())
+            except TypeError:
+                pass
+        return (method_name,) + args + tuple(sorted(kwargs.items()))
+
+    def peek(self, method_name, *args, **kwargs):
+        """Look up a call without making it.
+
+        Args:
+            method_name (str): name of method
+            *args: positional arguments of the call
+            **kwargs: keyword arguments of the call
+
+        Returns:
+            tuple: (found, value). A cached 404 is raised.
+        """
+        found, value = self.get(self.key(method_name, *args, **kwargs))
+        if isinstance(value, _NotFound):
+            value.raise_error()
+        return found, value
+
+    def get(self, key):
+        """Get entry.
+
+        Args:
+            key (tuple): key from key()
+
+        Returns:
+            tuple: (found, value)
+        """
+        found, value, _ = self.__get(key)
+        return found, value
+
+    def __get(self, key):
+        with self.__lock:
+            found, value, refresh_at = self.__lookup(key)
+            self.__count(key[0], 'hits' if found else 'misses')
+            return found, value, refresh_at
+
+    def __lookup(self, key):
+        with self.__lock:
+            try:
+                expires, value, refresh_at = self.__data[key]
+            except (KeyError, TypeError):
+                return False, None, None
+            if expires <= time.time():
+                del self.__data[key]
+                return False, None, None
+            return True, value, refresh_at
+
+    def set(self, key, value, ttl=None):
+        """Set entry.
+
+        Args:
+            key (tuple): key from key()
+            value: value to cache
+            ttl (optional[int]): seconds entry lives. Defaults to the
+                ttl of the method.
+        """
+        ttl = self.ttl_for(key[0]) if ttl is None else ttl
+        now = time.time()
+        refresh_at = None
+        if self.refresh_ahead and not isinstance(value, _NotFound):
+            refresh_at = now + ttl * self.refresh_ahead
+        with self.__lock:
+            try:
+                self.__data[key] = (now + ttl, value, refresh_at)
+            except ValueError:
+                log.info('{} result too large to cache'.format(key[0]))
+            except TypeError:
+                log.info('{} arguments cannot be cached'.format(key[0]))
+
+    def persisted(self, method_name):
+        """Boolean whether a method's results are kept in the store."""
+        return self.store is not None and (self.persist_methods is None
+                                           or method_name in self.persist_methods)
+
+    def invalidate(self, method_name, *args, **kwargs):
+        """Drop the cached result of a call.
+
+        Args:
+            method_name (str): name of method
+            *args: positional arguments of the call. If neither these
+                nor kwargs are given, all entries of the method are
+                dropped.
+            **kwargs: keyword arguments of the call
+
+        Returns:
+            int: number of entries dropped
+        """
+        with self.__lock:
+            if not args and not kwargs:
+                keys = [key for key in self.__data if key[0] == method_name]
+            else:
+                keys = [self.key(method_name, *args, **kwargs)]
+            dropped = 0
+            for key in keys:
+                try:
+                    del self.__data[key]
+                    dropped += 1
+                except (KeyError, TypeError):
+                    pass
+        if self.persisted(method_name):
+            if not args and not kwargs:
+                self.store.invalidate(method_name)
+            else:
+                self.store.delete(keys[0])
+        return dropped
+
+    def clear(self):
+        """Drop all entries, including those in the store."""
+        with self.__lock:
+            self.__data.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def info(self, method_name=None):
+        """Cache statistics.
+
+        Args:
+            method_name (optional[str]): name of method. Defaults to
+                totals for all methods.
+
+        Returns:
+            CacheInfo: hits, misses, evictions, currsize, maxsize
+        """
+        with self.__lock:
+            if method_name is None:
+                stats = self.__stats.values()
+                currsize = self.__data.currsize
+            else:
+                stats = [self.__stats.get(method_name, {})]
+                currsize = len([key for key in self.__data if key[0] == method_name])
+            return CacheInfo(sum(s.get('hits', 0) for s in stats),
+                             sum(s.get('misses', 0) for s in stats),
+                             sum(s.get('evictions', 0) for s in stats),
+                             currsize,
+                             self.__data.maxsize,
+                             sum(s.get('store_hits', 0) for s in stats),
+                             sum(s.get('coalesced', 0) for s in stats))
+
+    def stats(self):
+        """Cache statistics for every method seen.
+
+        Returns:
+            dict: CacheInfo by method name
+        """
+        with self.__lock:
+            method_names = list(self.__stats)
+        return {method_name: self.info(method_name) for method_name in method_names}
+
+    def wrap(self, method_name, method):
+        """Wrap method to cache its results here.
+
+        The wrapper keeps cache_info and cache_clear, as ttl_cache
+        wrappers had.
+
+        Args:
+            method_name (str): name to cache the method under
+            method (callable): method to wrap
+
+        Returns:
+            function: wrapped method
+        """
+        try:
+            self.__signatures[method_name] = inspect.signature(method)
+        except (TypeError, ValueError):
+            pass
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            key = self.key(method_name, *args, **kwargs)
+            found, value, refresh_at = self.__get(key)
+            if found:
+                if isinstance(value, _NotFound):
+                    value.raise_error()
+                if refresh_at is not None and refresh_at <= time.time():
+                    self.__refresh(key, method, args, kwargs)
+                return value
+            if self.persisted(method_name):
+                found, value, expires = self.store.get(key, ttl=self.ttl_for(method_name))
+                if found:
+                    self.__count(method_name, 'store_hits')
+                    remaining = expires - time.time()
+                    if remaining > 0:
+                        self.set(key, value, ttl=remaining)
+                    else:
+                        self.__refresh(key, method, args, kwargs)
+                    return value
+            try:
+                hash(key)
+            except TypeError:
+                return method(*args, **kwargs)
+            value, shared = self.__flight.do(key, self.__load, key, method, args, kwargs)
+            if shared:
+                self.__count(method_name, 'coalesced')
+            if isinstance(value, _NotFound):
+                value.raise_error()
+            return value
+
+        def cache_info():
+            return self.info(method_name)
+
+        def cache_clear():
+            self.invalidate(method_name)
+
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    def __load(self, key, method, args, kwargs):
+        # a call that finished just before this one started has saved
+        found, value, _ = self.__lookup(key)
+        if found:
+            return value
+        try:
+            value = method(*args, **kwargs)
+        except requests.HTTPError as err:
+            response = getattr(err, 'response', None)
+            if (self.negative_ttl and response is not None
+                    and response.status_code == 404):
+                self.set(key, _NotFound(str(err)), ttl=self.negative_ttl)
+            raise
+        self.__save(key, value)
+        return value
+
+    def __save(self, key, value):
+        if self.persisted(key[0]):
+            self.store.set(key, value, self.ttl_for(key[0]))
+        self.set(key, value)
+
+    def __refresh(self, key, method, args, kwargs):
+        """Call method on a background thread and save the result."""
+        with self.__lock:
+            if key in self.__refreshing:
+                return
+            self.__refreshing.add(key)
+
+        def refresh():
+            try:
+                self.__save(key, method(*args, **kwargs))
+            except Exception:
+                log.exception('Could not refresh {}'.format(key[0]))
+            finally:
+                with self.__lock:
+                    self.__refreshing.discard(key)
+
+        thread = threading.Thread(target=refresh, name='pinkopy-refresh')
+        thread.daemon = True
+        thread.start()
+
+    def __count(self, method_name, stat):
+        # some counts are made outside the lock, by concurrent callers
+        with self.__lock:
+            stats = self.__stats.setdefault(method_name, {})
+            stats[stat] = stats.get(stat, 0) + 1
+        if self.instrument is not None:
+            self.instrument.on_cache(method_name, stat)
+
+    def __evicted(self, key):
+        # called with the lock held, from inside a set
+        self.__count(key[0], 'evictions')
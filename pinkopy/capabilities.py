@@ -0,0 +1,120 @@
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# body formats
+JSON = 'json'
+XML = 'xml'
+FORMATS = (JSON, XML)
+# key dialects of decoded bodies: plain keys, or the root element and
+# @-prefixed keys of older versions
+LEGACY = 'legacy'
+DIALECTS = (JSON, LEGACY)
+
+
+def unwrap(data, key, legacy_root, dialect=None):
+    """Get key from a decoded body in either dialect.
+
+    Args:
+        data (dict): decoded body
+        key (str): key holding the payload, ex. clientProperties
+        legacy_root (str): root element the legacy dialect nests it in
+        dialect (optional[str]): json or legacy. Defaults to None,
+            meaning either is accepted.
+
+    Returns:
+        payload
+
+    Raises:
+        KeyError: if the payload is not where the dialect puts it
+    """
+    if dialect != LEGACY:
+        try:
+            return data[key]
+        except KeyError:
+            if dialect == JSON:
+                raise
+    return data[legacy_root][key]
+
+
+class Capabilities(object):
+    """What a CommServe supports, learned as it is used.
+
+    Commvault versions differ in which request and response formats
+    each route works with. Rather than try every option on every call,
+    sessions try them through attempt, which remembers the option that
+    worked for a route and tries it first from then on. Sessions
+    sharing a Capabilities learn once between them.
+
+    Args:
+        known (optional[dict]): options known ahead, by (route, aspect),
+            ex. {('JobDetails', 'request'): 'xml'}
+
+    Returns:
+        capabilities object
+    """
+    def __init__(self, known=None):
+        self.__known = dict(known or {})
+        self.__lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Option known to work.
+
+        Args:
+            key (tuple): (route, aspect), ex. ('JobDetails', 'request')
+            default: returned if none is known
+
+        Returns:
+            option
+        """
+        return self.__known.get(key, default)
+
+    def learn(self, key, option):
+        """Record the option that worked.
+
+        Args:
+            key (tuple): (route, aspect)
+            option: option that worked
+        """
+        with self.__lock:
+            previous = self.__known.get(key)
+            self.__known[key] = option
+        if previous != option:
+            log.info('{} {}: using {}'.format(key[0], key[1], option))
+
+    def order(self, key, options):
+        """Options in the order to try them, the known one first."""
+        known = self.__known.get(key)
+        if known not in options:
+            return tuple(options)
+        return (known,) + tuple(option for option in options if option != known)
+
+    def attempt(self, key, options, func, errors=(KeyError,)):
+        """Call func with each option until one works.
+
+        Args:
+            key (tuple): (route, aspect)
+            options (tuple): options, in order of preference
+            func (callable): called with an option
+            errors (optional[tuple]): exceptions meaning the option does
+                not work. Others are raised at once.
+
+        Returns:
+            result of func
+        """
+        error = None
+        for option in self.order(key, options):
+            try:
+                result = func(option)
+            except errors as err:
+                error = err
+                continue
+            self.learn(key, option)
+            return result
+        raise error
+
+    def as_dict(self):
+        """Options known, by (route, aspect)."""
+        with self.__lock:
+            return dict(self.__known)
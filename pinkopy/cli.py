@@ -0,0 +1,274 @@
+"""
+Command line reports on a Commvault fleet
+
+Results are written to stdout as newline delimited json or csv while
+they arrive, one client or job at a time, so reports over large fleets
+start at once and never need to fit in memory. Failures for single
+clients or jobs are logged to stderr and make the exit status 1.
+
+    pinkopy --service http://commserve/SearchSvc/CVWebService.svc/ \\
+        --user admin jobs --last 5 --format csv --fields client_name,status
+"""
+import argparse
+import csv
+import getpass
+import itertools
+import json
+import logging
+import os
+import sys
+
+from .commvault import CommvaultSession
+from .concurrency import imap_unordered
+from .throttle import bulk
+
+log = logging.getLogger(__name__)
+
+FORMATS = ('ndjson', 'csv')
+
+
+def _plain(value):
+    """Value with xml attribute @-prefixes dropped from its keys."""
+    if isinstance(value, dict):
+        return dict((k[1:] if k.startswith('@') else k, _plain(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+def _read_ids(ids, stdin):
+    """Ids given, with - meaning those read from stdin."""
+    for job_id in ids:
+        if job_id == '-':
+            for line in stdin:
+                for word in line.split():
+                    yield word
+        else:
+            yield job_id
+
+
+class Writer(object):
+    """Write rows as newline delimited json or csv.
+
+    Args:
+        out: file object to write to
+        fmt (optional[str]): ndjson or csv. Defaults to ndjson.
+        fields (optional[list]): fields to write, in order. Defaults to
+            every field of the first row.
+
+    Returns:
+        writer object
+    """
+    def __init__(self, out, fmt='ndjson', fields=None):
+        if fmt not in FORMATS:
+            raise ValueError('fmt must be one of {}'.format(FORMATS))
+        self.out = out
+        self.fmt = fmt
+        self.fields = fields
+        self.rows = 0
+        self.__csv = None
+
+    def write(self, row):
+        """Write a row.
+
+        Args:
+            row (dict): row
+        """
+        if self.fields is None:
+            self.fields = list(row)
+        row = dict((field, row.get(field)) for field in self.fields)
+        if self.fmt == 'ndjson':
+            self.out.write(json.dumps(row, separators=(',', ':'), default=str) + '\n')
+        else:
+            if self.__csv is None:
+                self.__csv = csv.DictWriter(self.out, self.fields, lineterminator='\n')
+                self.__csv.writeheader()
+            self.__csv.writerow(dict((k, self.__cell(v)) for k, v in row.items()))
+        self.rows += 1
+
+    @staticmethod
+    def __cell(value):
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, separators=(',', ':'), default=str)
+        return '' if value is None else value
+
+    def flush(self):
+        self.out.flush()
+
+
+def _per_client(commvault, args, func):
+    """Yield (client id, rows or exception) as each client's arrive."""
+    client_ids = args.client or list(commvault.clients.get_client_index().by_id)
+    for client_id, records in imap_unordered(bulk(func), client_ids,
+                                             max_workers=args.concurrency):
+        if isinstance(records, Exception):
+            yield client_id, records
+        else:
+            yield client_id, [record.as_dict() for record in records]
+
+
+def client_rows(commvault, args):
+    """Yield (None, rows) of all clients."""
+    yield None, [client.as_dict() for client in commvault.get_clients()]
+
+
+def subclient_rows(commvault, args):
+    """Yield (client id, rows or exception) as each client's arrive."""
+    return _per_client(commvault, args, commvault.get_subclients)
+
+
+def job_rows(commvault, args):
+    """Yield (client id, rows or exception) as each client's arrive.
+
+    Jobs are swept past the cache, so only the clients in flight are
+    held however large the fleet.
+    """
+    jobs = commvault.iter_all_jobs(job_filter=args.filter, last=args.last,
+                                   concurrency=args.concurrency, client_ids=args.client)
+    # each client's jobs, or its error, arrive together
+    for client_id, group in itertools.groupby(jobs, key=lambda pair: pair[0]):
+        rows = [job for _, job in group]
+        if rows and isinstance(rows[0], Exception):
+            yield client_id, rows[0]
+        else:
+            yield client_id, [job.as_dict() for job in rows]
+
+
+def job_detail_rows(commvault, args):
+    """Yield (job id, rows or exception) as each job's details arrive."""
+    job_ids = _read_ids(args.job_id, args.stdin)
+    for job_id, details in commvault.get_job_details_many(job_ids, max_workers=args.concurrency):
+        if isinstance(details, Exception):
+            yield job_id, details
+        else:
+            row = details.as_dict()
+            row['vm_status'] = _plain(row['vm_status'])
+            yield job_id, [row]
+
+
+def vmstatus_rows(commvault, args):
+    """Yield (job id, rows or exception), a row per vm of each job."""
+    job_ids = _read_ids(args.job_id, args.stdin)
+    for job_id, details in commvault.get_job_details_many(job_ids, max_workers=args.concurrency):
+        if isinstance(details, Exception):
+            yield job_id, details
+            continue
+        try:
+            vms = commvault.get_job_vmstatus(details)
+        except Exception as err:
+            yield job_id, err
+            continue
+        rows = []
+        for vm in vms:
+            row = {'job_id': str(job_id)}
+            row.update(_plain(vm))
+            rows.append(row)
+        yield job_id, rows
+
+
+COMMANDS = {
+    'clients': client_rows,
+    'subclients': subclient_rows,
+    'jobs': job_rows,
+    'job-details': job_detail_rows,
+    'vmstatus': vmstatus_rows
+}
+
+
+def _options():
+    """Parser of the options accepted before or after the command."""
+    # defaults are set on the main parser only, so a subcommand does not
+    # overwrite options given before it. Parents share their actions, so
+    # the main parser and the subcommands each need their own.
+    p = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    p.add_argument('--service', help='url of the api root. Defaults to $PINKOPY_SERVICE.')
+    p.add_argument('--user', help='Defaults to $PINKOPY_USER.')
+    p.add_argument('--format', choices=FORMATS, help='Defaults to ndjson.')
+    p.add_argument('--fields', type=lambda s: [f.strip() for f in s.split(',') if f.strip()],
+                   help='comma separated fields to write, ex. job_id,status')
+    p.add_argument('--concurrency', type=int,
+                   help='requests in flight at once. Defaults to 8.')
+    p.add_argument('--rate-limit', type=float, help='requests per second')
+    p.add_argument('--cache-path', help='sqlite file keeping results between runs')
+    p.add_argument('--no-cache', action='store_true', help='do not cache results')
+    p.add_argument('--retries', type=int, help='retries per request. Defaults to 2.')
+    p.add_argument('-v', '--verbose', action='count', help='log more, repeatable')
+    return p
+
+
+def parser():
+    """Argument parser for the pinkopy command."""
+    p = argparse.ArgumentParser(prog='pinkopy', description=__doc__.strip().splitlines()[0],
+                                parents=[_options()])
+    options = _options()
+    p.set_defaults(service=os.environ.get('PINKOPY_SERVICE'),
+                   user=os.environ.get('PINKOPY_USER'), format='ndjson', fields=None,
+                   concurrency=8, rate_limit=None, cache_path=None, no_cache=False,
+                   retries=2, verbose=0)
+    sub = p.add_subparsers(dest='command', metavar='command')
+    sub.required = True
+    sub.add_parser('clients', help='clients', parents=[options])
+    for name, help_text in (('subclients', 'subclients of clients'),
+                            ('jobs', 'jobs of clients')):
+        command = sub.add_parser(name, help=help_text, parents=[options])
+        command.add_argument('--client', action='append',
+                             help='client id, repeatable. Defaults to every client.')
+        if name == 'jobs':
+            command.add_argument('--filter', help='job filter, ex. backup, restore')
+            command.add_argument('--last', type=int,
+                                 help='this many most recent jobs per client')
+    for name, help_text in (('job-details', 'details of jobs'),
+                            ('vmstatus', 'status of each vm of jobs')):
+        command = sub.add_parser(name, help=help_text, parents=[options])
+        command.add_argument('job_id', nargs='+', help='job id, or - to read ids from stdin')
+    return p
+
+
+def main(argv=None, stdout=None, stdin=None):
+    """Run the pinkopy command.
+
+    The password is read from $PINKOPY_PASSWORD, or asked for.
+
+    Args:
+        argv (optional[list]): arguments. Defaults to sys.argv[1:].
+        stdout (optional): file to write to. Defaults to sys.stdout.
+        stdin (optional): file ids are read from. Defaults to sys.stdin.
+
+    Returns:
+        int: exit status
+    """
+    args = parser().parse_args(argv)
+    args.stdin = stdin or sys.stdin
+    logging.basicConfig(stream=sys.stderr, format='%(levelname)s %(name)s: %(message)s',
+                        level=max(logging.DEBUG, logging.WARNING - 10 * args.verbose))
+    if not args.service or not args.user:
+        log.error('--service and --user, or $PINKOPY_SERVICE and $PINKOPY_USER, are required')
+        return 2
+    pw = os.environ.get('PINKOPY_PASSWORD')
+    if pw is None:
+        pw = getpass.getpass('Password for {}: '.format(args.user))
+    writer = Writer(stdout or sys.stdout, fmt=args.format, fields=args.fields)
+    failures = 0
+    try:
+        with CommvaultSession(service=args.service, user=args.user, pw=pw,
+                              use_cache=not args.no_cache, cache_path=args.cache_path,
+                              rate_limit=args.rate_limit, retries=args.retries,
+                              use_records=True) as commvault:
+            for item, rows in COMMANDS[args.command](commvault, args):
+                if isinstance(rows, Exception):
+                    log.error('{} {}: {}'.format(args.command, item, rows))
+                    failures += 1
+                    continue
+                for row in rows:
+                    writer.write(row)
+                # hand each client's or job's rows on as they arrive
+                writer.flush()
+    except KeyboardInterrupt:
+        return 130
+    except BrokenPipeError:
+        # the reader went away, as with head. Point stdout at devnull so
+        # the flush at exit does not fail again.
+        if stdout is None:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    return 1 if failures else 0
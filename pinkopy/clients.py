@@ -1,20 +1,136 @@
 import logging
-import xmltodict
+import threading
+
+from xml.parsers.expat import ExpatError
 
 from .base_session import BaseSession
+from .capabilities import DIALECTS, FORMATS, XML, unwrap
 from .exceptions import raise_requests_error
+from .records import Client
 
 log = logging.getLogger(__name__)
 
 
+def parse_client_properties(data, client_id, dialect=None):
+    """Parse client properties response.
+
+    Args:
+        data (dict): decoded response
+        client_id (str): client id
+        dialect (optional[str]): json or legacy. Defaults to either.
+
+    Returns:
+        dict: client properties
+    """
+    # support previous Commvault api versions
+    props = unwrap(data, 'clientProperties', 'App_GetClientPropertiesResponse', dialect)
+    if not props:
+        msg = 'No client properties found for client {}'.format(client_id)
+        raise_requests_error(404, msg)
+    return props
+
+
+def parse_clients(data, dialect=None):
+    """Parse client list response.
+
+    Args:
+        data (dict): decoded response
+        dialect (optional[str]): json or legacy. Defaults to either.
+
+    Returns:
+        list: clients
+    """
+    # support previous Commvault api versions
+    clients = unwrap(data, 'clientProperties', 'App_GetClientPropertiesResponse', dialect)
+    if not clients:
+        msg = 'No clients found in Commvault'
+        raise_requests_error(404, msg)
+    return clients
+
+
+class ClientIndex(object):
+    """Client inventory keyed by id, name and hostname.
+
+    Built once from a client list so lookups do not scan the list.
+
+    Args:
+        clients (list): clients as returned by get_clients, raw or
+            as records
+
+    Returns:
+        index object
+    """
+    def __init__(self, clients):
+        self.clients = clients
+        self.by_id = {}
+        self.by_name = {}
+        self.by_hostname = {}
+        for client in clients:
+            record = Client.coerce(client)
+            self.by_id.setdefault(record.client_id, client)
+            if record.name:
+                self.by_name.setdefault(record.name, client)
+            if record.hostname:
+                self.by_hostname.setdefault(record.hostname.lower(), client)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def get(self, client_id):
+        """Get client by id.
+
+        Args:
+            client_id (str): client id
+
+        Returns:
+            dict: client or None
+        """
+        return self.by_id.get(str(client_id))
+
+    def get_by_name(self, name):
+        """Get client by client name, then by hostname.
+
+        Args:
+            name (str): client name or hostname
+
+        Returns:
+            dict: client or None
+        """
+        client = self.by_name.get(name)
+        if client is None:
+            client = self.by_hostname.get(name.lower())
+        return client
+
+
 class ClientSession(BaseSession):
     """Methods for clients."""
     def __init__(self, cache_methods=None, *args, **kwargs):
         cache_methods = cache_methods or ['get_client',
                                           'get_client_properties',
                                           'get_clients']
+        self.__index = None
+        self.__index_lock = threading.Lock()
         super(ClientSession, self).__init__(cache_methods=cache_methods, *args, **kwargs)
 
+    def get_client_index(self):
+        """Get client index.
+
+        The index is rebuilt only when get_clients returns a new list,
+        so it lives and expires with the cached client list.
+
+        Returns:
+            ClientIndex: clients keyed by id, name and hostname
+        """
+        clients = self.get_clients()
+        index = self.__index
+        if index is None or index.clients is not clients:
+            with self.__index_lock:
+                index = self.__index
+                if index is None or index.clients is not clients:
+                    index = ClientIndex(clients)
+                    self.__index = index
+        return index
+
     def get_client(self, client_id):
         """Get client.
 
@@ -27,17 +143,26 @@ class ClientSession(BaseSession):
         if isinstance(client_id, int):
             log.warning('deprecated: client_id support for int for backward compatibility only')
             client_id = str(client_id)
-        try:
-            try:
-                return [c for c in self.get_clients()
-                        if str(c['client']['clientEntity']['clientId']) == client_id][0]
-            except KeyError:
-                # support previous Commvault api versions
-                return [c for c in self.get_clients()
-                        if str(c['client']['clientEntity']['@clientId']) == client_id][0]
-        except IndexError:
+        client = self.get_client_index().get(client_id)
+        if client is None:
             msg = 'Client {} not in client list.'.format(client_id)
             raise_requests_error(404, msg)
+        return client
+
+    def get_client_by_name(self, name):
+        """Get client by client name or hostname.
+
+        Args:
+            name (str): client name or hostname
+
+        Returns:
+            dict: client
+        """
+        client = self.get_client_index().get_by_name(name)
+        if client is None:
+            msg = 'Client {} not in client list.'.format(name)
+            raise_requests_error(404, msg)
+        return client
 
     def get_client_properties(self, client_id):
         """Get client properties.
@@ -57,22 +182,24 @@ class ClientSession(BaseSession):
             client_id = str(client_id)
         path = 'Client/{}'.format(client_id)
         res = self.request('GET', path)
+
         # If you are using a < v10 SP12 this call will respond in
-        # xml even though we are requesting json.
-        if not res.json():
-            # turn wrong xml into json
-            data = xmltodict.parse(res.text)
-        else:
-            data = res.json()
-        try:
-            props = data['clientProperties']
-        except KeyError:
-            # support previous Commvault api versions
-            props = data['App_GetClientPropertiesResponse']['clientProperties']
-        if not props:
-            msg = 'No client properties found for client {}'.format(client_id)
-            raise_requests_error(404, msg)
-        return props
+        # xml even though we are requesting json. Once seen, xml is
+        # decoded first.
+        def decode(fmt):
+            if fmt == XML:
+                # turn wrong xml into json
+                return self._parse_xml(res, path)
+            data = self._parse_json(res, path)
+            if not data:
+                raise ValueError('Empty json body')
+            return data
+
+        data = self.capabilities.attempt(('Client/{id}', 'response'), FORMATS, decode,
+                                         errors=(ValueError, ExpatError))
+        return self.capabilities.attempt(
+            ('Client/{id}', 'dialect'), DIALECTS,
+            lambda dialect: parse_client_properties(data, client_id, dialect))
 
     def get_clients(self):
         """Get clients.
@@ -82,13 +209,9 @@ class ClientSession(BaseSession):
         """
         path = 'Client'
         res = self.request('GET', path)
-        data = res.json()
-        try:
-            clients = data['clientProperties']
-        except KeyError:
-            # support previous Commvault api versions
-            clients = data['App_GetClientPropertiesResponse']['clientProperties']
-        if not clients:
-            msg = 'No clients found in Commvault'
-            raise_requests_error(404, msg)
+        data = self._parse_json(res, path)
+        clients = self.capabilities.attempt((path, 'dialect'), DIALECTS,
+                                            lambda dialect: parse_clients(data, dialect))
+        if self.use_records:
+            clients = [Client.from_raw(client, keep_raw=self.keep_raw) for client in clients]
         return clients
@@ -1,51 +1,183 @@
 import logging
+import threading
 
 from .base_session import BaseSession
 from .clients import ClientSession
+from .concurrency import imap_unordered
 from .jobs import JobSession
 from .subclients import SubclientSession
+from .throttle import bulk
 
 log = logging.getLogger(__name__)
 
+SUBSESSIONS = {
+    'clients': ClientSession,
+    'subclients': SubclientSession,
+    'jobs': JobSession
+}
+# shim for backwards compatibility: method name -> subsession
+SHIMS = {
+    'get_client': 'clients',
+    'get_client_by_name': 'clients',
+    'get_client_properties': 'clients',
+    'get_clients': 'clients',
+    'get_subclients': 'subclients',
+    'get_job_details': 'jobs',
+    'get_job_details_many': 'jobs',
+    'get_job_vmstatus': 'jobs',
+    'get_jobs': 'jobs',
+    'iter_jobs': 'jobs',
+    'get_subclient_jobs': 'jobs'
+}
+
 
 class CommvaultSession(BaseSession):
     """Session wrapper for Commvault.
 
     See the BaseSession for greater detail. This class will provide the
     other sessions. It will also provide a shim for how it was used in
-    the past.
+    the past. The subsessions share this session's transport,
+    credential manager, cache, governor and retry policy, so all of
+    them draw from one connection pool, log in once, cache within one
+    budget and keep to one set of request and retry limits.
+
+    Subsessions are created on first use, so a session that only lists
+    jobs never builds the others.
     """
     def __init__(self, *args, **kwargs):
         """Initialize route classes and shim."""
         super(CommvaultSession, self).__init__(*args, **kwargs)
 
-        self.clients = ClientSession(token=self.headers['Authtoken'], *args, **kwargs)
-        self.subclients = SubclientSession(token=self.headers['Authtoken'], *args, **kwargs)
-        self.jobs = JobSession(token=self.headers['Authtoken'], *args, **kwargs)
+        kwargs['transport'] = self.transport
+        kwargs['auth'] = self.auth
+        kwargs['cache'] = self.cache
+        kwargs['governor'] = self.governor
+        kwargs['retry_policy'] = self.retry_policy
+        kwargs['instrument'] = self.instrument
+        kwargs['capabilities'] = self.capabilities
+        kwargs['decoder'] = self.decoder
+        self.__subsession_args = (args, kwargs)
+        self.__subsession_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        """Create subsessions and shims on first access."""
+        # only called for attributes not set yet; before __init__ has
+        # finished there is nothing to create them from
+        if '_CommvaultSession__subsession_args' not in self.__dict__:
+            raise AttributeError(name)
+        if name in SUBSESSIONS:
+            return self.__subsession(name)
+        if name in SHIMS:
+            method = getattr(self.__subsession(SHIMS[name]), name)
+            self.__dict__[name] = method
+            return method
+        raise AttributeError("'{}' object has no attribute '{}'"
+                             .format(self.__class__.__name__, name))
+
+    def __subsession(self, name):
+        with self.__subsession_lock:
+            session = self.__dict__.get(name)
+            if session is None:
+                args, kwargs = self.__subsession_args
+                session = SUBSESSIONS[name](*args, **kwargs)
+                self.__dict__[name] = session
+        return session
+
+    @property
+    def subsessions(self):
+        """Subsessions, created if not yet used."""
+        return [self.clients, self.subclients, self.jobs]
+
+    def iter_all_jobs(self, job_filter=None, last=None, concurrency=8, client_ids=None):
+        """Get jobs for every client, streaming them as they arrive.
+
+        Per-client job requests are spread over a pool of threads. Only
+        a few clients are requested ahead of the consumer, so memory
+        stays bounded however large the fleet. A failure for one client
+        is yielded in place of its jobs and the sweep carries on.
+        Requests are queued as bulk, behind interactive ones. Jobs are
+        fetched past the cache, so nothing from the sweep stays in
+        memory after it is yielded. Closing the generator cancels the
+        requests not yet started.
+
+        Args:
+            job_filter (optional[str]): job filter, ex. backup, restore
+            last (optional[int]): get this many most recent jobs per client
+            concurrency (optional[int]): concurrent requests. Defaults to 8.
+            client_ids (optional[iterable]): clients to sweep. Defaults
+                to every client.
+
+        Yields:
+            tuple: (client_id, job), or (client_id, exception) if the
+                client's jobs could not be fetched
+        """
+        if client_ids is None:
+            client_ids = list(self.clients.get_client_index().by_id)
+
+        # caching every client's jobs would pin them for the whole sweep
+        uncached = getattr(self.jobs.get_jobs, '__wrapped__', self.jobs.get_jobs)
+
+        def get_jobs(client_id):
+            return uncached(client_id, job_filter=job_filter, last=last)
+
+        results = imap_unordered(bulk(get_jobs), client_ids, max_workers=concurrency)
+        try:
+            for client_id, jobs in results:
+                if isinstance(jobs, Exception):
+                    log.error('Could not get jobs for client {}: {}'.format(client_id, jobs))
+                    yield client_id, jobs
+                    continue
+                for job in jobs:
+                    yield client_id, job
+        finally:
+            # closing the sweep cancels the requests not yet started
+            results.close()
+
+    def warm(self, client_ids=None, job_filter=None, concurrency=8):
+        """Fill the caches ahead of use.
 
-        self.subsessions = [self.clients,
-                            self.subclients,
-                            self.jobs]
+        Fetches the client list, then subclients and jobs of each client
+        concurrently, through the cached methods so the results are
+        kept. Intended for startup, so later calls are served from the
+        cache.
 
-        # shim for backwards compatibility
-        self.get_client = self.clients.get_client
-        self.get_client_properties = self.clients.get_client_properties
-        self.get_clients = self.clients.get_clients
+        Args:
+            client_ids (optional[iterable]): clients to warm. Defaults
+                to every client.
+            job_filter (optional[str]): job filter to warm get_jobs with
+            concurrency (optional[int]): concurrent requests. Defaults to 8.
 
-        self.get_subclients = self.subclients.get_subclients
+        Returns:
+            dict: exceptions by (method name, client id) for the calls
+                that failed
+        """
+        errors = {}
+        try:
+            index = self.clients.get_client_index()
+        except Exception as err:
+            errors[('get_clients', None)] = err
+            return errors
+        if client_ids is None:
+            client_ids = list(index.by_id)
+        calls = {
+            'get_subclients': self.subclients.get_subclients,
+            'get_jobs': lambda client_id: self.jobs.get_jobs(client_id, job_filter=job_filter)
+        }
+        tasks = ((method_name, client_id) for client_id in client_ids for method_name in calls)
 
-        self.get_job_details = self.jobs.get_job_details
-        self.get_job_vmstatus = self.jobs.get_job_vmstatus
-        self.get_jobs = self.jobs.get_jobs
-        self.get_subclient_jobs = self.jobs.get_subclient_jobs
+        def call(task):
+            method_name, client_id = task
+            return calls[method_name](client_id)
 
-        self.__cache_methods = list({m for obj in self.subsessions for m in obj.cache_methods})
+        for task, result in imap_unordered(bulk(call), tasks, max_workers=concurrency):
+            if isinstance(result, Exception):
+                errors[task] = result
+        return errors
 
     def logout(self):
         """End session for all subsessions."""
         path = 'Logout'
         self.request('POST', path)
-        self.headers['Authtoken'] = None
-        for session in self.subsessions:
-            session.headers['Authtoken'] = None
+        self.auth.clear()
+        self.close()
         return None
@@ -0,0 +1,52 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def imap_unordered(func, items, max_workers=8, max_pending=None):
+    """Call func on each item in a thread pool, yielding as calls finish.
+
+    No more than max_pending calls are submitted ahead of the consumer,
+    so items are pulled lazily and results do not pile up when the
+    consumer is slower than the pool. Closing the generator cancels
+    calls not yet started.
+
+    Args:
+        func (callable): called with one item
+        items (iterable): items to call func on
+        max_workers (optional[int]): threads in pool. Defaults to 8.
+        max_pending (optional[int]): calls submitted but not yet
+            yielded. Defaults to twice max_workers.
+
+    Yields:
+        tuple: (item, result), or (item, exception) if func raised
+    """
+    max_pending = max_pending or max_workers * 2
+    items = iter(items)
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                else:
+                    pending[executor.submit(func, item)] = item
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as err:
+                    result = err
+                yield item, result
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
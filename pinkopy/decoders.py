@@ -0,0 +1,165 @@
+"""
+Decoding of response bodies
+
+The Decoder decodes json with the fastest library installed: orjson,
+then ujson, then the standard library. Xml, which older Commvault
+versions answer in, is decoded to the same dicts xmltodict makes,
+either by xmltodict or with ElementTree, and can be streamed one
+element at a time.
+"""
+from importlib.util import find_spec
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+JSON_LIBRARIES = ('orjson', 'ujson', 'json')
+XML_LIBRARIES = ('xmltodict', 'etree')
+
+
+def _json_loads(library):
+    if library == 'json':
+        return json.loads
+    module = __import__(library)
+    return module.loads
+
+
+def available_json_library():
+    """Name of the fastest json library installed."""
+    for library in JSON_LIBRARIES:
+        # found without importing, which is left to first use
+        if library == 'json' or find_spec(library) is not None:
+            return library
+
+
+def element_to_dict(element):
+    """Convert an ElementTree element to what xmltodict makes of it.
+
+    Attributes become @-prefixed keys, children become keys by tag,
+    lists if repeated, and text becomes #text, or the value itself if
+    the element has nothing else.
+
+    Args:
+        element: ElementTree element
+
+    Returns:
+        dict, str or None
+    """
+    result = dict(('@' + k, v) for k, v in element.attrib.items())
+    for child in element:
+        value = element_to_dict(child)
+        if child.tag in result:
+            existing = result[child.tag]
+            if isinstance(existing, list):
+                existing.append(value)
+            else:
+                result[child.tag] = [existing, value]
+        else:
+            result[child.tag] = value
+    text = element.text.strip() if element.text else ''
+    if text:
+        if not result:
+            return text
+        result['#text'] = text
+    return result or None
+
+
+def iter_xml_items(chunks, paths):
+    """Decode elements of an xml document one at a time.
+
+    Elements at one of the given tag paths, for example
+    ('JobManager_JobListResponse', 'jobs'), are converted as
+    element_to_dict does and yielded as soon as they close, then
+    dropped, so the whole document is never held at once.
+
+    Args:
+        chunks (iterable): bytes chunks of the document
+        paths (list): tag paths, as tuples, of the elements to yield
+
+    Yields:
+        dict: elements at the paths
+    """
+    from xml.etree.ElementTree import XMLPullParser
+    paths = set(tuple(path) for path in paths)
+    parser = XMLPullParser(events=('start', 'end'))
+    stack = []
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                stack.append(element.tag)
+                continue
+            if tuple(stack) in paths:
+                yield element_to_dict(element)
+                element.clear()
+            stack.pop()
+    parser.close()
+
+
+class Decoder(object):
+    """Decode response bodies.
+
+    The json library is imported when first used. Importing orjson
+    takes longer than decoding a small body with the standard library,
+    so short-lived processes making few requests may prefer json.
+
+    Args:
+        json_library (optional[str]): orjson, ujson or json. Defaults
+            to the fastest installed.
+        xml_library (optional[str]): xmltodict, or etree to decode with
+            ElementTree's C parser. Defaults to xmltodict.
+
+    Returns:
+        decoder object
+    """
+    def __init__(self, json_library=None, xml_library='xmltodict'):
+        if xml_library not in XML_LIBRARIES:
+            raise ValueError('xml_library must be one of {}'.format(XML_LIBRARIES))
+        self.json_library = json_library or available_json_library()
+        self.xml_library = xml_library
+        self.__loads = None
+
+    def json(self, content):
+        """Decode a json body.
+
+        Args:
+            content (bytes or str): body
+
+        Returns:
+            decoded body
+
+        Raises:
+            ValueError: if the body is not json
+        """
+        if self.__loads is None:
+            self.__loads = _json_loads(self.json_library)
+        return self.__loads(content)
+
+    def xml(self, content):
+        """Decode an xml body to a dict.
+
+        Args:
+            content (bytes or str): body
+
+        Returns:
+            dict: decoded body
+
+        Raises:
+            ValueError or ExpatError: if the body is not xml
+        """
+        if self.xml_library == 'etree':
+            from xml.etree.ElementTree import ParseError, fromstring
+            try:
+                root = fromstring(content)
+            except ParseError as err:
+                raise ValueError('Invalid xml: {}'.format(err))
+            return {root.tag: element_to_dict(root)}
+        import xmltodict
+        return xmltodict.parse(content)
+
+    def iter_xml_items(self, chunks, paths):
+        """Decode elements of an xml document one at a time.
+
+        See iter_xml_items.
+        """
+        return iter_xml_items(chunks, paths)
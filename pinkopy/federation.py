@@ -0,0 +1,246 @@
+"""
+Queries across several CommServes
+
+A FederatedSession holds one CommvaultSession per CommServe, each with
+its own credentials, token and limits, and asks all of them at once.
+Results are merged, each tagged with the CommServe it came from.
+"""
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import threading
+import time
+
+from .commvault import CommvaultSession
+from .exceptions import PinkopyError
+
+log = logging.getLogger(__name__)
+
+# a result and the name of the CommServe it came from
+FederatedRecord = namedtuple('FederatedRecord', ['commserve', 'record'])
+# merged results of a federated query: records is a list of
+# FederatedRecord, in the order the CommServes were given, and errors
+# holds exceptions by CommServe name for CommServes that failed or
+# timed out as a whole, and by (name, id) for single clients or jobs
+FederatedResult = namedtuple('FederatedResult', ['records', 'errors'])
+
+
+def _until(stop, items):
+    """Yield from a generator until stop is set, then close it."""
+    try:
+        for item in items:
+            if stop.is_set():
+                break
+            yield item
+    finally:
+        items.close()
+
+
+class FederatedSession(object):
+    """Session across several CommServes.
+
+    Each query runs on every CommServe at once, one thread each. A
+    CommServe that fails or takes longer than its timeout is reported
+    in the errors of the result, and the others are returned without
+    waiting for it. A timed out sweep of jobs or job details makes no
+    further requests; those already in flight carry on in the
+    background until they finish or reach the session's read timeout.
+
+    Args:
+        sessions (dict): CommvaultSession by CommServe name
+        timeout (optional[float]): seconds to wait for each CommServe
+            per query. Defaults to None, meaning no limit.
+        timeouts (optional[dict]): timeouts by CommServe name, for
+            those differing from timeout
+
+    Returns:
+        session object
+    """
+    def __init__(self, sessions, timeout=None, timeouts=None):
+        self.sessions = dict(sessions)
+        self.timeout = timeout
+        self.timeouts = dict(timeouts or {})
+        # CommServes that could not be opened, by name
+        self.unavailable = {}
+
+    @classmethod
+    def from_configs(cls, configs, timeout=None, timeouts=None, **kwargs):
+        """Open a session to each CommServe, concurrently.
+
+        A CommServe that cannot be logged in to within its timeout is
+        left out and kept in unavailable, and reported in the errors of
+        every query.
+
+        Args:
+            configs (dict): CommvaultSession keyword arguments by
+                CommServe name, ex. {'east': {'service': ..., 'user':
+                ..., 'pw': ...}}
+            timeout (optional[float]): as for FederatedSession
+            timeouts (optional[dict]): as for FederatedSession
+            **kwargs: passed to every CommvaultSession, under configs
+
+        Returns:
+            session object
+        """
+        federated = cls({}, timeout=timeout, timeouts=timeouts)
+
+        def open_session(name, stop):
+            config = dict(kwargs)
+            config.update(configs[name])
+            return CommvaultSession(**config)
+
+        results, errors = federated._call(open_session, list(configs))
+        federated.sessions = dict((name, results[name]) for name in configs if name in results)
+        federated.unavailable = errors
+        return federated
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.logout()
+
+    def _timeout(self, name):
+        return self.timeouts.get(name, self.timeout)
+
+    def _call(self, func, names):
+        """Call func(name, stop) for each name at once, within its timeout.
+
+        stop is a threading.Event set once the name's call is given up
+        on, which long running calls should check between requests.
+
+        Returns:
+            tuple: (results by name, exceptions by name)
+        """
+        results, errors = {}, {}
+        if not names:
+            return results, errors
+        executor = ThreadPoolExecutor(max_workers=len(names))
+        start = time.monotonic()
+        stops = dict((name, threading.Event()) for name in names)
+        pending = {executor.submit(func, name, stops[name]): name for name in names}
+        deadlines = {}
+        for future, name in pending.items():
+            if self._timeout(name) is not None:
+                deadlines[future] = start + self._timeout(name)
+        try:
+            while pending:
+                wait_for = None
+                waiting = [deadlines[future] for future in pending if future in deadlines]
+                if waiting:
+                    wait_for = max(0, min(waiting) - time.monotonic())
+                done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as err:
+                        log.error('CommServe {} failed: {}'.format(name, err))
+                        errors[name] = err
+                now = time.monotonic()
+                for future in [f for f in pending if deadlines.get(f, now + 1) <= now]:
+                    name = pending.pop(future)
+                    future.cancel()
+                    stops[name].set()
+                    msg = 'CommServe {} timed out after {} seconds'.format(
+                        name, self._timeout(name))
+                    log.error(msg)
+                    errors[name] = PinkopyError(msg)
+        finally:
+            for name in pending.values():
+                stops[name].set()
+            executor.shutdown(wait=False)
+        return results, errors
+
+    def map(self, func):
+        """Call func with each CommServe's session at once.
+
+        Args:
+            func (callable): called with a CommvaultSession
+
+        Returns:
+            tuple: (results by CommServe name, exceptions by CommServe
+                name)
+        """
+        return self._each(lambda name, session, stop: func(session))
+
+    def _each(self, func):
+        """Call func(name, session, stop) for each CommServe at once."""
+        results, errors = self._call(lambda name, stop: func(name, self.sessions[name], stop),
+                                     list(self.sessions))
+        errors.update(self.unavailable)
+        return results, errors
+
+    def _merge(self, results, errors):
+        """Tag and merge per CommServe lists of (id, result) pairs."""
+        records = []
+        for name in self.sessions:
+            for item, value in results.get(name, ()):
+                if isinstance(value, Exception):
+                    errors[(name, item)] = value
+                else:
+                    records.append(FederatedRecord(name, value))
+        return FederatedResult(records, errors)
+
+    def get_clients(self):
+        """Get clients of every CommServe.
+
+        Returns:
+            FederatedResult: clients
+        """
+        results, errors = self.map(lambda session: session.get_clients())
+        records = [FederatedRecord(name, client)
+                   for name in self.sessions for client in results.get(name, ())]
+        return FederatedResult(records, errors)
+
+    def get_jobs(self, client_ids=None, job_filter=None, last=None, concurrency=8):
+        """Get jobs of clients on every CommServe.
+
+        Args:
+            client_ids (optional[dict]): client ids by CommServe name.
+                Defaults to every client of every CommServe.
+            job_filter (optional[str]): job filter, ex. backup, restore
+            last (optional[int]): get this many most recent jobs per client
+            concurrency (optional[int]): concurrent requests per
+                CommServe. Defaults to 8.
+
+        Returns:
+            FederatedResult: jobs, with failed clients in errors by
+                (name, client id)
+        """
+        def get_jobs(name, session, stop):
+            ids = None if client_ids is None else client_ids.get(name, ())
+            return list(_until(stop, session.iter_all_jobs(job_filter=job_filter, last=last,
+                                                           concurrency=concurrency,
+                                                           client_ids=ids)))
+
+        return self._merge(*self._each(get_jobs))
+
+    def get_job_details(self, job_ids, concurrency=8):
+        """Get details about jobs on every CommServe.
+
+        Args:
+            job_ids (dict): job ids by CommServe name
+            concurrency (optional[int]): concurrent requests per
+                CommServe. Defaults to 8.
+
+        Returns:
+            FederatedResult: job details, in the order of job_ids, with
+                failed jobs in errors by (name, job id)
+        """
+        def get_job_details(name, session, stop):
+            ids = list(job_ids.get(name, ()))
+            details = dict(_until(stop, session.get_job_details_many(ids,
+                                                                     max_workers=concurrency)))
+            if stop.is_set():
+                return []
+            return [(job_id, details[job_id]) for job_id in ids]
+
+        return self._merge(*self._each(get_job_details))
+
+    def logout(self):
+        """End the session with every CommServe."""
+        _, errors = self.map(lambda session: session.logout())
+        for name, err in errors.items():
+            if name not in self.unavailable:
+                log.warning('Could not log out of CommServe {}: {}'.format(name, err))
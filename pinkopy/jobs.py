@@ -1,11 +1,173 @@
+import heapq
 import logging
 
 from .base_session import BaseSession
+from .capabilities import DIALECTS, FORMATS, JSON, LEGACY, XML, unwrap
+from .concurrency import imap_unordered
 from .exceptions import PinkopyError, raise_requests_error
+from .records import JobDetail, JobSummary
+from .streaming import CHUNK_SIZE, iter_json_items, iter_text
+from .throttle import bulk
 
 log = logging.getLogger(__name__)
 
 
+def parse_jobs(data, last=None, dialect=None):
+    """Parse job list response.
+
+    Args:
+        data (dict): decoded response
+        last (optional[int]): keep this many jobs from the end
+        dialect (optional[str]): json or legacy. Defaults to either.
+
+    Returns:
+        list: jobs
+    """
+    jobs = unwrap(data, 'jobs', 'JobManager_JobListResponse', dialect)
+    if dialect == JSON:
+        jobs = sorted(jobs, key=lambda job: job['jobSummary']['subclient']['subclientName'])
+    elif dialect == LEGACY:
+        jobs = sorted(jobs, key=lambda job: job['jobSummary']['subclient']['@subclientName'])
+    else:
+        jobs = sorted(jobs, key=_subclient_name)
+    if last:
+        jobs = jobs[-last:]
+    return jobs
+
+
+def _subclient_name(job):
+    subclient = job['jobSummary']['subclient']
+    try:
+        return subclient['subclientName']
+    except KeyError:
+        return subclient['@subclientName']
+
+
+def last_jobs(jobs, last):
+    """Select the jobs parse_jobs would keep, without a full sort.
+
+    Only the selected jobs are held, in a heap, so jobs may come from
+    a stream that is never materialised.
+
+    Args:
+        jobs (iterable): jobs
+        last (int): this many jobs from the end of the sorted list
+
+    Returns:
+        list: jobs
+    """
+    heap = []
+    for seq, job in enumerate(jobs):
+        # seq keeps the sort stable, as sorted() in parse_jobs is
+        entry = (_subclient_name(job), seq, job)
+        if len(heap) < last:
+            heapq.heappush(heap, entry)
+        else:
+            heapq.heappushpop(heap, entry)
+    return [job for _, _, job in sorted(heap, key=lambda entry: entry[:2])]
+
+
+def parse_job_details(data, job_id):
+    """Parse job details response.
+
+    Raises KeyError if the response holds no job at all, which is how
+    Commvault answers when the json request on this route is broken.
+    The caller should then request the details with an xml body.
+
+    Args:
+        data (dict): decoded response
+        job_id (str): job id
+
+    Returns:
+        dict: job details
+    """
+    try:
+        job_details = unwrap(data, 'job', 'JobManager_JobDetailResponse')['jobDetail']
+    except TypeError:
+        msg = 'No job details found for job {}'.format(job_id)
+        raise_requests_error(404, msg)
+    if not job_details:
+        msg = 'No job details found for job {}'.format(job_id)
+        raise_requests_error(404, msg)
+    return job_details
+
+
+def job_details_xml(job_id):
+    """Job details request body in xml.
+
+    Args:
+        job_id (str): job id
+
+    Returns:
+        str: request body
+    """
+    return '<JobManager_JobDetailRequest jobId="{}"/>'.format(job_id)
+
+
+class JobIndex(object):
+    """Jobs grouped by subclient, each group sorted by start time.
+
+    Built once from a get_jobs result, so the jobs of each subclient
+    can be looked up without filtering and sorting the whole list on
+    every call as get_subclient_jobs does. Names are matched exactly
+    unless partial matching is asked for.
+
+    Args:
+        jobs (list): jobs as returned by get_jobs, raw or as records
+
+    Returns:
+        index object
+    """
+    def __init__(self, jobs):
+        self.by_id = {}
+        self.by_name = {}
+        for job in jobs:
+            summary = JobSummary.coerce(job)
+            entry = (summary.start_time, job)
+            self.by_id.setdefault(summary.subclient_id, []).append(entry)
+            if summary.subclient_name is not None:
+                self.by_name.setdefault(summary.subclient_name, []).append(entry)
+        for groups in (self.by_id, self.by_name):
+            for key, entries in groups.items():
+                entries.sort(key=lambda entry: entry[0])
+                groups[key] = [job for _, job in entries]
+
+    def get(self, subclient_id=None, subclient_name=None, last=None, partial=False):
+        """Get jobs of a subclient, oldest first.
+
+        Args:
+            subclient_id (optional[str]): id of subclient for which to look
+            subclient_name (optional[str]): name of subclient for which to look
+            last (optional[int]): get this many most recent jobs
+            partial (optional[bool]): match subclient_name as a substring
+                of subclient names, as get_subclient_jobs does. This could
+                return jobs of more than one subclient. Defaults to False.
+
+        Returns:
+            list: jobs
+        """
+        if subclient_id is None and subclient_name is None:
+            msg = 'Cannot get subclient jobs without name or id'
+            log.error(msg)
+            raise PinkopyError(msg)
+        if subclient_id is not None:
+            jobs = self.by_id.get(str(subclient_id), [])
+        elif partial:
+            jobs = [(JobSummary.coerce(job).start_time, job)
+                    for name, jobs in self.by_name.items() if subclient_name in name
+                    for job in jobs]
+            jobs = [job for _, job in sorted(jobs, key=lambda entry: entry[0])]
+        else:
+            jobs = self.by_name.get(subclient_name, [])
+        if not jobs:
+            msg = ('No subclient jobs found for subclient_id {} / subclient_name {}'
+                   .format(subclient_id, subclient_name))
+            raise_requests_error(404, msg)
+        if last:
+            return jobs[-last:]
+        return list(jobs)
+
+
 class JobSession(BaseSession):
     """Methods for jobs."""
     def __init__(self, cache_methods=None, *args, **kwargs):
@@ -13,13 +175,16 @@ class JobSession(BaseSession):
                                           'get_jobs']
         super(JobSession, self).__init__(cache_methods=cache_methods, *args, **kwargs)
 
-    def get_jobs(self, client_id, job_filter=None, last=None):
+    def get_jobs(self, client_id, job_filter=None, last=None, lookup_time=None):
         """Get jobs.
 
         Args:
             client_id (str): client id for which to get jobs
             job_filted (optional[str]): job filter, ex. backup, restore
             last (optional[int]): get this many most recent jobs
+            lookup_time (optional[int]): only include completed jobs
+                that finished in this many seconds. Active jobs are
+                always included.
 
         Returns:
             list: jobs
@@ -33,28 +198,73 @@ class JobSession(BaseSession):
         }
         if job_filter is not None:
             qstr_vals['jobFilter'] = job_filter
+        if lookup_time is not None:
+            qstr_vals['completedJobLookupTime'] = int(lookup_time)
         res = self.request('GET', path, qstr_vals=qstr_vals)
-        data = res.json()
-        try:
-            jobs = sorted(
-                data['jobs'],
-                key=lambda job: job['jobSummary']['subclient']['subclientName']
-            )
-        except KeyError:
-            jobs = sorted(
-                data['JobManager_JobListResponse']['jobs'],
-                key=lambda job: job['jobSummary']['subclient']['@subclientName']
-            )
+        data = self._parse_json(res, path)
+        jobs = self.capabilities.attempt((path, 'dialect'), DIALECTS,
+                                         lambda dialect: parse_jobs(data, last, dialect))
+        if self.use_records:
+            jobs = [JobSummary.from_raw(job, keep_raw=self.keep_raw) for job in jobs]
+        return jobs
+
+    def iter_jobs(self, client_id, job_filter=None, last=None, lookup_time=None):
+        """Get jobs, decoding them as the response streams in.
+
+        For clients with so many jobs that decoding the whole response
+        at once is costly. Without last, jobs are yielded in the order
+        Commvault sends them. With last, the same jobs get_jobs would
+        return are selected while streaming, holding only that many.
+
+        Args:
+            client_id (str): client id for which to get jobs
+            job_filter (optional[str]): job filter, ex. backup, restore
+            last (optional[int]): get this many most recent jobs
+            lookup_time (optional[int]): only include completed jobs
+                that finished in this many seconds
+
+        Returns:
+            iterator: jobs
+        """
+        if isinstance(client_id, int):
+            log.warning('deprecated: client_id support for int for backward compatibility only')
+            client_id = str(client_id)
+        path = 'Job'
+        qstr_vals = {
+            'clientId': client_id
+        }
+        if job_filter is not None:
+            qstr_vals['jobFilter'] = job_filter
+        if lookup_time is not None:
+            qstr_vals['completedJobLookupTime'] = int(lookup_time)
+        res = self.request('GET', path, qstr_vals=qstr_vals, stream=True)
+        jobs = self._stream_jobs(res)
         if last:
-            jobs = jobs[-last:]
+            jobs = iter(last_jobs(jobs, last))
+        if self.use_records:
+            jobs = (JobSummary.from_raw(job, keep_raw=self.keep_raw) for job in jobs)
         return jobs
 
+    def _stream_jobs(self, res):
+        try:
+            if 'xml' in res.headers.get('Content-Type', ''):
+                # older versions may answer in xml
+                jobs = self.decoder.iter_xml_items(res.iter_content(chunk_size=CHUNK_SIZE),
+                                                   [('JobManager_JobListResponse', 'jobs')])
+            else:
+                paths = [('jobs',), ('JobManager_JobListResponse', 'jobs')]
+                jobs = iter_json_items(iter_text(res), paths)
+            for job in jobs:
+                yield job
+        finally:
+            res.close()
+
     @staticmethod
     def get_subclient_jobs(jobs, subclient_id=None, subclient_name=None, last=None):
         """Get list of jobs relevant to a specific subclient.
 
         Args:
-            jobs (list): list of jobs in which to check
+            jobs (list): list of jobs in which to check, raw or as records
             subclient_id (optional[str]): id of subclient for which to look
             subclient_name (optional[str]): name of subclient for which to look
             last (optional[int]): get this many most recent jobs
@@ -74,35 +284,18 @@ class JobSession(BaseSession):
                    'Selecting id by default.')
             log.info(msg)
 
+        summaries = [(JobSummary.coerce(job), job) for job in jobs]
         if subclient_id:
-            try:
-                jobs = sorted(
-                    [job for job in jobs
-                     if str(job['jobSummary']['subclient']['subclientId']) == subclient_id],
-                    key=lambda job: job['jobSummary']['jobStartTime']
-                )
-            except KeyError:
-                jobs = sorted(
-                    [job for job in jobs
-                     if str(job['jobSummary']['subclient']['@subclientId']) == subclient_id],
-                    key=lambda job: job['jobSummary']['@jobStartTime']
-                )
+            matches = [(summary.start_time, job) for summary, job in summaries
+                       if summary.subclient_id == subclient_id]
         else:
             # Could return incorrect data. If the name passed to this method
             # has more than one partial match and the correct record is not
-            # first in this list, then you get the wrong jobs.
-            try:
-                jobs = sorted(
-                    [job for job in jobs
-                     if subclient_name in job['jobSummary']['subclient']['subclientName']],
-                    key=lambda job: job['jobSummary']['jobStartTime']
-                )
-            except KeyError:
-                jobs = sorted(
-                    [job for job in jobs
-                     if subclient_name in job['jobSummary']['subclient']['@subclientName']],
-                    key=lambda job: job['jobSummary']['@jobStartTime']
-                )
+            # first in this list, then you get the wrong jobs. JobIndex
+            # matches names exactly.
+            matches = [(summary.start_time, job) for summary, job in summaries
+                       if subclient_name in (summary.subclient_name or '')]
+        jobs = [job for _, job in sorted(matches, key=lambda match: match[0])]
         if not jobs:
             msg = ('No subclient jobs found for subclient_id {} / subclient_name {}'
                    .format(subclient_id, subclient_name))
@@ -124,56 +317,61 @@ class JobSession(BaseSession):
             log.warning('deprecated: job_id support for int for backward compatibility only')
             job_id = str(job_id)
         path = 'JobDetails'
-        payload = {
-            'JobManager_JobDetailRequest': {
-                '@jobId': job_id
-            }
-        }
-        res = self.request('POST', path, payload=payload)
-        data = res.json()
-        try:
-            job_details = data['job']['jobDetail']
-        except KeyError:
-            try:
-                job_details = data['JobManager_JobDetailResponse']['job']['jobDetail']
-            except KeyError:
-                # Make new request with xml because Commvault seems to have
-                # broken the json request on this route.
+
+        def fetch(fmt):
+            if fmt == XML:
                 headers = self.headers.copy()
                 headers['Content-type'] = 'application/xml'
-                payload_nondict = ('<JobManager_JobDetailRequest jobId="{}"/>'
-                                   .format(job_id))
-                res = self.request('POST', path, headers=headers, payload_nondict=payload_nondict)
-                data = res.json()
-                job_details = data['job']['jobDetail']
-        except TypeError:
-            msg = 'No job details found for job {}'.format(job_id)
-            raise_requests_error(404, msg)
-        if not job_details:
-            msg = 'No job details found for job {}'.format(job_id)
-            raise_requests_error(404, msg)
+                res = self.request('POST', path, headers=headers,
+                                   payload_nondict=job_details_xml(job_id))
+            else:
+                payload = {
+                    'JobManager_JobDetailRequest': {
+                        '@jobId': job_id
+                    }
+                }
+                res = self.request('POST', path, payload=payload)
+            return parse_job_details(self._parse_json(res, path), job_id)
+
+        # Commvault seems to have broken the json request on this route
+        # in some versions. Once a json request has failed, requests
+        # are made with xml first.
+        job_details = self.capabilities.attempt((path, 'request'), FORMATS, fetch)
+        if self.use_records:
+            job_details = JobDetail.from_raw(job_details, keep_raw=self.keep_raw, job_id=job_id)
         return job_details
 
+    def get_job_details_many(self, job_ids, max_workers=8):
+        """Get details about many jobs concurrently.
+
+        Details are fetched in a pool of threads through the cached
+        get_job_details, so jobs already in the cache are answered
+        without a request and each lookup is counted once. job_ids are
+        read lazily, only a few ahead of the consumer, so they may come
+        from a stream. A failure for one job is yielded in place of its
+        details rather than stopping the others.
+
+        Args:
+            job_ids (iterable): job ids for which to get details
+            max_workers (optional[int]): concurrent requests. Defaults to 8.
+
+        Yields:
+            tuple: (job_id, job details or exception) as each completes
+        """
+        return imap_unordered(bulk(self.get_job_details), job_ids, max_workers=max_workers)
+
     @staticmethod
     def get_job_vmstatus(job_details):
         """Get all vmStatus entries for a given job.
 
         Args:
-            job_details (dict): details about a job
+            job_details (dict): details about a job, raw or as a record
 
         Returns:
-            str: vm status
+            list: vm status
         """
-        try:
-            vms = job_details['clientStatusInfo']['vmStatus']
-        except TypeError:
-            #no vmstatus
-            vms = None
-        if vms is not None:
-            if isinstance(vms, dict):
-                # Only one vmStatus
-                vms = [vms]
-        else:
+        vms = JobDetail.coerce(job_details).vm_status
+        if vms is None:
             msg = 'No vmstatus in job details'
             raise_requests_error(404, msg)
         return vms
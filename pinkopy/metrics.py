@@ -0,0 +1,271 @@
+"""
+Instrumentation of pinkopy sessions
+
+Sessions call an instrument's hooks as requests are made, retried and
+parsed, and as cached methods are looked up. Subclass Instrument to
+receive them, or use MetricsCollector to aggregate them and export
+Prometheus text. Sessions without an instrument skip the hooks, and
+the timing, altogether.
+"""
+import bisect
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# seconds, from a cached lookup on a near CommServe to a large job list
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Instrument(object):
+    """Hooks called by sessions. Each does nothing; override those needed.
+
+    Hooks are called from whichever thread made the request, so they
+    should be quick and thread safe.
+    """
+    def on_request(self, route, method, status, seconds, size):
+        """A request attempt finished.
+
+        Args:
+            route (str): route, ex. Job
+            method (str): HTTP method
+            status (int): response status, or None if the request raised
+            seconds (float): time until the response was received
+            size (int): response body bytes, or None if not known
+        """
+
+    def on_retry(self, route, reason):
+        """A request is about to be retried.
+
+        Args:
+            route (str): route, ex. Job
+            reason (str): status code, or name of the exception
+        """
+
+    def on_reauth(self, route):
+        """A request was rejected for its token and will log in again.
+
+        Args:
+            route (str): route, ex. Job
+        """
+
+    def on_queue_wait(self, route, seconds):
+        """A request waited for the governor.
+
+        Args:
+            route (str): route, ex. Job
+            seconds (float): time waited
+        """
+
+    def on_parse(self, route, fmt, seconds):
+        """A response body was parsed.
+
+        Args:
+            route (str): route, ex. Job
+            fmt (str): json or xml
+            seconds (float): time spent parsing
+        """
+
+    def on_cache(self, method_name, result):
+        """A cached method was looked up.
+
+        Args:
+            method_name (str): name of method
+            result (str): hits, misses, store_hits, coalesced or evictions
+        """
+
+
+class Histogram(object):
+    """Cumulative histogram with fixed buckets, as Prometheus keeps them.
+
+    Not thread safe; the MetricsCollector holding it serialises access.
+
+    Args:
+        buckets (iterable): upper bounds, ascending
+    """
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """List of (upper bound, observations at or below it)."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class _Summary(object):
+    __slots__ = ('sum', 'count')
+
+    def __init__(self):
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+
+
+class MetricsCollector(Instrument):
+    """Aggregate session hooks into metrics.
+
+    Keeps, per route, a latency histogram, response sizes, response
+    status counts, retries, re-auths, governor queue waits and parse
+    times, and, per cached method, lookup results.
+
+    Args:
+        buckets (optional[iterable]): latency histogram bounds in
+            seconds
+
+    Returns:
+        collector object
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop everything collected."""
+        with self.__lock:
+            self.__latency = {}
+            self.__sizes = {}
+            self.__statuses = {}
+            self.__retries = {}
+            self.__reauths = {}
+            self.__waits = {}
+            self.__parses = {}
+            self.__cache = {}
+
+    @staticmethod
+    def __incr(counts, key):
+        counts[key] = counts.get(key, 0) + 1
+
+    def on_request(self, route, method, status, seconds, size):
+        with self.__lock:
+            histogram = self.__latency.get((route, method))
+            if histogram is None:
+                histogram = self.__latency[(route, method)] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            if size is not None:
+                self.__sizes.setdefault(route, _Summary()).observe(size)
+            self.__incr(self.__statuses, (route, 'error' if status is None else str(status)))
+
+    def on_retry(self, route, reason):
+        with self.__lock:
+            self.__incr(self.__retries, (route, str(reason)))
+
+    def on_reauth(self, route):
+        with self.__lock:
+            self.__incr(self.__reauths, route)
+
+    def on_queue_wait(self, route, seconds):
+        with self.__lock:
+            self.__waits.setdefault(route, _Summary()).observe(seconds)
+
+    def on_parse(self, route, fmt, seconds):
+        with self.__lock:
+            self.__parses.setdefault((route, fmt), _Summary()).observe(seconds)
+
+    def on_cache(self, method_name, result):
+        with self.__lock:
+            self.__incr(self.__cache, (method_name, result))
+
+    def snapshot(self):
+        """Copy of everything collected.
+
+        Returns:
+            dict: metrics by name, each keyed by its labels
+        """
+        with self.__lock:
+            return {
+                'latency': {key: {'buckets': h.cumulative(), 'sum': h.sum, 'count': h.count}
+                            for key, h in self.__latency.items()},
+                'response_size': {key: {'sum': s.sum, 'count': s.count}
+                                  for key, s in self.__sizes.items()},
+                'responses': dict(self.__statuses),
+                'retries': dict(self.__retries),
+                'reauths': dict(self.__reauths),
+                'queue_wait': {key: {'sum': s.sum, 'count': s.count}
+                               for key, s in self.__waits.items()},
+                'parse': {key: {'sum': s.sum, 'count': s.count}
+                          for key, s in self.__parses.items()},
+                'cache': dict(self.__cache)
+            }
+
+    def prometheus(self, prefix='pinkopy'):
+        """Metrics in the Prometheus text exposition format.
+
+        Args:
+            prefix (optional[str]): prefix of metric names
+
+        Returns:
+            str: exposition text
+        """
+        snap = self.snapshot()
+        lines = []
+
+        def header(name, kind, doc):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, doc))
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, kind))
+
+        def sample(name, labels, value):
+            lines.append('{}_{}{{{}}} {}'.format(
+                prefix, name, ','.join('{}="{}"'.format(k, _escape(v)) for k, v in labels),
+                _number(value)))
+
+        header('request_duration_seconds', 'histogram', 'Request latency.')
+        for (route, method), h in sorted(snap['latency'].items()):
+            labels = [('route', route), ('method', method)]
+            for bound, count in h['buckets']:
+                sample('request_duration_seconds_bucket', labels + [('le', _number(bound))],
+                       count)
+            sample('request_duration_seconds_sum', labels, h['sum'])
+            sample('request_duration_seconds_count', labels, h['count'])
+        summaries = (('response_size_bytes', 'response_size', ('route',),
+                      'Response body size.'),
+                     ('queue_wait_seconds', 'queue_wait', ('route',),
+                      'Time waited for the governor.'),
+                     ('parse_duration_seconds', 'parse', ('route', 'format'),
+                      'Time spent parsing responses.'))
+        for name, key, label_names, doc in summaries:
+            header(name, 'summary', doc)
+            for labels, s in sorted(snap[key].items()):
+                labels = list(zip(label_names, _tuple(labels)))
+                sample(name + '_sum', labels, s['sum'])
+                sample(name + '_count', labels, s['count'])
+        counters = (('responses_total', 'responses', ('route', 'status'),
+                     'Responses by status.'),
+                    ('retries_total', 'retries', ('route', 'reason'), 'Retried requests.'),
+                    ('reauths_total', 'reauths', ('route',), 'Logins after a token expired.'),
+                    ('cache_lookups_total', 'cache', ('method', 'result'),
+                     'Cached method lookups by result.'))
+        for name, key, label_names, doc in counters:
+            header(name, 'counter', doc)
+            for labels, value in sorted(snap[key].items()):
+                sample(name, list(zip(label_names, _tuple(labels))), value)
+        return '\n'.join(lines) + '\n'
+
+
+def _tuple(labels):
+    return labels if isinstance(labels, tuple) else (labels,)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
@@ -0,0 +1,192 @@
+"""
+Compact typed records for Commvault responses
+
+Commvault answers in one of two key dialects: plain keys, or the
+@-prefixed keys of older versions. Records read either once, when
+built, and keep only the fields pinkopy uses. The full payload may
+be kept too, compressed and decoded only when asked for.
+"""
+from abc import ABCMeta, abstractmethod
+import json
+import logging
+import zlib
+
+log = logging.getLogger(__name__)
+
+
+def _get(data, key, default=None):
+    """Get key from data in either dialect."""
+    try:
+        return data[key]
+    except KeyError:
+        return data.get('@' + key, default)
+
+
+def _str(value):
+    return None if value is None else str(value)
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class Record(object, metaclass=ABCMeta):
+    """Base record.
+
+    Subclasses list their fields in _fields and build them in from_raw.
+    """
+    __slots__ = ('_raw', '_decoded')
+    _fields = ()
+
+    def __init__(self, raw=None, **fields):
+        self._raw = None if raw is None else zlib.compress(
+            json.dumps(raw, separators=(',', ':')).encode('UTF-8'))
+        self._decoded = None
+        for field in self._fields:
+            setattr(self, field, fields.get(field))
+
+    @classmethod
+    @abstractmethod
+    def from_raw(cls, data, keep_raw=False):
+        """Build record from a raw payload.
+
+        Args:
+            data (dict): raw payload
+            keep_raw (optional[bool]): keep the payload, compressed, for
+                raw and item access. Defaults to False, as most callers
+                only read fields and the payload is most of the size.
+
+        Returns:
+            record
+        """
+
+    @classmethod
+    def coerce(cls, obj):
+        """Record for obj, which may be a record or a raw payload.
+
+        Records built here do not keep the payload; this is for reading
+        fields of whatever a session returned.
+        """
+        if isinstance(obj, cls):
+            return obj
+        return cls.from_raw(obj, keep_raw=False)
+
+    def as_dict(self):
+        """Fields as a dict, in field order."""
+        return dict((field, getattr(self, field)) for field in self._fields)
+
+    @property
+    def raw(self):
+        """Full raw payload, or None if it was not kept.
+
+        Decoded anew on each access, so it may be changed freely.
+        """
+        if self._raw is None:
+            return None
+        return json.loads(zlib.decompress(self._raw).decode('UTF-8'))
+
+    def __getitem__(self, key):
+        # lets code written against raw payloads keep working. The
+        # payload is decoded on the first item access and kept.
+        if self._decoded is None:
+            if self._raw is None:
+                raise KeyError(key)
+            self._decoded = self.raw
+        return self._decoded[key]
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self._fields)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ', '.join('{}={!r}'.format(f, getattr(self, f)) for f in self._fields)
+        return '{}({})'.format(self.__class__.__name__, fields)
+
+
+class Client(Record):
+    """Client from the Client list."""
+    _fields = ('client_id', 'name', 'hostname')
+    __slots__ = _fields
+
+    @classmethod
+    def from_raw(cls, data, keep_raw=False):
+        entity = data['client']['clientEntity']
+        return cls(raw=data if keep_raw else None,
+                   client_id=_str(_get(entity, 'clientId')),
+                   name=_get(entity, 'clientName'),
+                   hostname=_get(entity, 'hostName'))
+
+
+class Subclient(Record):
+    """Subclient from the Subclient list."""
+    _fields = ('subclient_id', 'name', 'client_id', 'client_name',
+               'backupset_name', 'instance_name', 'app_name')
+    __slots__ = _fields
+
+    @classmethod
+    def from_raw(cls, data, keep_raw=False):
+        entity = data['subClientEntity']
+        return cls(raw=data if keep_raw else None,
+                   subclient_id=_str(_get(entity, 'subclientId')),
+                   name=_get(entity, 'subclientName'),
+                   client_id=_str(_get(entity, 'clientId')),
+                   client_name=_get(entity, 'clientName'),
+                   backupset_name=_get(entity, 'backupsetName'),
+                   instance_name=_get(entity, 'instanceName'),
+                   app_name=_get(entity, 'appName'))
+
+
+class JobSummary(Record):
+    """Job from the Job list."""
+    _fields = ('job_id', 'job_type', 'status', 'start_time', 'end_time',
+               'last_update_time', 'percent_complete', 'client_id',
+               'client_name', 'subclient_id', 'subclient_name')
+    __slots__ = _fields
+
+    @classmethod
+    def from_raw(cls, data, keep_raw=False):
+        summary = data['jobSummary']
+        subclient = summary.get('subclient') or {}
+        return cls(raw=data if keep_raw else None,
+                   job_id=_str(_get(summary, 'jobId')),
+                   job_type=_get(summary, 'jobType'),
+                   status=_get(summary, 'status'),
+                   start_time=_int(_get(summary, 'jobStartTime')),
+                   end_time=_int(_get(summary, 'jobEndTime')),
+                   last_update_time=_int(_get(summary, 'lastUpdateTime')),
+                   percent_complete=_int(_get(summary, 'percentComplete')),
+                   client_id=_str(_get(subclient, 'clientId')),
+                   client_name=_get(subclient, 'clientName'),
+                   subclient_id=_str(_get(subclient, 'subclientId')),
+                   subclient_name=_get(subclient, 'subclientName'))
+
+
+class JobDetail(Record):
+    """Job details from JobDetails."""
+    _fields = ('job_id', 'status', 'vm_status')
+    __slots__ = _fields
+
+    @classmethod
+    def from_raw(cls, data, keep_raw=False, job_id=None):
+        general = (data or {}).get('generalInfo') or {}
+        try:
+            vms = data['clientStatusInfo']['vmStatus']
+        except (KeyError, TypeError):
+            vms = None
+        if isinstance(vms, dict):
+            # Only one vmStatus
+            vms = [vms]
+        return cls(raw=data if keep_raw else None,
+                   job_id=_str(job_id or _get(general, 'jobId')),
+                   status=_get(general, 'status'),
+                   vm_status=vms)
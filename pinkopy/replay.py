@@ -0,0 +1,256 @@
+"""
+Record and replay of CommServe traffic
+
+RecordingTransport sits between a session and its real transport and
+writes every exchange to a gzipped json lines archive. ReplayTransport
+answers a session from such an archive with no network, so a workload
+seen in production can be re-run as often as needed, with the payload
+sizes and shapes it really had.
+"""
+from base64 import b64decode, b64encode
+from collections import deque
+import gzip
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from .exceptions import PinkopyError
+from .transport import HTTPTransport
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_VERSION = 1
+REDACTED = 'REDACTED'
+# never written to an archive
+SECRET_HEADERS = frozenset(['authtoken', 'authorization', 'cookie', 'set-cookie'])
+SECRET_FIELDS = frozenset(['password', 'token'])
+
+
+def _prepare(method, url, kwargs):
+    """Full url and body bytes of a request as requests would send it."""
+    prepared = requests.Request(method, url, params=kwargs.get('params'),
+                                data=kwargs.get('data'), json=kwargs.get('json')).prepare()
+    body = prepared.body
+    if isinstance(body, str):
+        body = body.encode('UTF-8')
+    return prepared.url, body
+
+
+def _redact(body):
+    """Body bytes with secret json fields replaced, as text."""
+    if body is None:
+        return None
+    text = body.decode('UTF-8', 'replace')
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(data, dict) and SECRET_FIELDS.intersection(data):
+        data = dict((k, REDACTED if k in SECRET_FIELDS and v else v) for k, v in data.items())
+        return json.dumps(data, sort_keys=True)
+    return text
+
+
+def _path(url):
+    """Path and query of url."""
+    split = urlsplit(url)
+    return split.path + ('?' + split.query if split.query else '')
+
+
+def _encode_body(content):
+    try:
+        return {'body': content.decode('UTF-8')}
+    except UnicodeDecodeError:
+        return {'body_b64': b64encode(content).decode('ascii')}
+
+
+def _decode_body(entry):
+    if 'body_b64' in entry:
+        return b64decode(entry['body_b64'])
+    return (entry.get('body') or '').encode('UTF-8')
+
+
+def load(path):
+    """Read the exchanges in an archive.
+
+    Args:
+        path (str): archive written by a RecordingTransport
+
+    Yields:
+        dict: exchange with method, url, request_body, status, headers,
+            body, offset and elapsed
+    """
+    with gzip.open(path, 'rt') as f:
+        header = json.loads(f.readline())
+        if header.get('version') != ARCHIVE_VERSION:
+            raise PinkopyError('Unsupported archive version {}'.format(header.get('version')))
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class RecordingTransport(object):
+    """Transport that records exchanges made through another.
+
+    Each exchange is written as it completes, with its request, its
+    response and when and for how long it ran. Tokens, passwords and
+    auth headers are redacted. Streamed responses are read in full to
+    be recorded, so they are no longer streamed while recording.
+
+    Args:
+        path (str): archive file to write, gzipped json lines
+        transport (optional[HTTPTransport]): transport making the real
+            requests. One is created if not provided.
+
+    Returns:
+        transport object
+    """
+    def __init__(self, path, transport=None):
+        self.path = path
+        self.transport = transport or HTTPTransport()
+        self.__lock = threading.Lock()
+        self.__file = gzip.open(path, 'wt')
+        self.__file.write(json.dumps({'version': ARCHIVE_VERSION, 'created': time.time()}) + '\n')
+        self.__start = time.monotonic()
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def request(self, method, url, **kwargs):
+        """Send request over the wrapped transport and record it.
+
+        Args:
+            method (str): HTTP method
+            url (str): full url
+            **kwargs: passed through to the wrapped transport
+
+        Returns:
+            response object
+        """
+        full_url, body = _prepare(method, url, kwargs)
+        started = time.monotonic()
+        res = self.transport.request(method, url, **kwargs)
+        content = res.content
+        entry = {
+            'method': method,
+            'url': full_url,
+            'request_body': _redact(body),
+            'request_content_type': (kwargs.get('headers') or {}).get('Content-type'),
+            'status': res.status_code,
+            'headers': dict((k, v) for k, v in res.headers.items()
+                            if k.lower() not in SECRET_HEADERS),
+            'offset': started - self.__start,
+            'elapsed': time.monotonic() - started
+        }
+        if method == 'POST' and full_url.rstrip('/').endswith('/Login'):
+            entry.update(_encode_body(_redact(content).encode('UTF-8')))
+        else:
+            entry.update(_encode_body(content))
+        with self.__lock:
+            if not self.closed:
+                self.__file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        return res
+
+    def close(self):
+        """Finish the archive and close the wrapped transport."""
+        with self.__lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.__file.close()
+        self.transport.close()
+
+
+class ReplayTransport(object):
+    """Transport answering from a recorded archive, with no network.
+
+    Requests are matched to recorded exchanges by method, url path and
+    query, and body, so a session may replay against any host.
+    Exchanges for the same request are replayed in the order recorded;
+    once they run out the last is repeated, unless strict.
+
+    Args:
+        path (str): archive written by a RecordingTransport
+        speed (optional[float]): replay at this multiple of the recorded
+            speed, waiting each exchange's recorded time divided by it.
+            Defaults to None, meaning as fast as possible.
+        strict (optional[bool]): raise PinkopyError for requests not in
+            the archive, or made more often than recorded. Defaults to
+            False, where unknown requests are answered 404.
+
+    Returns:
+        transport object
+    """
+    def __init__(self, path, speed=None, strict=False):
+        self.path = path
+        self.speed = speed
+        self.strict = strict
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        self.__last = {}
+        for entry in load(path):
+            key = (entry['method'], _path(entry['url']), entry.get('request_body'))
+            self.__entries.setdefault(key, deque()).append(entry)
+        self.replayed = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def __match(self, key):
+        queue = self.__entries.get(key)
+        if queue:
+            entry = self.__last[key] = queue.popleft()
+            return entry
+        if not self.strict:
+            return self.__last.get(key)
+        return None
+
+    def request(self, method, url, **kwargs):
+        """Answer request from the archive.
+
+        Args:
+            method (str): HTTP method
+            url (str): full url
+            **kwargs: as for HTTPTransport.request
+
+        Returns:
+            response object
+        """
+        full_url, body = _prepare(method, url, kwargs)
+        with self.__lock:
+            entry = self.__match((method, _path(full_url), _redact(body)))
+            self.replayed += 1
+        if entry is None:
+            if self.strict:
+                raise PinkopyError('No recorded exchange for {} {}'.format(method, full_url))
+            log.warning('No recorded exchange for {} {}'.format(method, full_url))
+            entry = {'status': 404, 'headers': {}, 'body': ''}
+        if self.speed:
+            time.sleep(entry.get('elapsed', 0) / float(self.speed))
+        res = requests.Response()
+        res.status_code = entry['status']
+        res.headers.update(entry.get('headers') or {})
+        # the body is whole; drop headers describing how it was sent
+        for header in ('Content-Encoding', 'Transfer-Encoding'):
+            res.headers.pop(header, None)
+        res._content = _decode_body(entry)
+        res._content_consumed = True
+        res.url = full_url
+        res.encoding = requests.utils.get_encoding_from_headers(res.headers)
+        res.request = requests.Request(method, full_url).prepare()
+        return res
+
+    def close(self):
+        self.closed = True
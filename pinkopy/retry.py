@@ -0,0 +1,152 @@
+from collections import deque
+from email.utils import parsedate_tz, mktime_tz
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Commvault answers 500 for requests it will never fulfil, ex. unknown
+# ids, so only statuses meaning try again later are retried.
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+# POSTs that only read, by route
+IDEMPOTENT_POSTS = frozenset(['JobDetails'])
+
+
+class RetryBudget(object):
+    """Cap retries to a share of recent requests.
+
+    During an outage every request fails, and retrying each would
+    multiply the load on a CommServe trying to recover. A budget allows
+    min_retries retries, plus ratio retries per request, in each window
+    of seconds; retries beyond that fail at once.
+
+    Args:
+        ratio (optional[float]): retries allowed per request. Defaults
+            to 0.2.
+        min_retries (optional[int]): retries allowed however few
+            requests are made. Defaults to 10.
+        window (optional[int]): seconds over which requests and retries
+            are counted. Defaults to 10.
+
+    Returns:
+        budget object
+    """
+    def __init__(self, ratio=0.2, min_retries=10, window=10):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self.__lock = threading.Lock()
+        self.__requests = deque()
+        self.__retries = deque()
+
+    def __prune(self, now):
+        for events in (self.__requests, self.__retries):
+            while events and events[0] <= now - self.window:
+                events.popleft()
+
+    def deposit(self):
+        """Count a request."""
+        now = time.monotonic()
+        with self.__lock:
+            self.__prune(now)
+            self.__requests.append(now)
+
+    def withdraw(self):
+        """Take a retry from the budget.
+
+        Returns:
+            bool: True if the retry is allowed
+        """
+        now = time.monotonic()
+        with self.__lock:
+            self.__prune(now)
+            allowed = self.min_retries + self.ratio * len(self.__requests)
+            if len(self.__retries) >= allowed:
+                return False
+            self.__retries.append(now)
+            return True
+
+
+class RetryPolicy(object):
+    """When and how long to wait before retrying a request.
+
+    Only idempotent requests are retried: GET, and POSTs to routes that
+    only read, such as JobDetails. Connection errors, timeouts and
+    responses with a status in statuses are retried, waiting an
+    exponentially growing time with full jitter between attempts, or
+    what the server asks for in Retry-After.
+
+    Args:
+        attempts (optional[int]): most attempts per request, including
+            the first. Defaults to 3.
+        backoff (optional[float]): seconds the first retry waits at
+            most; each retry after doubles it. Defaults to 0.5.
+        max_backoff (optional[float]): most seconds a retry waits.
+            Defaults to 30.
+        statuses (optional[iterable]): response statuses to retry.
+            Defaults to 429, 502, 503 and 504.
+        methods (optional[iterable]): HTTP methods to retry
+        posts (optional[iterable]): routes whose POSTs may be retried
+        budget (optional[RetryBudget]): limit on retries. Sessions
+            sharing a policy share its budget. One is created with
+            default limits if not provided.
+
+    Returns:
+        policy object
+    """
+    def __init__(self, attempts=3, backoff=0.5, max_backoff=30, statuses=RETRY_STATUSES,
+                 methods=IDEMPOTENT_METHODS, posts=IDEMPOTENT_POSTS, budget=None):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(methods)
+        self.posts = frozenset(posts)
+        self.budget = budget or RetryBudget()
+
+    def idempotent(self, method, route):
+        """Whether a request may be sent more than once."""
+        return method in self.methods or (method == 'POST' and route in self.posts)
+
+    def delay(self, method, route, attempt, res=None):
+        """Seconds to wait before retrying, or None not to retry.
+
+        Args:
+            method (str): HTTP method
+            route (str): route, ex. Job
+            attempt (int): attempts made so far
+            res (optional[response]): failed response, or None if the
+                request raised
+
+        Returns:
+            float: seconds to wait, or None
+        """
+        if attempt >= self.attempts or not self.idempotent(method, route):
+            return None
+        if res is not None and res.status_code not in self.statuses:
+            return None
+        if not self.budget.withdraw():
+            log.warning('Retry budget exhausted, not retrying {} {}'.format(method, route))
+            return None
+        retry_after = None if res is None else self.retry_after(res)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    @staticmethod
+    def retry_after(res):
+        """Seconds asked for by the Retry-After header, or None."""
+        value = res.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0.0, mktime_tz(parsed) - time.time())
@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .records import Client, JobDetail, JobSummary, Subclient
+
+log = logging.getLogger(__name__)
+
+# record classes that may be stored, by name
+RECORDS = dict((cls.__name__, cls) for cls in (Client, Subclient, JobSummary, JobDetail))
+_RECORD_KEY = '__pinkopy_record__'
+
+
+def _encode_record(obj):
+    """Json for a record: its class, fields and raw payload."""
+    name = type(obj).__name__
+    if RECORDS.get(name) is not type(obj):
+        raise TypeError('{} cannot be stored'.format(name))
+    return {_RECORD_KEY: name, 'fields': obj.as_dict(), 'raw': obj.raw}
+
+
+def _decode_record(data):
+    """Record for json made by _encode_record, other dicts as they are."""
+    if _RECORD_KEY not in data:
+        return data
+    return RECORDS[data[_RECORD_KEY]](raw=data['raw'], **data['fields'])
+
+
+def dumps(value):
+    """Encode a value to store as json.
+
+    Dicts, lists, strings, numbers, None and records may be stored.
+    Tuples come back as lists.
+
+    Raises:
+        TypeError or ValueError: if the value cannot be stored
+    """
+    return json.dumps(value, separators=(',', ':'), default=_encode_record)
+
+
+def loads(text):
+    """Decode a value encoded by dumps."""
+    return json.loads(text, object_hook=_decode_record)
+
+
+class SQLiteStore(object):
+    """Persistent cache store in a SQLite file.
+
+    Lets cached results outlive the process, so a new process can start
+    from what the last one fetched. Several processes may share a file;
+    SQLite serialises their writes. Values are stored as json, so a
+    file never holds anything but data. Entries are kept past their
+    expiry so a stale value can be served while it is refreshed: for
+    as long as their ttl, and never more than max_stale seconds.
+
+    Args:
+        path (str): database file, created if missing
+        namespace (optional[str]): prefix of every key, so sessions for
+            different CommServes or users can share a file
+        max_stale (optional[int]): most seconds expired entries are
+            kept. Defaults to 86400.
+        timeout (optional[int]): seconds to wait for another process's
+            lock. Defaults to 30.
+
+    Returns:
+        store object
+    """
+    def __init__(self, path, namespace='', max_stale=86400, timeout=30):
+        self.path = os.path.expanduser(path)
+        self.namespace = namespace
+        self.max_stale = max_stale
+        self.timeout = timeout
+        self.__local = threading.local()
+        with self.connection as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS entries '
+                         '(key TEXT PRIMARY KEY, expires REAL, value BLOB)')
+
+    @property
+    def connection(self):
+        """Connection for the calling thread."""
+        conn = getattr(self.__local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            except sqlite3.DatabaseError:
+                log.warning('Could not enable WAL for {}'.format(self.path))
+            self.__local.conn = conn
+        return conn
+
+    def _key(self, key):
+        return '{}|{}'.format(self.namespace, json.dumps(key, default=str))
+
+    def get(self, key, ttl=None):
+        """Get entry, fresh or stale.
+
+        Args:
+            key (tuple): cache key
+            ttl (optional[int]): seconds entries of the method are
+                fresh. An entry is stale for as long, up to max_stale.
+                Defaults to None, meaning max_stale.
+
+        Returns:
+            tuple: (found, value, expiry timestamp)
+        """
+        try:
+            row = self.connection.execute(
+                'SELECT expires, value FROM entries WHERE key = ?',
+                (self._key(key),)).fetchone()
+        except sqlite3.Error:
+            log.exception('Could not read {}'.format(self.path))
+            return False, None, None
+        if row is None:
+            return False, None, None
+        expires, text = row
+        stale = self.max_stale if ttl is None else min(self.max_stale, ttl)
+        if expires + stale <= time.time():
+            return False, None, None
+        try:
+            value = loads(text)
+        except (ValueError, TypeError, KeyError):
+            # including entries of older versions, which were pickled
+            log.warning('Dropping unreadable entry {}'.format(key))
+            self.delete(key)
+            return False, None, None
+        return True, value, expires
+
+    def set(self, key, value, ttl):
+        """Set entry.
+
+        Args:
+            key (tuple): cache key
+            value: value to store, see dumps
+            ttl (int): seconds entry is fresh
+        """
+        try:
+            text = dumps(value)
+            with self.connection as conn:
+                conn.execute('INSERT OR REPLACE INTO entries (key, expires, value) '
+                             'VALUES (?, ?, ?)',
+                             (self._key(key), time.time() + ttl, text))
+        except (TypeError, ValueError):
+            log.info('{} result cannot be stored'.format(key[0]))
+        except sqlite3.Error:
+            log.exception('Could not write {}'.format(self.path))
+
+    def delete(self, key):
+        """Delete entry.
+
+        Args:
+            key (tuple): cache key
+        """
+        with self.connection as conn:
+            conn.execute('DELETE FROM entries WHERE key = ?', (self._key(key),))
+
+    def invalidate(self, method_name):
+        """Delete all entries of a method in this namespace.
+
+        Args:
+            method_name (str): name of method
+        """
+        prefix = self._key((method_name,))[:-1]
+        with self.connection as conn:
+            conn.execute("DELETE FROM entries WHERE key LIKE ? ESCAPE '\\'",
+                         (self._like(prefix),))
+
+    def clear(self):
+        """Delete all entries in this namespace."""
+        with self.connection as conn:
+            conn.execute("DELETE FROM entries WHERE key LIKE ? ESCAPE '\\'",
+                         (self._like(self.namespace + '|'),))
+
+    def purge(self):
+        """Delete entries past max_stale."""
+        with self.connection as conn:
+            conn.execute('DELETE FROM entries WHERE expires < ?',
+                         (time.time() - self.max_stale,))
+
+    def close(self):
+        """Close the calling thread's connection."""
+        conn = getattr(self.__local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.__local.conn = None
+
+    @staticmethod
+    def _like(prefix):
+        for char in ('\\', '%', '_'):
+            prefix = prefix.replace(char, '\\' + char)
+        return prefix + '%'
@@ -0,0 +1,144 @@
+import codecs
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+_WHITESPACE = ' \t\n\r'
+# characters that may follow an item, ending a bare number or literal
+_DELIMITERS = ',]}' + _WHITESPACE
+
+
+def iter_text(res, chunk_size=CHUNK_SIZE):
+    """Iterate over a streamed response body as text.
+
+    Args:
+        res: streamed response object
+        chunk_size (optional[int]): bytes read at a time
+
+    Yields:
+        str: decoded chunks
+    """
+    decoder = codecs.getincrementaldecoder(res.encoding or 'utf-8')(errors='replace')
+    for chunk in res.iter_content(chunk_size=chunk_size):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def iter_json_items(chunks, paths):
+    """Decode the items of a json array one at a time.
+
+    The document is scanned until an array is found under one of the
+    given key paths, for example ('jobs',) for {"jobs": [...]}. Items
+    of that array are then decoded and yielded as they are read, so the
+    whole document never needs to be held or decoded at once.
+
+    Args:
+        chunks (iterable): text chunks of the document
+        paths (list): key paths, as tuples, at which the array may be
+
+    Yields:
+        items of the array
+
+    Raises:
+        KeyError: if no array is found at any of the paths
+    """
+    chunks = iter(chunks)
+    paths = set(tuple(path) for path in paths)
+    buf, pos = _find_array(chunks, paths)
+    decoder = json.JSONDecoder()
+    more = True
+    while True:
+        # skip separators, reading on when the buffer runs out
+        while True:
+            while pos < len(buf) and (buf[pos] in _WHITESPACE or buf[pos] == ','):
+                pos += 1
+            if pos < len(buf) or not more:
+                break
+            buf, pos, more = _read(chunks, buf, pos)
+        if pos >= len(buf):
+            raise ValueError('Unterminated json array')
+        if buf[pos] == ']':
+            return
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if not more:
+                    raise
+                buf, pos, more = _read(chunks, buf, pos)
+                continue
+            if more and not isinstance(item, (dict, list, str)) and \
+                    (end == len(buf) or buf[end] not in _DELIMITERS):
+                # a bare number or literal is only whole once followed by
+                # a delimiter; 2. or 2.5e may continue in the next chunk
+                buf, pos, more = _read(chunks, buf, pos)
+                continue
+            break
+        pos = end
+        yield item
+
+
+def _read(chunks, buf, pos):
+    """Append the next chunk, dropping what has been consumed.
+
+    Returns:
+        tuple: (buffer, position, whether more chunks may follow)
+    """
+    try:
+        chunk = next(chunks)
+    except StopIteration:
+        return buf, pos, False
+    return buf[pos:] + chunk, 0, True
+
+
+def _find_array(chunks, paths):
+    """Scan to the start of the array at one of paths.
+
+    Returns:
+        tuple: (buffer, position just inside the array)
+    """
+    # stack of [key] for objects and None for arrays
+    stack = []
+    expecting_key = False
+    in_string = False
+    escaped = False
+    key_chars = None
+    for buf in chunks:
+        for pos, char in enumerate(buf):
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+                    if key_chars is not None:
+                        stack[-1][0] = json.loads('"' + ''.join(key_chars) + '"')
+                        key_chars = None
+                        expecting_key = False
+                    continue
+                if key_chars is not None:
+                    key_chars.append(char)
+            elif char == '"':
+                in_string = True
+                if expecting_key:
+                    key_chars = []
+            elif char == '{':
+                stack.append([None])
+                expecting_key = True
+            elif char == '[':
+                if stack and all(frame is not None for frame in stack):
+                    if tuple(frame[0] for frame in stack) in paths:
+                        return buf, pos + 1
+                stack.append(None)
+            elif char in '}]':
+                stack.pop()
+            elif char == ',':
+                expecting_key = bool(stack) and stack[-1] is not None
+    raise KeyError('No array at {}'.format(sorted(paths)))
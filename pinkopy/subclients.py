@@ -1,11 +1,32 @@
 import logging
 
 from .base_session import BaseSession
-from .exceptions import PinkopyError, raise_requests_error
+from .capabilities import DIALECTS, unwrap
+from .exceptions import raise_requests_error
+from .records import Subclient
 
 log = logging.getLogger(__name__)
 
 
+def parse_subclients(data, client_id, dialect=None):
+    """Parse subclient list response.
+
+    Args:
+        data (dict): decoded response
+        client_id (str): client id the subclients belong to
+        dialect (optional[str]): json or legacy. Defaults to either.
+
+    Returns:
+        list: subclients
+    """
+    subclients = unwrap(data, 'subClientProperties', 'App_GetSubClientPropertiesResponse',
+                        dialect)
+    if not subclients:
+        msg = 'No subclients for client {}'.format(client_id)
+        raise_requests_error(404, msg)
+    return subclients
+
+
 class SubclientSession(BaseSession):
     """Methods for subclients."""
     def __init__(self, cache_methods=None, *args, **kwargs):
@@ -29,12 +50,11 @@ class SubclientSession(BaseSession):
             'clientId': client_id
         }
         res = self.request('GET', path, qstr_vals=qstr_vals)
-        data = res.json()
-        try:
-            subclients = data['subClientProperties']
-        except KeyError:
-            subclients = data['App_GetSubClientPropertiesResponse']['subClientProperties']
-        if not subclients:
-            msg = 'No subclients for client {}'.format(client_id)
-            raise_requests_error(404, msg)
+        data = self._parse_json(res, path)
+        subclients = self.capabilities.attempt(
+            (path, 'dialect'), DIALECTS,
+            lambda dialect: parse_subclients(data, client_id, dialect))
+        if self.use_records:
+            subclients = [Subclient.from_raw(subclient, keep_raw=self.keep_raw)
+                          for subclient in subclients]
         return subclients
@@ -0,0 +1,9 @@
+"""
+Local stand-in for the Commvault REST api
+
+For tests and benchmarks that need a CommServe to talk to without one.
+"""
+from .fleet import Fleet
+from .server import SimulatedCommServe
+
+__all__ = ['Fleet', 'SimulatedCommServe']
@@ -0,0 +1,179 @@
+import logging
+import random
+import time
+
+log = logging.getLogger(__name__)
+
+# job ids are client id * JOB_STRIDE + job number, so a job's client
+# can be found from its id alone
+JOB_STRIDE = 1000000
+
+JOB_STATUSES = ('Completed', 'Completed', 'Completed', 'Completed w/ one or more errors',
+                'Failed', 'Killed')
+APPS = ('File System', 'Virtual Server', 'SQL Server', 'Oracle')
+
+
+class Fleet(object):
+    """Generated Commvault inventory.
+
+    Clients, subclients and jobs are generated on demand from the seed,
+    so the same fleet is seen every time and fleets of millions of jobs
+    need no memory until asked for.
+
+    Args:
+        clients (optional[int]): number of clients. Defaults to 100.
+        subclients_per_client (optional[int]): Defaults to 3.
+        jobs_per_client (optional[int]): Defaults to 50.
+        running_ratio (optional[float]): share of clients whose latest
+            job is still running. Defaults to 0.1.
+        history (optional[int]): seconds over which job start times are
+            spread, ending at now. Defaults to 30 days.
+        seed (optional[int]): Defaults to 0.
+        now (optional[float]): time the fleet is generated at.
+            Defaults to now.
+
+    Returns:
+        fleet object
+    """
+    def __init__(self, clients=100, subclients_per_client=3, jobs_per_client=50,
+                 running_ratio=0.1, history=30 * 86400, seed=0, now=None):
+        self.clients = clients
+        self.subclients_per_client = subclients_per_client
+        self.jobs_per_client = jobs_per_client
+        self.running_ratio = running_ratio
+        self.history = history
+        self.seed = seed
+        self.now = int(time.time() if now is None else now)
+
+    def __rng(self, *parts):
+        return random.Random('{}:{}'.format(self.seed, ':'.join(str(p) for p in parts)))
+
+    def client_ids(self):
+        """Ids of all clients, as strings."""
+        return [str(n) for n in range(1, self.clients + 1)]
+
+    def has_client(self, client_id):
+        try:
+            return 1 <= int(client_id) <= self.clients
+        except (TypeError, ValueError):
+            return False
+
+    def client(self, client_id):
+        """Client entity.
+
+        Args:
+            client_id (str): client id
+
+        Returns:
+            dict: clientId, clientName and hostName
+        """
+        name = 'client{:06d}'.format(int(client_id))
+        return {'clientId': int(client_id),
+                'clientName': name,
+                'hostName': '{}.example.com'.format(name)}
+
+    def subclients(self, client_id):
+        """Subclient entities of a client.
+
+        Args:
+            client_id (str): client id
+
+        Returns:
+            list: dicts of subclient entity fields
+        """
+        client = self.client(client_id)
+        rng = self.__rng('subclients', client_id)
+        subclients = []
+        for n in range(self.subclients_per_client):
+            app = rng.choice(APPS)
+            subclients.append({
+                'subclientId': int(client_id) * 100 + n,
+                'subclientName': 'default' if n == 0 else 'sc{}'.format(n),
+                'clientId': client['clientId'],
+                'clientName': client['clientName'],
+                'backupsetName': 'defaultBackupSet',
+                'instanceName': 'DefaultInstanceName',
+                'appName': app
+            })
+        return subclients
+
+    def jobs(self, client_id):
+        """Job summaries of a client, oldest first.
+
+        Args:
+            client_id (str): client id
+
+        Returns:
+            list: dicts of job summary fields
+        """
+        subclients = self.subclients(client_id)
+        rng = self.__rng('jobs', client_id)
+        running = rng.random() < self.running_ratio
+        start = self.now - self.history
+        step = self.history / float(max(self.jobs_per_client, 1))
+        jobs = []
+        for n in range(self.jobs_per_client):
+            subclient = subclients[n % len(subclients)] if subclients else {}
+            started = int(start + n * step + rng.random() * step / 2)
+            last = n == self.jobs_per_client - 1
+            if running and last:
+                status, ended, percent = 'Running', 0, rng.randint(1, 99)
+            else:
+                status = rng.choice(JOB_STATUSES)
+                ended, percent = started + rng.randint(60, 7200), 100
+            jobs.append({
+                'jobId': int(client_id) * JOB_STRIDE + n,
+                'jobType': 'Restore' if rng.random() < 0.05 else 'Backup',
+                'status': status,
+                'jobStartTime': started,
+                'jobEndTime': ended,
+                'lastUpdateTime': ended or self.now,
+                'percentComplete': percent,
+                'subclient': {
+                    'clientId': subclient.get('clientId'),
+                    'clientName': subclient.get('clientName'),
+                    'subclientId': subclient.get('subclientId'),
+                    'subclientName': subclient.get('subclientName'),
+                    'appName': subclient.get('appName')
+                }
+            })
+        return jobs
+
+    def job(self, job_id):
+        """Job summary by id, or None if there is no such job."""
+        try:
+            client_id, n = divmod(int(job_id), JOB_STRIDE)
+        except (TypeError, ValueError):
+            return None
+        if not self.has_client(client_id) or n >= self.jobs_per_client:
+            return None
+        return self.jobs(client_id)[n]
+
+    def job_details(self, job_id):
+        """Job details by id, or None if there is no such job.
+
+        Returns:
+            dict: generalInfo and, for virtual server jobs, clientStatusInfo
+        """
+        job = self.job(job_id)
+        if job is None:
+            return None
+        details = {
+            'generalInfo': {
+                'jobId': job['jobId'],
+                'status': job['status'],
+                'jobType': job['jobType'],
+                'startTime': job['jobStartTime'],
+                'endTime': job['jobEndTime'],
+                'subclientName': job['subclient']['subclientName']
+            }
+        }
+        if job['subclient']['appName'] == 'Virtual Server':
+            rng = self.__rng('vms', job_id)
+            details['clientStatusInfo'] = {
+                'vmStatus': [{'vmName': 'vm{}'.format(n),
+                              'Status': rng.choice((0, 0, 0, 1)),
+                              'BackupStartTime': job['jobStartTime']}
+                             for n in range(rng.randint(1, 5))]
+            }
+        return details
@@ -0,0 +1,330 @@
+from base64 import b64decode
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import logging
+import random
+from socketserver import ThreadingMixIn
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+import uuid
+from xml.sax.saxutils import quoteattr
+
+from .fleet import Fleet
+
+log = logging.getLogger(__name__)
+
+DIALECTS = ('json', 'legacy')
+ACTIVE_STATUSES = ('Pending', 'Queued', 'Running', 'Suspended', 'Waiting')
+
+
+def legacy(obj):
+    """Convert a payload to the legacy dialect, where scalar fields are
+    @-prefixed as xml attributes decoded by xmltodict would be."""
+    if isinstance(obj, dict):
+        return {(k if isinstance(v, (dict, list)) else '@' + k): legacy(v)
+                for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [legacy(v) for v in obj]
+    return obj
+
+
+def to_xml(tag, obj):
+    """Render a legacy dialect payload as xml."""
+    if isinstance(obj, list):
+        return ''.join(to_xml(tag, item) for item in obj)
+    attrs = ''.join(' {}={}'.format(k[1:], quoteattr(str(v)))
+                    for k, v in obj.items() if k.startswith('@') and v is not None)
+    children = ''.join(to_xml(k, v) for k, v in obj.items() if not k.startswith('@'))
+    if not children:
+        return '<{}{}/>'.format(tag, attrs)
+    return '<{0}{1}>{2}</{0}>'.format(tag, attrs, children)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SimulatedCommServe(object):
+    """Local HTTP stand-in for the Commvault REST api.
+
+    Serves the routes pinkopy uses (Login, Logout, Client, Client/{id},
+    Subclient, Job and JobDetails) from a generated Fleet, in a
+    background thread, until stopped. The json dialect answers as
+    current Commvault versions do. The legacy dialect answers as older
+    ones: @-prefixed keys, xml for client properties, and no job
+    details unless they are requested with an xml body.
+
+    Args:
+        fleet (optional[Fleet]): inventory to serve. Defaults to a
+            Fleet with default arguments.
+        dialect (optional[str]): json or legacy. Defaults to json.
+        latency (optional[float]): seconds added to every response
+        jitter (optional[float]): up to this many seconds more, at random
+        token_ttl (optional[float]): seconds tokens are accepted for.
+            Defaults to None, meaning tokens do not expire.
+        error_rate (optional[float]): share of requests answered with
+            error_status instead
+        error_status (optional[int]): Defaults to 503.
+        user (optional[str]): username accepted. Defaults to any.
+        pw (optional[str]): password accepted. Defaults to any.
+        host (optional[str]): Defaults to 127.0.0.1.
+        port (optional[int]): Defaults to 0, meaning any free port.
+        seed (optional[int]): seed for latency jitter and errors
+
+    Returns:
+        server object
+    """
+    def __init__(self, fleet=None, dialect='json', latency=0, jitter=0, token_ttl=None,
+                 error_rate=0, error_status=503, user=None, pw=None, host='127.0.0.1',
+                 port=0, seed=0):
+        if dialect not in DIALECTS:
+            raise ValueError('dialect must be one of {}'.format(DIALECTS))
+        self.fleet = fleet or Fleet()
+        self.dialect = dialect
+        self.latency = latency
+        self.jitter = jitter
+        self.token_ttl = token_ttl
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.user = user
+        self.pw = pw
+        self.host = host
+        self.port = port
+        self.requests = {}
+        self.__rng = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__tokens = {}
+        self.__failures = []
+        self.__server = None
+        self.__thread = None
+
+    @property
+    def url(self):
+        """Root of the api, to pass as a session's service."""
+        return 'http://{}:{}/'.format(self.host, self.port)
+
+    def start(self):
+        """Start serving in a background thread."""
+        handler = type('Handler', (_Handler,), {'commserve': self})
+        self.__server = _Server((self.host, self.port), handler)
+        self.port = self.__server.server_address[1]
+        self.__thread = threading.Thread(target=self.__server.serve_forever,
+                                         kwargs={'poll_interval': 0.05},
+                                         name='SimulatedCommServe')
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__thread.join()
+            self.__server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.stop()
+
+    def expire_tokens(self):
+        """Reject every token issued so far."""
+        with self.__lock:
+            self.__tokens.clear()
+
+    def fail(self, status=None, count=1, route=None):
+        """Answer the next requests with an error.
+
+        Args:
+            status (optional[int]): status to answer with. Defaults to
+                error_status.
+            count (optional[int]): requests to fail. Defaults to 1.
+            route (optional[str]): only fail requests to route, ex. Job
+        """
+        with self.__lock:
+            self.__failures.extend([(status or self.error_status, route)] * count)
+
+    def login(self, user, pw):
+        """Token for credentials, or None if they are refused."""
+        if (self.user is not None and user != self.user) or \
+                (self.pw is not None and pw != self.pw):
+            return None
+        token = 'QSDK ' + uuid.uuid4().hex
+        with self.__lock:
+            self.__tokens[token] = time.time()
+        return token
+
+    def authorized(self, token):
+        with self.__lock:
+            issued = self.__tokens.get(token)
+            if issued is None:
+                return False
+            if self.token_ttl is not None and time.time() - issued > self.token_ttl:
+                del self.__tokens[token]
+                return False
+            return True
+
+    def logout(self, token):
+        with self.__lock:
+            self.__tokens.pop(token, None)
+
+    def before(self, route):
+        """Count a request, delay it and pick an injected error status.
+
+        Returns:
+            int: error status to answer with, or None
+        """
+        with self.__lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            delay = self.latency + (self.__rng.random() * self.jitter if self.jitter else 0)
+            status = None
+            for n, (failure_status, failure_route) in enumerate(self.__failures):
+                if failure_route is None or failure_route == route:
+                    status = failure_status
+                    del self.__failures[n]
+                    break
+            if status is None and self.error_rate and self.__rng.random() < self.error_rate:
+                status = self.error_status
+        if delay:
+            time.sleep(delay)
+        return status
+
+    def dispatch(self, method, route, segments, query, headers, body):
+        """Answer a request.
+
+        Returns:
+            tuple: (status, content type, body)
+        """
+        if route == 'Login' and method == 'POST':
+            try:
+                data = json.loads(body.decode('UTF-8'))
+                pw = b64decode(data['password']).decode('UTF-8')
+                token = self.login(data['username'], pw)
+            except (ValueError, KeyError, TypeError):
+                token = None
+            return self.__json(200, {'token': token} if token else {'errList': []})
+        token = headers.get('Authtoken')
+        if not self.authorized(token):
+            return 401, 'text/plain', b''
+        if route == 'Logout' and method == 'POST':
+            self.logout(token)
+            return 200, 'text/plain', b'User logged out'
+        if route == 'Client' and method == 'GET':
+            if len(segments) > 1:
+                return self.__client_properties(segments[1])
+            clients = [{'client': {'clientEntity': self.fleet.client(client_id)}}
+                       for client_id in self.fleet.client_ids()]
+            return self.__payload({'clientProperties': clients},
+                                  'App_GetClientPropertiesResponse')
+        if route == 'Subclient' and method == 'GET':
+            client_id = query.get('clientId', [None])[0]
+            subclients = []
+            if self.fleet.has_client(client_id):
+                subclients = [{'subClientEntity': entity}
+                              for entity in self.fleet.subclients(client_id)]
+            return self.__payload({'subClientProperties': subclients},
+                                  'App_GetSubClientPropertiesResponse')
+        if route == 'Job' and method == 'GET':
+            return self.__jobs(query)
+        if route == 'JobDetails' and method == 'POST':
+            return self.__job_details(headers, body)
+        return 404, 'text/plain', b''
+
+    def __json(self, status, data):
+        return status, 'application/json', json.dumps(data).encode('UTF-8')
+
+    def __payload(self, data, legacy_root):
+        if self.dialect == 'legacy':
+            data = {legacy_root: legacy(data)}
+        return self.__json(200, data)
+
+    def __client_properties(self, client_id):
+        props = []
+        if self.fleet.has_client(client_id):
+            client = self.fleet.client(client_id)
+            props = [{'client': {'clientEntity': client},
+                      'clientProps': {'activePhysicalNode': {'hostName': client['hostName']}}}]
+        if self.dialect == 'legacy':
+            root = 'App_GetClientPropertiesResponse'
+            body = to_xml(root, {'clientProperties': legacy(props)})
+            return 200, 'application/xml', body.encode('UTF-8')
+        return self.__json(200, {'clientProperties': props})
+
+    def __jobs(self, query):
+        client_id = query.get('clientId', [None])[0]
+        jobs = self.fleet.jobs(client_id) if self.fleet.has_client(client_id) else []
+        job_filter = query.get('jobFilter', [None])[0]
+        if job_filter:
+            types = set(t.strip().lower() for t in job_filter.split(','))
+            jobs = [job for job in jobs if job['jobType'].lower() in types]
+        lookup_time = query.get('completedJobLookupTime', [None])[0]
+        if lookup_time:
+            since = time.time() - int(lookup_time)
+            jobs = [job for job in jobs
+                    if job['status'] in ACTIVE_STATUSES or job['jobEndTime'] >= since]
+        data = {'totalRecordsWithoutPaging': len(jobs),
+                'jobs': [{'jobSummary': job} for job in jobs]}
+        return self.__payload(data, 'JobManager_JobListResponse')
+
+    def __job_details(self, headers, body):
+        text = body.decode('UTF-8')
+        xml = 'xml' in headers.get('Content-type', '')
+        if xml:
+            job_id = text.split('jobId="', 1)[-1].split('"', 1)[0]
+        else:
+            if self.dialect == 'legacy':
+                # older versions ignore json bodies on this route
+                return self.__json(200, {})
+            try:
+                job_id = json.loads(text)['JobManager_JobDetailRequest']['@jobId']
+            except (ValueError, KeyError, TypeError):
+                return 400, 'text/plain', b''
+        details = self.fleet.job_details(job_id)
+        data = {'job': {'jobDetail': details}}
+        if self.dialect == 'legacy':
+            data = {'JobManager_JobDetailResponse': {'job': {'jobDetail': legacy(details)}}}
+        return self.__json(200, data)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately; without this each
+    # keep-alive response stalls on delayed acks
+    disable_nagle_algorithm = True
+    commserve = None
+
+    def __handle(self, method):
+        split = urlsplit(self.path)
+        segments = [s for s in split.path.split('/') if s]
+        route = segments[0] if segments else ''
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        commserve = self.commserve
+        error = commserve.before(route)
+        if error is not None:
+            status, content_type, payload = error, 'text/plain', b''
+        else:
+            try:
+                status, content_type, payload = commserve.dispatch(
+                    method, route, segments, parse_qs(split.query), self.headers, body)
+            except Exception:
+                log.exception('Simulated CommServe failed on {} {}'.format(method, self.path))
+                status, content_type, payload = 500, 'text/plain', b''
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self.__handle('GET')
+
+    def do_POST(self):
+        self.__handle('POST')
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
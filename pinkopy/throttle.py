@@ -0,0 +1,301 @@
+from collections import deque, namedtuple
+import contextlib
+import functools
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITIES = (INTERACTIVE, BULK)
+
+WaitInfo = namedtuple('WaitInfo', ['requests', 'waited', 'wait_total', 'wait_max',
+                                   'in_flight', 'queued'])
+
+_local = threading.local()
+
+
+def current_priority():
+    """Priority of requests made by the calling thread."""
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+@contextlib.contextmanager
+def priority(name):
+    """Make requests in the calling thread at a priority.
+
+    Args:
+        name (str): 'interactive' or 'bulk'
+    """
+    if name not in PRIORITIES:
+        raise ValueError('Unknown priority {}'.format(name))
+    previous = current_priority()
+    _local.priority = name
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def bulk(func):
+    """Wrap func so requests it makes are queued as bulk.
+
+    For functions run in worker threads by sweeps, which do not inherit
+    the priority of the thread that started them.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with priority(BULK):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def route_of(path):
+    """Route of a request path, its first segment. ex. Job for Job/12"""
+    return path.lstrip('/').split('?', 1)[0].split('/', 1)[0]
+
+
+class TokenBucket(object):
+    """Token bucket rate limit.
+
+    Not thread safe; the Governor holding it serialises access.
+
+    Args:
+        rate (float): tokens added per second
+        burst (optional[int]): most tokens held. Defaults to rate, or 1
+            if rate is below 1.
+    """
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def __fill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available."""
+        self.__fill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        """Take a token. Check delay first."""
+        self.__fill(now)
+        self.tokens -= 1
+
+
+class Limit(object):
+    """Rate and in-flight limit of the requests it covers.
+
+    Args:
+        rate (optional[float]): requests per second
+        burst (optional[int]): requests allowed at once above rate
+        max_in_flight (optional[int]): requests outstanding at once
+
+    Returns:
+        limit object
+    """
+    def __init__(self, rate=None, burst=None, max_in_flight=None):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+
+    @classmethod
+    def coerce(cls, obj):
+        """Limit from a Limit, or a dict of its arguments."""
+        if isinstance(obj, cls):
+            return obj
+        return cls(**obj)
+
+    def delay(self, now):
+        """Seconds until a request may start, or None if it must wait
+        for another to finish."""
+        if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+            return None
+        if self.bucket is None:
+            return 0
+        return self.bucket.delay(now)
+
+    def take(self, now):
+        if self.bucket is not None:
+            self.bucket.take(now)
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+
+
+class _Waiter(object):
+    __slots__ = ('route', 'priority')
+
+    def __init__(self, route, priority):
+        self.route = route
+        self.priority = priority
+
+
+class Governor(object):
+    """Limit the rate and concurrency of requests to the CommServe.
+
+    Requests wait in the order they arrive, one queue per priority.
+    When both queues hold requests that could start, interactive
+    requests go first, but a bulk request is let through after every
+    interactive_share interactive ones so a sweep is slowed rather than
+    stopped. A request whose route is at its limit does not hold up
+    requests to other routes behind it.
+
+    Args:
+        rate (optional[float]): requests per second over all routes
+        burst (optional[int]): requests allowed at once above rate
+        max_in_flight (optional[int]): requests outstanding at once
+            over all routes
+        routes (optional[dict]): Limit, or dict of rate, burst and
+            max_in_flight, by route, ex. {'JobDetails': {'rate': 5}}
+        interactive_share (optional[int]): interactive requests let
+            through for each bulk request when both wait. Defaults to 4.
+
+    Returns:
+        governor object
+    """
+    def __init__(self, rate=None, burst=None, max_in_flight=None, routes=None,
+                 interactive_share=4):
+        self.limit = Limit(rate, burst, max_in_flight)
+        self.routes = {route: Limit.coerce(limit) for route, limit in (routes or {}).items()}
+        self.interactive_share = interactive_share
+        self.__cond = threading.Condition()
+        self.__queues = {name: deque() for name in PRIORITIES}
+        self.__streak = 0
+        self.__stats = {}
+
+    def __limits(self, route):
+        limit = self.routes.get(route)
+        return (self.limit,) if limit is None else (self.limit, limit)
+
+    def __delay(self, waiter, now):
+        delays = [limit.delay(now) for limit in self.__limits(waiter.route)]
+        if None in delays:
+            return None
+        return max(delays)
+
+    def __order(self):
+        interactive, bulk_ = self.__queues[INTERACTIVE], self.__queues[BULK]
+        if bulk_ and self.__streak >= self.interactive_share:
+            return (bulk_, interactive)
+        return (interactive, bulk_)
+
+    def __next(self, now):
+        """First waiter, in fair order, that may start now."""
+        for queue in self.__order():
+            for waiter in queue:
+                if self.__delay(waiter, now) == 0:
+                    return waiter
+        return None
+
+    def acquire(self, route, priority=None):
+        """Wait for a request to route to be allowed to start.
+
+        Args:
+            route (str): route, ex. Job
+            priority (optional[str]): 'interactive' or 'bulk'. Defaults
+                to the priority of the calling thread.
+
+        Returns:
+            float: seconds waited, 0 if a slot was free at once
+        """
+        priority = priority or current_priority()
+        start = time.monotonic()
+        waiter = _Waiter(route, priority)
+        blocked = False
+        with self.__cond:
+            self.__queues[priority].append(waiter)
+            while True:
+                now = time.monotonic()
+                if self.__next(now) is waiter:
+                    break
+                blocked = True
+                self.__cond.wait(self.__delay(waiter, now) or None)
+            self.__queues[priority].remove(waiter)
+            for limit in self.__limits(route):
+                limit.take(now)
+            if priority == BULK:
+                self.__streak = 0
+            elif self.__queues[BULK]:
+                self.__streak += 1
+            # time taken to get the lock is not waiting on the limits
+            waited = now - start if blocked else 0.0
+            self.__record(route, waited)
+            self.__cond.notify_all()
+        if waited > 0.1:
+            log.debug('{} request to {} waited {:.3f}s'.format(priority, route, waited))
+        return waited
+
+    def release(self, route):
+        """Mark a request to route finished.
+
+        Args:
+            route (str): route, ex. Job
+        """
+        with self.__cond:
+            for limit in self.__limits(route):
+                limit.release()
+            self.__stats[route][4] -= 1
+            self.__cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, route, priority=None):
+        """Hold a request slot for route while in context."""
+        self.acquire(route, priority)
+        try:
+            yield
+        finally:
+            self.release(route)
+
+    def __record(self, route, waited):
+        # requests, waited, wait_total, wait_max, in_flight
+        stats = self.__stats.setdefault(route, [0, 0, 0.0, 0.0, 0])
+        stats[0] += 1
+        stats[4] += 1
+        if waited > 0:
+            stats[1] += 1
+        stats[2] += waited
+        stats[3] = max(stats[3], waited)
+
+    def info(self, route=None):
+        """Queue wait statistics.
+
+        Args:
+            route (optional[str]): route. Defaults to all routes.
+
+        Returns:
+            WaitInfo: requests, waited, wait_total, wait_max,
+                in_flight, queued
+        """
+        with self.__cond:
+            routes = [route] if route is not None else list(self.__stats)
+            stats = [self.__stats.get(r, [0, 0, 0.0, 0.0, 0]) for r in routes]
+            waiters = [w for queue in self.__queues.values() for w in queue
+                       if route is None or w.route == route]
+            return WaitInfo(sum(s[0] for s in stats),
+                            sum(s[1] for s in stats),
+                            sum(s[2] for s in stats),
+                            max([s[3] for s in stats] or [0.0]),
+                            sum(s[4] for s in stats),
+                            len(waiters))
+
+    def stats(self):
+        """Queue wait statistics by route.
+
+        Returns:
+            dict: WaitInfo by route
+        """
+        with self.__cond:
+            routes = list(self.__stats)
+        return {route: self.info(route) for route in routes}
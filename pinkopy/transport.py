@@ -0,0 +1,68 @@
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger(__name__)
+
+
+class HTTPTransport(object):
+    """Pooled keep-alive HTTP transport.
+
+    Sessions hand every request to a transport rather than calling the
+    module level requests functions, so connections to the CommServe
+    are pooled and reused instead of being opened for every call. Any
+    object providing ``request`` and ``close`` with the same signatures
+    may be used in place of this one.
+
+    Args:
+        pool_connections (optional[int]): number of host pools to cache.
+            Defaults to 10.
+        pool_maxsize (optional[int]): connections kept per host pool.
+            Defaults to 10.
+        keep_alive (optional[bool]): reuse connections between requests.
+            Defaults to True.
+        adapter (optional[requests.adapters.BaseAdapter]): adapter to
+            mount instead of the default pooled HTTPAdapter
+
+    Returns:
+        transport object
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10, keep_alive=True,
+                 adapter=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = bool(keep_alive)
+        self.adapter = adapter or HTTPAdapter(pool_connections=pool_connections,
+                                              pool_maxsize=pool_maxsize)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        if not self.keep_alive:
+            self.session.headers['Connection'] = 'close'
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def request(self, method, url, **kwargs):
+        """Send request over the pooled session.
+
+        Args:
+            method (str): HTTP method
+            url (str): full url
+            **kwargs: passed through to requests.Session.request
+
+        Returns:
+            response object
+        """
+        return self.session.request(method, url, **kwargs)
+
+    def close(self):
+        """Close pooled connections."""
+        if not self.closed:
+            self.session.close()
+            self.closed = True
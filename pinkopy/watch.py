@@ -0,0 +1,188 @@
+from collections import namedtuple
+import logging
+import threading
+import time
+
+from .concurrency import imap_unordered
+from .records import JobSummary
+from .throttle import bulk
+
+log = logging.getLogger(__name__)
+
+JobEvent = namedtuple('JobEvent', ['kind', 'client_id', 'job', 'error'])
+JobEvent.__doc__ = """Change seen by a JobWatcher.
+
+kind is 'new' for a job not seen before, 'changed' for a known job
+whose status or progress moved, or 'error' if the client could not be
+polled, in which case error holds the exception and job is None.
+"""
+
+ACTIVE_STATUSES = frozenset(['Pending', 'Queued', 'Running', 'Suspended', 'Waiting'])
+
+
+class _ClientState(object):
+    """Poll state of one client."""
+    def __init__(self, interval):
+        self.watermark = None
+        self.jobs = None
+        self.active = False
+        self.interval = interval
+        self.last_poll = None
+        self.next_poll = 0
+
+
+class JobWatcher(object):
+    """Poll clients for job changes.
+
+    Keeps, per client, the latest job start time seen and the state of
+    the jobs in the last response, and reports only jobs that are new
+    or whose status or progress changed. After the first poll, only
+    jobs completed since the previous poll are requested. Clients with
+    active jobs are polled every min_interval; clients without are
+    polled less often, backing off up to max_interval.
+
+    Args:
+        session: JobSession, or CommvaultSession, to poll with
+        client_ids (iterable): clients to watch
+        job_filter (optional[str]): job filter, ex. backup, restore
+        min_interval (optional[int]): seconds between polls of a client
+            with active jobs. Defaults to 60.
+        max_interval (optional[int]): most seconds between polls of an
+            idle client. Defaults to 900.
+        backoff (optional[float]): factor the interval of an idle client
+            grows by each poll. Defaults to 2.
+        concurrency (optional[int]): concurrent requests. Defaults to 8.
+        emit_initial (optional[bool]): report jobs found on the first
+            poll of a client as new. Defaults to False, where the first
+            poll only records the baseline.
+
+    Returns:
+        watcher object
+    """
+    def __init__(self, session, client_ids, job_filter=None, min_interval=60,
+                 max_interval=900, backoff=2, concurrency=8, emit_initial=False):
+        jobs = getattr(session, 'jobs', session)
+        # always poll the CommServe, not the cache
+        self.get_jobs = getattr(jobs.get_jobs, '__wrapped__', jobs.get_jobs)
+        self.job_filter = job_filter
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.concurrency = concurrency
+        self.emit_initial = emit_initial
+        self.states = {}
+        for client_id in client_ids:
+            self.add(client_id)
+
+    def add(self, client_id):
+        """Watch another client, polling it next.
+
+        Args:
+            client_id (str): client id
+        """
+        self.states.setdefault(str(client_id), _ClientState(self.min_interval))
+
+    def remove(self, client_id):
+        """Stop watching a client.
+
+        Args:
+            client_id (str): client id
+        """
+        self.states.pop(str(client_id), None)
+
+    def next_poll(self):
+        """Time the next client is due, as a timestamp."""
+        if not self.states:
+            return None
+        return min(state.next_poll for state in self.states.values())
+
+    def poll(self, now=None):
+        """Poll clients that are due.
+
+        Args:
+            now (optional[float]): current timestamp. Defaults to now.
+
+        Returns:
+            list: JobEvents
+        """
+        now = time.time() if now is None else now
+        due = [client_id for client_id, state in self.states.items()
+               if state.next_poll <= now]
+        events = []
+        for client_id, jobs in imap_unordered(bulk(lambda client_id: self._fetch(client_id, now)),
+                                              due, max_workers=self.concurrency):
+            state = self.states.get(client_id)
+            if state is None:
+                continue
+            if isinstance(jobs, Exception):
+                log.error('Could not poll jobs for client {}: {}'.format(client_id, jobs))
+                events.append(JobEvent('error', client_id, None, jobs))
+                state.next_poll = now + state.interval
+                continue
+            events.extend(self._update(client_id, state, jobs, now))
+        return events
+
+    def watch(self, stop=None):
+        """Poll continuously, yielding events as they are found.
+
+        Args:
+            stop (optional[threading.Event]): set to end watching
+
+        Yields:
+            JobEvent
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            for event in self.poll():
+                yield event
+            next_poll = self.next_poll()
+            wait = self.min_interval if next_poll is None else next_poll - time.time()
+            if wait > 0:
+                stop.wait(wait)
+
+    def _fetch(self, client_id, now):
+        state = self.states[client_id]
+        lookup_time = None
+        if state.last_poll is not None:
+            # overlap the previous window so no completion falls between
+            lookup_time = now - state.last_poll + self.min_interval
+        return self.get_jobs(client_id, job_filter=self.job_filter, lookup_time=lookup_time)
+
+    def _update(self, client_id, state, jobs, now):
+        """Compare a response with the client's state and advance it."""
+        events = []
+        first = state.jobs is None
+        known = state.jobs or {}
+        current = {}
+        watermark = state.watermark
+        active = False
+        for job in jobs:
+            summary = JobSummary.coerce(job)
+            signature = (summary.status, summary.percent_complete,
+                         summary.last_update_time, summary.end_time)
+            current[summary.job_id] = signature
+            if summary.status in ACTIVE_STATUSES:
+                active = True
+            if summary.start_time is not None and (watermark is None
+                                                   or summary.start_time > watermark):
+                watermark = summary.start_time
+            if summary.job_id in known:
+                if known[summary.job_id] != signature:
+                    events.append(JobEvent('changed', client_id, job, None))
+            elif first:
+                if self.emit_initial:
+                    events.append(JobEvent('new', client_id, job, None))
+            elif (state.watermark is None or summary.start_time is None
+                  or summary.start_time > state.watermark
+                  or summary.status in ACTIVE_STATUSES):
+                events.append(JobEvent('new', client_id, job, None))
+        state.jobs = current
+        state.watermark = watermark
+        state.active = active
+        if active:
+            state.interval = self.min_interval
+        else:
+            state.interval = min(state.interval * self.backoff, self.max_interval)
+        state.last_poll = now
+        state.next_poll = now + state.interval
+        return events
@@ -16,6 +16,11 @@ install_requires = [
     'xmltodict>=0.9.2',
 ]
 
+extras_require = {
+    'async': ['aiohttp>=3.0'],
+    'fast': ['orjson'],
+}
+
 tests_require = [
     'pytest',
     'requests-mock==0.7.0'
@@ -32,8 +37,13 @@ setup(
     download_url='https://github.com/theherk/pinkopy/archive/2.2.dev.zip',
     packages=find_packages(),
     platforms=['all'],
+    python_requires='>=3.7',
     license='MIT',
     install_requires=install_requires,
+    extras_require=extras_require,
+    entry_points={
+        'console_scripts': ['pinkopy = pinkopy.cli:main'],
+    },
     setup_requires=['pytest-runner'],
     tests_require=tests_require,
     classifiers=[
@@ -46,10 +56,13 @@ setup(
         'Operating System :: MacOS :: MacOS X',
         'Operating System :: Unix',
         'Operating System :: POSIX',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Topic :: Utilities',
     ],
 )
@@ -0,0 +1,122 @@
+import asyncio
+import unittest
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+
+from pinkopy.aio import AsyncAuthenticator, AsyncCommvaultSession
+
+
+def make_app(state):
+    async def login(request):
+        state['logins'] += 1
+        return web.json_response({'token': 'token{}'.format(state['logins'])})
+
+    async def logout(request):
+        return web.json_response({})
+
+    async def clients(request):
+        if request.headers.get('Authtoken') != 'token{}'.format(state['logins']):
+            return web.Response(status=401)
+        state['client_calls'] += 1
+        return web.json_response({'clientProperties': state['clients']})
+
+    async def subclients(request):
+        body = ('<App_GetSubClientPropertiesResponse><subClientProperties>'
+                '<subClientEntity subclientId="5"/></subClientProperties>'
+                '</App_GetSubClientPropertiesResponse>')
+        return web.Response(text=body, content_type='application/xml')
+
+    async def job_details(request):
+        # like older versions, which ignore json bodies on this route
+        state['job_detail_formats'].append(request.content_type)
+        if 'xml' not in request.content_type:
+            return web.json_response({})
+        body = ('<JobManager_JobDetailResponse><job><jobDetail><generalInfo jobId="7" '
+                'status="Completed"/></jobDetail></job></JobManager_JobDetailResponse>')
+        return web.Response(text=body, content_type='application/xml')
+
+    app = web.Application()
+    app.router.add_post('/Login', login)
+    app.router.add_post('/Logout', logout)
+    app.router.add_get('/Client', clients)
+    app.router.add_get('/Subclient', subclients)
+    app.router.add_post('/JobDetails', job_details)
+    return app
+
+
+async def serve(state):
+    runner = web.AppRunner(make_app(state))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, 'http://127.0.0.1:{}/'.format(port)
+
+
+class TestAsyncAuthenticatorMethods(unittest.TestCase):
+    def test_refresh_single_flight(self):
+        calls = []
+
+        async def login():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'token{}'.format(len(calls))
+
+        async def run():
+            auth = AsyncAuthenticator(login, token='token0')
+            return await asyncio.gather(*[auth.refresh(stale='token0') for _ in range(8)])
+
+        assert asyncio.run(run()) == ['token1'] * 8
+        assert len(calls) == 1
+
+
+class TestAsyncCommvaultSessionMethods(unittest.TestCase):
+    def test_session(self):
+        clients = [{'client': {'clientEntity': {'clientId': 1, 'clientName': 'one'}}}]
+        state = {'logins': 0, 'client_calls': 0, 'clients': clients}
+
+        async def run():
+            runner, service = await serve(state)
+            try:
+                async with AsyncCommvaultSession(service, 'user', 'pw',
+                                                 max_concurrency=4) as session:
+                    results = await asyncio.gather(*[session.get_clients() for _ in range(3)])
+                    assert all(r == clients for r in results)
+                    assert await session.get_client('1') == clients[0]
+                    # expire token server side
+                    state['logins'] += 1
+                    session.clear_cache()
+                    assert await session.get_clients() == clients
+                    subclients = await session.get_subclients('1')
+                    assert subclients['subClientEntity']['@subclientId'] == '5'
+            finally:
+                await runner.cleanup()
+
+        asyncio.run(run())
+        assert state['logins'] == 3
+
+    def test_get_job_details_legacy(self):
+        state = {'logins': 0, 'job_detail_formats': []}
+
+        async def run():
+            runner, service = await serve(state)
+            try:
+                async with AsyncCommvaultSession(service, 'user', 'pw') as session:
+                    details = await session.get_job_details('7')
+                    assert details['generalInfo']['@status'] == 'Completed'
+                    # the xml request that worked is made first from now on
+                    session.clear_cache()
+                    await session.get_job_details('7')
+            finally:
+                await runner.cleanup()
+
+        asyncio.run(run())
+        assert state['job_detail_formats'] == ['application/json', 'application/xml',
+                                               'application/xml']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import threading
+import time
+import unittest
+
+from pinkopy.auth import Authenticator
+
+
+class TestAuthenticatorMethods(unittest.TestCase):
+    def test_refresh_single_flight(self):
+        calls = []
+
+        def login():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'token{}'.format(len(calls))
+
+        auth = Authenticator(login, token='token0')
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(auth.refresh(stale='token0')))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert results == ['token1'] * 8
+        assert auth.token == 'token1'
+
+    def test_refresh_forced(self):
+        auth = Authenticator(lambda: 'new', token='old')
+        assert auth.refresh() == 'new'
+        assert auth.logins == 1
+
+    def test_token_expiring(self):
+        auth = Authenticator(lambda: 'new', token='old', token_ttl=30, refresh_margin=60)
+        assert auth.expiring
+        assert auth.token == 'new'
+
+    def test_clear(self):
+        auth = Authenticator(lambda: 'new', token='old')
+        auth.clear()
+        assert auth.token is None
+
+
+if __name__ == '__main__':
+    unittest.main()
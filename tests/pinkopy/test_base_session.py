@@ -1,6 +1,8 @@
 import inspect
 import unittest
 
+import requests_mock
+
 from pinkopy.base_session import BaseSession
 from tests.pinkopy import test_helper
 
@@ -22,8 +24,17 @@ class TestBaseSessionMethods(unittest.TestCase):
         pass
 
     def test_request(self):
-        # not yet implemented
-        pass
+        test_data = test_helper.mock_session(BaseSession)
+        base_session = test_data['Session']
+        service = test_data['Service']
+        with requests_mock.mock() as m:
+            m.get(service + '/Client', [{'status_code': 401}, {'json': {'ok': True}}])
+            m.post(service + '/Login', json={'token': 'fresh'})
+            res = base_session.request('GET', 'Client')
+            assert res.json() == {'ok': True}
+            assert base_session.headers['Authtoken'] == 'fresh'
+            assert 'Authtoken' not in m.request_history[1].headers
+            assert m.request_history[2].headers['Authtoken'] == 'fresh'
 
 
 if __name__ == '__main__':
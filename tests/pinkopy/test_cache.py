@@ -0,0 +1,196 @@
+import threading
+import time
+import unittest
+
+import pytest
+import requests
+
+from pinkopy.cache import SessionCache, SingleFlight
+from pinkopy.exceptions import raise_requests_error
+
+
+class Counter(object):
+    def __init__(self):
+        self.calls = 0
+
+    def get_jobs(self, client_id, job_filter=None, last=None):
+        self.calls += 1
+        return [client_id, job_filter, last, self.calls]
+
+
+def run_threads(target, count=10):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class TestSingleFlightMethods(unittest.TestCase):
+    def test_do(self):
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'value'
+
+        run_threads(lambda: results.append(flight.do('key', slow)))
+        assert len(calls) == 1
+        assert sorted(results) == [('value', False)] + [('value', True)] * 9
+
+    def test_do_error(self):
+        flight = SingleFlight()
+        errors = []
+
+        def fail():
+            time.sleep(0.05)
+            raise ValueError('nope')
+
+        def call():
+            try:
+                flight.do('key', fail)
+            except ValueError as err:
+                errors.append(err)
+
+        run_threads(call, count=4)
+        assert len(errors) == 4
+        with pytest.raises(ValueError):
+            flight.do('key', fail)
+
+
+class TestSessionCacheMethods(unittest.TestCase):
+    def test_wrap_coalesced(self):
+        cache = SessionCache()
+        calls = []
+
+        def get_clients():
+            calls.append(1)
+            time.sleep(0.05)
+            return ['client']
+
+        get_clients = cache.wrap('get_clients', get_clients)
+        run_threads(get_clients)
+        assert len(calls) == 1
+        assert get_clients.cache_info().coalesced == 9
+
+    def test_wrap(self):
+        cache = SessionCache()
+        counter = Counter()
+        get_jobs = cache.wrap('get_jobs', counter.get_jobs)
+        assert get_jobs('1') == get_jobs(client_id='1', job_filter=None)
+        assert counter.calls == 1
+        info = get_jobs.cache_info()
+        assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+        get_jobs.cache_clear()
+        get_jobs('1')
+        assert counter.calls == 2
+
+    def test_eviction(self):
+        cache = SessionCache(max_entries=2)
+        get_jobs = cache.wrap('get_jobs', Counter().get_jobs)
+        for client_id in ('1', '2', '1', '3'):
+            get_jobs(client_id)
+        assert cache.peek('get_jobs', '1')[0]
+        assert not cache.peek('get_jobs', '2')[0]
+        assert cache.info('get_jobs').evictions == 1
+        assert len(cache) == 2
+
+    def test_max_bytes(self):
+        cache = SessionCache(max_bytes=100)
+        cache.set(('get_clients',), ['x' * 60])
+        cache.set(('get_jobs', '1'), ['y' * 60])
+        assert not cache.get(('get_clients',))[0]
+        assert cache.get(('get_jobs', '1'))[0]
+        cache.set(('get_jobs', '2'), ['z' * 200])
+        assert not cache.get(('get_jobs', '2'))[0]
+
+    def test_ttls(self):
+        cache = SessionCache(ttl=60, ttls={'get_jobs': 0.01})
+        cache.set(('get_clients',), 'clients')
+        cache.set(('get_jobs', '1'), 'jobs')
+        time.sleep(0.02)
+        assert cache.get(('get_clients',)) == (True, 'clients')
+        assert cache.get(('get_jobs', '1')) == (False, None)
+
+    def test_refresh_ahead(self):
+        cache = SessionCache(ttl=0.2, refresh_ahead=0.25)
+        counter = Counter()
+        get_jobs = cache.wrap('get_jobs', counter.get_jobs)
+        assert get_jobs('1')[-1] == 1
+        time.sleep(0.06)
+        # due for refresh: still served the cached value
+        assert get_jobs('1')[-1] == 1
+        for _ in range(100):
+            if counter.calls == 2:
+                break
+            time.sleep(0.01)
+        time.sleep(0.01)
+        assert get_jobs('1')[-1] == 2
+
+    def test_negative_ttl(self):
+        calls = []
+
+        def get_client(client_id):
+            calls.append(client_id)
+            if client_id == 'gone':
+                raise_requests_error(404, 'Client gone not in client list.')
+            if client_id == 'down':
+                raise_requests_error(500, 'down')
+            return client_id
+
+        cache = SessionCache(ttl=60, negative_ttl=0.05)
+        get_client = cache.wrap('get_client', get_client)
+        for _ in range(2):
+            with pytest.raises(requests.HTTPError) as err:
+                get_client('gone')
+            assert err.value.response.status_code == 404
+            assert str(err.value) == 'Client gone not in client list.'
+            with pytest.raises(requests.HTTPError):
+                get_client('down')
+        assert calls == ['gone', 'down', 'down']
+        with pytest.raises(requests.HTTPError):
+            cache.peek('get_client', 'gone')
+        time.sleep(0.06)
+        with pytest.raises(requests.HTTPError):
+            get_client('gone')
+        assert calls.count('gone') == 2
+
+    def test_negative_ttl_disabled(self):
+        calls = []
+
+        def get_client(client_id):
+            calls.append(client_id)
+            raise_requests_error(404, 'gone')
+
+        get_client = SessionCache().wrap('get_client', get_client)
+        for _ in range(2):
+            with pytest.raises(requests.HTTPError):
+                get_client('gone')
+        assert len(calls) == 2
+
+    def test_invalidate(self):
+        cache = SessionCache()
+        counter = Counter()
+        get_jobs = cache.wrap('get_jobs', counter.get_jobs)
+        get_jobs('1')
+        get_jobs('2')
+        assert cache.invalidate('get_jobs', client_id='1') == 1
+        assert not cache.peek('get_jobs', '1')[0]
+        assert cache.peek('get_jobs', '2')[0]
+        assert cache.invalidate('get_jobs') == 1
+        cache.set(('get_clients',), 'clients')
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_unhashable(self):
+        cache = SessionCache()
+        wrapped = cache.wrap('f', lambda items: len(items))
+        assert wrapped([1, 2]) == 2
+        assert len(cache) == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import pytest
+
+from pinkopy.capabilities import Capabilities, unwrap
+from pinkopy.commvault import CommvaultSession
+from pinkopy.testing import Fleet, SimulatedCommServe
+
+
+class TestModuleMethods(unittest.TestCase):
+    def test_unwrap(self):
+        assert unwrap({'jobs': [1]}, 'jobs', 'Root') == [1]
+        assert unwrap({'Root': {'jobs': [2]}}, 'jobs', 'Root') == [2]
+        with pytest.raises(KeyError):
+            unwrap({'Root': {'jobs': [2]}}, 'jobs', 'Root', dialect='json')
+
+
+class TestCapabilitiesMethods(unittest.TestCase):
+    def test_attempt(self):
+        capabilities = Capabilities()
+        tried = []
+
+        def func(option):
+            tried.append(option)
+            if option == 'json':
+                raise KeyError(option)
+            return option
+
+        key = ('JobDetails', 'request')
+        assert capabilities.attempt(key, ('json', 'xml'), func) == 'xml'
+        assert capabilities.attempt(key, ('json', 'xml'), func) == 'xml'
+        assert tried == ['json', 'xml', 'xml']
+        assert capabilities.as_dict() == {key: 'xml'}
+        with pytest.raises(KeyError):
+            Capabilities().attempt(key, ('json',), func)
+
+
+class TestSessionCapabilities(unittest.TestCase):
+    def test_legacy(self):
+        with SimulatedCommServe(Fleet(clients=2, jobs_per_client=5), dialect='legacy') as server:
+            with CommvaultSession(service=server.url, user='user', pw='pw') as commvault:
+                for job_id in ('1000000', '1000001', '2000000'):
+                    assert commvault.get_job_details(job_id)
+                # only the first job needed a second, xml request
+                assert server.requests['JobDetails'] == 4
+                assert commvault.get_client_properties('1')
+                assert commvault.capabilities.get(('Client/{id}', 'response')) == 'xml'
+                assert commvault.capabilities.get(('Job', 'dialect')) is None
+                commvault.get_jobs('1')
+                assert commvault.capabilities.get(('Job', 'dialect')) == 'legacy'
+
+
+if __name__ == '__main__':
+    unittest.main()
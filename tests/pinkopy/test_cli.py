@@ -0,0 +1,71 @@
+import csv
+import io
+import json
+import os
+import unittest
+from unittest import mock
+
+from pinkopy.cache import SessionCache
+from pinkopy.cli import main
+from pinkopy.testing import Fleet, SimulatedCommServe
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.server = SimulatedCommServe(Fleet(clients=3, jobs_per_client=4)).start()
+        env = mock.patch.dict(os.environ, {'PINKOPY_SERVICE': self.server.url,
+                                           'PINKOPY_USER': 'user',
+                                           'PINKOPY_PASSWORD': 'pw'})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def run_cli(self, *argv, **kwargs):
+        out = io.StringIO()
+        status = main(list(argv), stdout=out, stdin=io.StringIO(kwargs.get('stdin', '')))
+        return status, out.getvalue()
+
+    def test_clients(self):
+        status, out = self.run_cli('clients')
+        assert status == 0
+        rows = [json.loads(line) for line in out.splitlines()]
+        assert [row['client_id'] for row in rows] == ['1', '2', '3']
+
+    def test_jobs_csv(self):
+        status, out = self.run_cli('--format', 'csv', 'jobs', '--last', '2',
+                                   '--fields', 'client_id,job_id')
+        assert status == 0
+        rows = list(csv.DictReader(io.StringIO(out)))
+        assert len(rows) == 6
+        assert set(rows[0]) == {'client_id', 'job_id'}
+        assert sorted(set(row['client_id'] for row in rows)) == ['1', '2', '3']
+
+    def test_jobs_not_cached(self):
+        with mock.patch.object(SessionCache, 'set', autospec=True,
+                               side_effect=SessionCache.set) as cache_set:
+            status, out = self.run_cli('jobs', '--client', '1', '--client', '2')
+        assert status == 0
+        assert len(out.splitlines()) == 8
+        assert [c for c in cache_set.call_args_list if c[0][1][0] == 'get_jobs'] == []
+        self.server.fail(status=404, route='Job')
+        status, out = self.run_cli('jobs', '--client', '1', '--client', '2', '--concurrency', '1')
+        assert status == 1
+        assert len(out.splitlines()) == 4
+
+    def test_job_details_from_stdin(self):
+        status, out = self.run_cli('job-details', '-', stdin='1000000\n2000001 3000002\n')
+        assert status == 0
+        job_ids = sorted(json.loads(line)['job_id'] for line in out.splitlines())
+        assert job_ids == ['1000000', '2000001', '3000002']
+
+    def test_failures(self):
+        self.server.fail(status=404, route='Subclient')
+        status, out = self.run_cli('subclients', '--client', '1', '--client', '2')
+        assert status == 1
+        assert len(out.splitlines()) == 3
+
+
+if __name__ == '__main__':
+    unittest.main()
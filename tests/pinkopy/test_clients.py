@@ -0,0 +1,60 @@
+import unittest
+
+import pytest
+import requests
+import requests_mock
+
+from pinkopy.clients import ClientIndex, ClientSession
+from tests.pinkopy import test_helper
+
+
+def make_client(client_id, name, hostname, prefix=''):
+    return {
+        'client': {
+            'clientEntity': {
+                prefix + 'clientId': client_id,
+                prefix + 'clientName': name,
+                prefix + 'hostName': hostname
+            }
+        }
+    }
+
+
+class TestClientIndexMethods(unittest.TestCase):
+    def test__init__(self):
+        clients = [make_client(1, 'one', 'One.example.com'),
+                   make_client(2, 'two', 'two.example.com')]
+        index = ClientIndex(clients)
+        assert len(index) == 2
+        assert index.get('1') is clients[0]
+        assert index.get(2) is clients[1]
+        assert index.get_by_name('two') is clients[1]
+        assert index.get_by_name('one.example.com') is clients[0]
+        assert index.get('3') is None
+
+    def test__init__legacy(self):
+        clients = [make_client('1', 'one', 'one.example.com', prefix='@')]
+        index = ClientIndex(clients)
+        assert index.get('1') is clients[0]
+        assert index.get_by_name('one') is clients[0]
+
+
+class TestClientSessionMethods(unittest.TestCase):
+    def test_get_client(self):
+        clients = [make_client(1, 'one', 'one.example.com'),
+                   make_client(2, 'two', 'two.example.com')]
+        test_data = test_helper.mock_session(ClientSession, clients=clients)
+        session = test_data['Session']
+        with requests_mock.mock() as m:
+            m.get(test_data['Service'] + '/Client', json={'clientProperties': clients})
+            assert session.get_client('2') == clients[1]
+            assert session.get_client_by_name('one') == clients[0]
+            index = session.get_client_index()
+            assert index is session.get_client_index()
+            with pytest.raises(requests.HTTPError):
+                session.get_client('3')
+            assert m.call_count == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,10 +13,12 @@ class TestCommvaultSessionMethods(unittest.TestCase):
 
         # validate shim
         assert commvault.get_client == commvault.clients.get_client
+        assert commvault.get_client_by_name == commvault.clients.get_client_by_name
         assert commvault.get_client_properties == commvault.clients.get_client_properties
         assert commvault.get_clients == commvault.clients.get_clients
         assert commvault.get_subclients == commvault.subclients.get_subclients
         assert commvault.get_job_details == commvault.jobs.get_job_details
+        assert commvault.get_job_details_many == commvault.jobs.get_job_details_many
         assert commvault.get_job_vmstatus == commvault.jobs.get_job_vmstatus
         assert commvault.get_jobs == commvault.jobs.get_jobs
         assert commvault.get_subclient_jobs == commvault.jobs.get_subclient_jobs
@@ -26,11 +28,68 @@ class TestCommvaultSessionMethods(unittest.TestCase):
         test_helper.validate_base_session(expected, commvault.clients)
         test_helper.validate_base_session(expected, commvault.jobs)
         test_helper.validate_base_session(expected, commvault.subclients)
+        for session in commvault.subsessions:
+            assert session.transport is commvault.transport
+            assert session.cache is commvault.cache
+
+    def test_lazy_subsessions(self):
+        commvault = test_helper.mock_session(CommvaultSession)['Session']
+        assert not set(vars(commvault)).intersection(['clients', 'subclients', 'jobs'])
+        get_jobs = commvault.get_jobs
+        assert get_jobs == commvault.jobs.get_jobs
+        assert commvault.jobs is commvault.jobs
+        assert 'clients' not in vars(commvault)
+        with self.assertRaises(AttributeError):
+            commvault.no_such_method
 
     def test__enter__(self):
         session = test_helper.mock_session(CommvaultSession)['Session']
         assert session == session.__enter__()
 
+    def test_iter_all_jobs(self):
+        clients = [{'client': {'clientEntity': {'clientId': i}}} for i in range(1, 4)]
+        test_data = test_helper.mock_session(CommvaultSession, clients=clients)
+        session = test_data['Session']
+        service = test_data['Service']
+
+        def jobs_response(request, context):
+            client_id = request.qs['clientid'][0]
+            if client_id == '3':
+                context.status_code = 500
+                return {}
+            return {'jobs': [{'jobSummary': {'jobId': client_id + str(n),
+                                             'subclient': {'subclientName': 'sc'}}}
+                             for n in range(2)]}
+
+        with requests_mock.mock() as m:
+            m.get(service + '/Client', json={'clientProperties': clients})
+            m.get(service + '/Job', json=jobs_response)
+            results = list(session.iter_all_jobs(concurrency=2))
+        jobs = sorted(job['jobSummary']['jobId'] for client_id, job in results
+                      if not isinstance(job, Exception))
+        errors = [client_id for client_id, job in results if isinstance(job, Exception)]
+        assert jobs == ['10', '11', '20', '21']
+        assert errors == ['3']
+        # the sweep is not kept in the cache
+        assert session.cache.info('get_jobs').currsize == 0
+
+    def test_warm(self):
+        clients = [{'client': {'clientEntity': {'clientId': i}}} for i in range(1, 4)]
+        test_data = test_helper.mock_session(CommvaultSession, clients=clients)
+        session = test_data['Session']
+        service = test_data['Service']
+        with requests_mock.mock() as m:
+            m.get(service + '/Client', json={'clientProperties': clients})
+            m.get(service + '/Subclient', json={'subClientProperties': ['sc']})
+            m.get(service + '/Job', json={'jobs': []})
+            m.get(service + '/Job?clientId=2', status_code=500)
+            errors = session.warm(concurrency=4)
+            assert list(errors) == [('get_jobs', '2')]
+            count = m.call_count
+            assert session.get_subclients('3') == ['sc']
+            assert session.get_jobs('1') == []
+            assert m.call_count == count
+
     def test_logout(self):
         test_data = test_helper.mock_session(CommvaultSession)
         session = test_data['Session']
@@ -40,6 +99,7 @@ class TestCommvaultSessionMethods(unittest.TestCase):
             result = session.logout()
             assert result is None
             assert session.headers['Authtoken'] is None
+            assert session.transport.closed
 
 
 if __name__ == '__main__':
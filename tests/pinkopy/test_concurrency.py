@@ -0,0 +1,40 @@
+import threading
+import unittest
+
+from pinkopy.concurrency import imap_unordered
+
+
+class TestModuleMethods(unittest.TestCase):
+    def test_imap_unordered(self):
+        def square(x):
+            if x == 3:
+                raise ValueError(x)
+            return x * x
+
+        results = dict(imap_unordered(square, range(10), max_workers=4))
+        assert sorted(results) == list(range(10))
+        assert results[4] == 16
+        assert isinstance(results[3], ValueError)
+
+    def test_imap_unordered_lazy(self):
+        pulled = []
+        release = threading.Event()
+
+        def items():
+            for i in range(100):
+                pulled.append(i)
+                yield i
+
+        def wait(x):
+            release.wait()
+            return x
+
+        results = imap_unordered(wait, items(), max_workers=2, max_pending=3)
+        release.set()
+        next(results)
+        assert len(pulled) <= 4
+        results.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+import pytest
+import requests_mock
+import xmltodict
+
+from pinkopy.clients import ClientSession
+from pinkopy.decoders import Decoder, iter_xml_items
+from pinkopy.jobs import JobSession
+from pinkopy.testing import Fleet, SimulatedCommServe
+from pinkopy.testing.server import legacy, to_xml
+from tests.pinkopy import test_helper
+
+
+def jobs_xml(fleet, client_id):
+    jobs = [{'jobSummary': job} for job in fleet.jobs(client_id)]
+    return to_xml('JobManager_JobListResponse', {'jobs': legacy(jobs)}).encode('UTF-8')
+
+
+class CountingDecoder(Decoder):
+    def __init__(self, *args, **kwargs):
+        super(CountingDecoder, self).__init__(*args, **kwargs)
+        self.calls = []
+
+    def json(self, content):
+        self.calls.append('json')
+        return super(CountingDecoder, self).json(content)
+
+    def xml(self, content):
+        self.calls.append('xml')
+        return super(CountingDecoder, self).xml(content)
+
+
+class TestDecoderMethods(unittest.TestCase):
+    def test_json(self):
+        decoder = Decoder(json_library='json')
+        assert decoder.json(b'{"jobs": [1, 2]}') == {'jobs': [1, 2]}
+        with pytest.raises(ValueError):
+            decoder.json(b'<App_GetClientPropertiesResponse/>')
+        assert Decoder().json_library in ('orjson', 'ujson', 'json')
+
+    def test_xml_libraries_agree(self):
+        body = jobs_xml(Fleet(clients=1, jobs_per_client=4), '1')
+        expected = xmltodict.parse(body)
+        assert Decoder().xml(body) == expected
+        assert Decoder(xml_library='etree').xml(body) == expected
+        with pytest.raises(ValueError):
+            Decoder(xml_library='etree').xml(b'{"jobs": []}')
+        with pytest.raises(ValueError):
+            Decoder(xml_library='lxml')
+
+    def test_iter_xml_items(self):
+        body = jobs_xml(Fleet(clients=1, jobs_per_client=6), '1')
+        chunks = [body[n:n + 7] for n in range(0, len(body), 7)]
+        jobs = list(iter_xml_items(chunks, [('JobManager_JobListResponse', 'jobs')]))
+        assert jobs == xmltodict.parse(body)['JobManager_JobListResponse']['jobs']
+
+
+class TestSessionDecoding(unittest.TestCase):
+    def test_decoded_once(self):
+        decoder = CountingDecoder()
+        with SimulatedCommServe(Fleet(clients=2), dialect='legacy') as server:
+            with ClientSession(service=server.url, user='user', pw='pw', use_cache=False,
+                               decoder=decoder) as clients:
+                del decoder.calls[:]
+                assert clients.get_client_properties('1')
+                assert decoder.calls == ['json', 'xml']
+                del decoder.calls[:]
+                assert clients.get_client_properties('2')
+                assert decoder.calls == ['xml']
+
+    def test_iter_jobs_xml(self):
+        test_data = test_helper.mock_session(JobSession)
+        session = test_data['Session']
+        fleet = Fleet(clients=1, jobs_per_client=20)
+        body = jobs_xml(fleet, '1')
+        with requests_mock.mock() as m:
+            m.get(test_data['Service'] + '/Job', content=body,
+                  headers={'Content-Type': 'application/xml'})
+            jobs = list(session.iter_jobs('1'))
+            assert jobs == xmltodict.parse(body)['JobManager_JobListResponse']['jobs']
+            last = list(session.iter_jobs('1', last=3))
+            assert len(last) == 3
+
+
+if __name__ == '__main__':
+    unittest.main()
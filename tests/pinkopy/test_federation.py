@@ -0,0 +1,94 @@
+import time
+import unittest
+
+import requests
+
+from pinkopy.exceptions import PinkopyError
+from pinkopy.federation import FederatedRecord, FederatedSession
+from pinkopy.testing import Fleet, SimulatedCommServe
+
+
+class TestFederatedSessionMethods(unittest.TestCase):
+    def setUp(self):
+        self.east = SimulatedCommServe(Fleet(clients=2, jobs_per_client=3, seed=1)).start()
+        self.west = SimulatedCommServe(Fleet(clients=3, jobs_per_client=3, seed=2)).start()
+        configs = {
+            'east': {'service': self.east.url, 'user': 'east', 'pw': 'pw'},
+            'west': {'service': self.west.url, 'user': 'west', 'pw': 'pw'}
+        }
+        self.federated = FederatedSession.from_configs(configs, use_cache=False)
+
+    def tearDown(self):
+        self.federated.logout()
+        self.east.stop()
+        self.west.stop()
+
+    def test_get_clients(self):
+        result = self.federated.get_clients()
+        assert result.errors == {}
+        assert [record.commserve for record in result.records] == ['east'] * 2 + ['west'] * 3
+        assert self.federated.sessions['east'].auth is not self.federated.sessions['west'].auth
+
+    def test_get_jobs(self):
+        result = self.federated.get_jobs(client_ids={'east': ['1', '2'], 'west': ['3']},
+                                         concurrency=1)
+        assert sorted(set(r.commserve for r in result.records)) == ['east', 'west']
+        assert len(result.records) == 9
+        self.east.fail(status=404, route='Job')
+        result = self.federated.get_jobs(client_ids={'east': ['1'], 'west': ['3']})
+        assert [r.commserve for r in result.records] == ['west'] * 3
+        assert isinstance(result.errors[('east', '1')], requests.HTTPError)
+
+    def test_get_job_details(self):
+        result = self.federated.get_job_details({'east': ['1000001', '1000000'],
+                                                 'west': ['3000002']})
+        assert result.errors == {}
+        assert [(r.commserve, r.record['generalInfo']['jobId']) for r in result.records] == \
+            [('east', 1000001), ('east', 1000000), ('west', 3000002)]
+
+    def test_timeout(self):
+        self.west.latency = 0.5
+        self.federated.timeouts = {'west': 0.1}
+        start = time.monotonic()
+        result = self.federated.get_clients()
+        assert time.monotonic() - start < 0.4
+        assert result.records == [FederatedRecord('east', r.record) for r in result.records]
+        assert len(result.records) == 2
+        assert isinstance(result.errors['west'], PinkopyError)
+        # log out only once the slow request has finished
+        self.federated.timeouts = {}
+
+    def test_timeout_stops_sweep(self):
+        slow = SimulatedCommServe(Fleet(clients=10, jobs_per_client=1), latency=0.2).start()
+        self.addCleanup(slow.stop)
+        configs = {'slow': {'service': slow.url, 'user': 'slow', 'pw': 'pw'}}
+        federated = FederatedSession.from_configs(configs, use_cache=False, timeout=0.5)
+        client_ids = {'slow': [str(n) for n in range(1, 11)]}
+        result = federated.get_jobs(client_ids=client_ids, concurrency=1)
+        assert list(result.errors) == ['slow']
+        # the request in flight at the timeout finishes, no more follow
+        time.sleep(0.5)
+        requests_made = slow.requests['Job']
+        time.sleep(0.5)
+        assert slow.requests['Job'] == requests_made < 5
+        job_ids = {'slow': [str(n * 1000000) for n in range(1, 11)]}
+        result = federated.get_job_details(job_ids, concurrency=1)
+        assert list(result.errors) == ['slow']
+        time.sleep(0.5)
+        assert slow.requests['JobDetails'] < 5
+        federated.timeout = None
+        federated.logout()
+
+    def test_unavailable(self):
+        configs = {'east': {'service': self.east.url, 'user': 'east', 'pw': 'pw'},
+                   'down': {'service': 'http://127.0.0.1:1/', 'user': 'u', 'pw': 'pw',
+                            'retries': 0}}
+        with FederatedSession.from_configs(configs, use_cache=False) as federated:
+            assert list(federated.sessions) == ['east']
+            result = federated.get_clients()
+            assert len(result.records) == 2
+            assert 'down' in result.errors
+
+
+if __name__ == '__main__':
+    unittest.main()
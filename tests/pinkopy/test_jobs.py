@@ -0,0 +1,111 @@
+import unittest
+
+import pytest
+import requests
+import requests_mock
+
+from pinkopy.exceptions import PinkopyError
+from pinkopy.jobs import JobIndex, JobSession
+from tests.pinkopy import test_helper
+
+
+def job_details_response(request, context):
+    job_id = request.json()['JobManager_JobDetailRequest']['@jobId']
+    if job_id == '404':
+        return {'job': {'jobDetail': None}}
+    return {'job': {'jobDetail': {'jobId': job_id}}}
+
+
+def make_job(job_id, subclient_name, start_time=0, prefix=''):
+    return {
+        'jobSummary': {
+            prefix + 'jobId': job_id,
+            prefix + 'jobStartTime': start_time,
+            'subclient': {
+                prefix + 'subclientId': subclient_name[-1],
+                prefix + 'subclientName': subclient_name
+            }
+        }
+    }
+
+
+class TestJobIndexMethods(unittest.TestCase):
+    def setUp(self):
+        self.jobs = [make_job(str(n), 'sc{}'.format(n % 3), start_time=100 - n)
+                     for n in range(12)]
+        self.jobs.append(make_job('99', 'xsc1', start_time=50))
+        self.index = JobIndex(self.jobs)
+
+    def test_get(self):
+        for subclient_id in ('0', '1', '2'):
+            expected = JobSession.get_subclient_jobs(self.jobs, subclient_id=subclient_id)
+            assert self.index.get(subclient_id=subclient_id) == expected
+        expected = JobSession.get_subclient_jobs(self.jobs, subclient_id='1', last=2)
+        assert self.index.get(subclient_id=1, last=2) == expected
+
+    def test_get_name(self):
+        jobs = self.index.get(subclient_name='sc1')
+        assert [j['jobSummary']['jobId'] for j in jobs] == ['10', '7', '4', '1']
+        expected = JobSession.get_subclient_jobs(self.jobs, subclient_name='sc1')
+        assert self.index.get(subclient_name='sc1', partial=True) == expected
+
+    def test_get_legacy(self):
+        jobs = [make_job('1', 'sc1', start_time='2', prefix='@'),
+                make_job('2', 'sc1', start_time='1', prefix='@')]
+        assert JobIndex(jobs).get(subclient_name='sc1') == [jobs[1], jobs[0]]
+
+    def test_get_missing(self):
+        with pytest.raises(requests.HTTPError):
+            self.index.get(subclient_id='7')
+        with pytest.raises(PinkopyError):
+            self.index.get()
+
+
+class TestJobSessionMethods(unittest.TestCase):
+    def test_iter_jobs(self):
+        test_data = test_helper.mock_session(JobSession)
+        session = test_data['Session']
+        jobs = [make_job(str(n), 'sc{}'.format(n % 3)) for n in range(10)]
+        with requests_mock.mock() as m:
+            m.get(test_data['Service'] + '/Job', json={'jobs': jobs})
+            assert list(session.iter_jobs('1')) == jobs
+            for last in (1, 4, 20):
+                assert list(session.iter_jobs('1', last=last)) == session.get_jobs('1', last=last)
+
+    def test_get_job_details_many(self):
+        test_data = test_helper.mock_session(JobSession)
+        session = test_data['Session']
+        with requests_mock.mock() as m:
+            m.post(test_data['Service'] + '/JobDetails', json=job_details_response)
+            session.get_job_details('1')
+            results = dict(session.get_job_details_many(['1', '2', '3', '404'], max_workers=2))
+            assert results['2'] == {'jobId': '2'}
+            assert isinstance(results['404'], requests.HTTPError)
+            # job 1 was cached before the bulk call
+            job_ids = [r.json()['JobManager_JobDetailRequest']['@jobId']
+                       for r in m.request_history]
+            assert job_ids.count('1') == 1
+            # one lookup each: the cached job 1 twice, and 2, 3 and 404
+            info = session.get_job_details.cache_info()
+            assert (info.hits, info.misses) == (1, 4)
+
+    def test_get_job_details_many_lazy(self):
+        test_data = test_helper.mock_session(JobSession)
+        session = test_data['Session']
+        pulled = []
+
+        def job_ids():
+            for n in range(100):
+                pulled.append(n)
+                yield str(n)
+
+        with requests_mock.mock() as m:
+            m.post(test_data['Service'] + '/JobDetails', json=job_details_response)
+            results = session.get_job_details_many(job_ids(), max_workers=2)
+            next(results)
+            assert len(pulled) < 10
+            results.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import requests_mock
+
+from pinkopy.commvault import CommvaultSession
+from pinkopy.metrics import Histogram, MetricsCollector
+from pinkopy.retry import RetryPolicy
+
+
+class TestHistogramMethods(unittest.TestCase):
+    def test_cumulative(self):
+        histogram = Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        assert histogram.cumulative() == [(0.1, 2), (1, 3), (float('inf'), 4)]
+        assert histogram.count == 4
+
+
+class TestMetricsCollectorMethods(unittest.TestCase):
+    def test_prometheus(self):
+        metrics = MetricsCollector(buckets=(0.5,))
+        metrics.on_request('Job', 'GET', 200, 0.25, 1024)
+        metrics.on_request('Job', 'GET', None, 2.0, None)
+        metrics.on_retry('Job', 503)
+        metrics.on_cache('get_jobs', 'hits')
+        text = metrics.prometheus()
+        bucket = 'pinkopy_request_duration_seconds_bucket{route="Job",method="GET",'
+        assert bucket + 'le="0.5"} 1' in text
+        assert bucket + 'le="+Inf"} 2' in text
+        assert 'pinkopy_response_size_bytes_sum{route="Job"} 1024.0' in text
+        assert 'pinkopy_responses_total{route="Job",status="error"} 1' in text
+        assert 'pinkopy_retries_total{route="Job",reason="503"} 1' in text
+        assert 'pinkopy_cache_lookups_total{method="get_jobs",result="hits"} 1' in text
+        metrics.reset()
+        assert metrics.snapshot()['responses'] == {}
+
+
+class TestSessionMetrics(unittest.TestCase):
+    def test_session(self):
+        metrics = MetricsCollector()
+        service = 'http://example.com'
+        with requests_mock.mock() as m:
+            m.post(service + '/Login', json={'token': 'token'})
+            commvault = CommvaultSession(service=service, user='user', pw='pw',
+                                         instrument=metrics,
+                                         retry_policy=RetryPolicy(backoff=0))
+            m.get(service + '/Subclient', [{'status_code': 401}, {'status_code': 503},
+                                           {'json': {'subClientProperties': [{}]}}])
+            commvault.get_subclients('1')
+            commvault.get_subclients('1')
+        snap = metrics.snapshot()
+        assert snap['responses'] == {('Login', '200'): 2, ('Subclient', '401'): 1,
+                                     ('Subclient', '503'): 1, ('Subclient', '200'): 1}
+        assert snap['reauths'] == {'Subclient': 1}
+        assert snap['retries'] == {('Subclient', '503'): 1}
+        assert snap['parse'][('Subclient', 'json')]['count'] == 1
+        assert snap['latency'][('Subclient', 'GET')]['count'] == 3
+        assert snap['cache'] == {('get_subclients', 'misses'): 1,
+                                 ('get_subclients', 'hits'): 1}
+
+
+if __name__ == '__main__':
+    unittest.main()
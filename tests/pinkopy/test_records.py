@@ -0,0 +1,85 @@
+import pickle
+import unittest
+
+import requests_mock
+
+from pinkopy.clients import ClientSession
+from pinkopy.jobs import JobSession
+from pinkopy.records import Client, JobDetail, JobSummary, Record, Subclient
+
+
+class TestRecordMethods(unittest.TestCase):
+    def test_client(self):
+        raw = {'client': {'clientEntity': {'clientId': 2, 'clientName': 'two',
+                                           'hostName': 'two.example.com'}}}
+        client = Client.from_raw(raw, keep_raw=True)
+        assert client.client_id == '2'
+        assert client.name == 'two'
+        assert client.hostname == 'two.example.com'
+        assert client.raw == raw
+        assert client['client'] == raw['client']
+        assert client['client'] is client['client']
+        assert Client.from_raw(raw).raw is None
+        with self.assertRaises(KeyError):
+            Client.from_raw(raw)['client']
+        assert Client.coerce(raw) == client
+        assert Client.coerce(raw).raw is None
+        assert Client.coerce(client) is client
+
+    def test_legacy_dialect(self):
+        raw = {'jobSummary': {'@jobId': '7', '@jobStartTime': '100', '@status': 'Running',
+                              'subclient': {'@subclientId': '3', '@subclientName': 'sc'}}}
+        job = JobSummary.from_raw(raw)
+        assert job.job_id == '7'
+        assert job.start_time == 100
+        assert job.status == 'Running'
+        assert job.subclient_id == '3'
+        assert job.subclient_name == 'sc'
+        raw = {'subClientEntity': {'@subclientId': '3', '@subclientName': 'sc',
+                                   '@clientId': '2'}}
+        subclient = Subclient.from_raw(raw)
+        assert (subclient.subclient_id, subclient.name, subclient.client_id) == ('3', 'sc', '2')
+
+    def test_job_detail(self):
+        detail = JobDetail.from_raw({'clientStatusInfo': {'vmStatus': {'vmName': 'a'}}},
+                                    job_id=5)
+        assert detail.job_id == '5'
+        assert detail.vm_status == [{'vmName': 'a'}]
+        assert JobDetail.from_raw(None).vm_status is None
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            Record()
+
+    def test_pickle(self):
+        raw = {'client': {'clientEntity': {'clientId': 2}}}
+        client = Client.from_raw(raw, keep_raw=True)
+        copy = pickle.loads(pickle.dumps(client))
+        assert copy == client
+        assert copy.raw == raw
+
+
+class TestSessionRecords(unittest.TestCase):
+    def test_use_records(self):
+        clients = [{'client': {'clientEntity': {'clientId': 1, 'clientName': 'one'}}}]
+        service = 'http://example.com'
+        session = ClientSession(service=service, user='user', pw='pw', token='token',
+                                use_records=True)
+        with requests_mock.mock() as m:
+            m.get(service + '/Client', json={'clientProperties': clients})
+            assert session.get_clients() == [Client.from_raw(clients[0])]
+            assert session.get_client('1').name == 'one'
+            assert session.get_client('1').raw is None
+        session = ClientSession(service=service, user='user', pw='pw', token='token',
+                                use_records=True, keep_raw=True, use_cache=False)
+        with requests_mock.mock() as m:
+            m.get(service + '/Client', json={'clientProperties': clients})
+            assert session.get_clients()[0]['client'] == clients[0]['client']
+
+    def test_get_job_vmstatus(self):
+        detail = JobDetail.from_raw({'clientStatusInfo': {'vmStatus': [{'vmName': 'a'}]}})
+        assert JobSession.get_job_vmstatus(detail) == [{'vmName': 'a'}]
+
+
+if __name__ == '__main__':
+    unittest.main()
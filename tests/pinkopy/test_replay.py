@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pytest
+
+from pinkopy.commvault import CommvaultSession
+from pinkopy.exceptions import PinkopyError
+from pinkopy.replay import RecordingTransport, ReplayTransport, load
+from pinkopy.testing import Fleet, SimulatedCommServe
+
+
+class TestReplayTransport(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'session.jsonl.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def calls(self, commvault):
+        return (commvault.get_clients(),
+                commvault.get_client_properties('2'),
+                commvault.get_jobs('2', last=3),
+                commvault.get_job_details('2000001'))
+
+    def test_record_replay(self):
+        for dialect in ('json', 'legacy'):
+            with SimulatedCommServe(Fleet(clients=3, jobs_per_client=5),
+                                    dialect=dialect) as server:
+                with RecordingTransport(self.path) as transport:
+                    with CommvaultSession(service=server.url, user='user', pw='secret',
+                                          transport=transport) as commvault:
+                        recorded = self.calls(commvault)
+            entries = list(load(self.path))
+            assert entries[0]['url'].endswith('/Login')
+            assert 'secret' not in entries[0]['request_body']
+            assert 'Authtoken' not in entries[1]['headers']
+            with ReplayTransport(self.path, strict=True) as transport:
+                # the server is gone; no request can reach it
+                with CommvaultSession(service='http://replay.example.com/', user='user',
+                                      pw='secret', transport=transport) as commvault:
+                    assert self.calls(commvault) == recorded
+                with pytest.raises(PinkopyError):
+                    commvault.get_subclients('1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+import pytest
+import requests
+import requests_mock
+
+from pinkopy.base_session import BaseSession
+from pinkopy.exceptions import PinkopyError
+from pinkopy.retry import RetryBudget, RetryPolicy
+from tests.pinkopy import test_helper
+
+
+def make_response(status_code, headers=None):
+    res = requests.Response()
+    res.status_code = status_code
+    res.headers.update(headers or {})
+    return res
+
+
+class TestRetryBudgetMethods(unittest.TestCase):
+    def test_withdraw(self):
+        budget = RetryBudget(ratio=0.5, min_retries=1)
+        assert budget.withdraw()
+        assert not budget.withdraw()
+        budget.deposit()
+        budget.deposit()
+        assert budget.withdraw()
+        assert not budget.withdraw()
+
+
+class TestRetryPolicyMethods(unittest.TestCase):
+    def test_delay(self):
+        policy = RetryPolicy(attempts=3, backoff=1, max_backoff=10)
+        assert 0 <= policy.delay('GET', 'Job', 1) <= 1
+        assert 0 <= policy.delay('GET', 'Job', 2) <= 2
+        assert policy.delay('GET', 'Job', 3) is None
+        assert policy.delay('GET', 'Job', 1, res=make_response(500)) is None
+
+    def test_delay_idempotent(self):
+        policy = RetryPolicy()
+        assert policy.delay('POST', 'JobDetails', 1) is not None
+        assert policy.delay('POST', 'Login', 1) is None
+        assert policy.delay('PUT', 'Client', 1) is None
+
+    def test_delay_retry_after(self):
+        policy = RetryPolicy(max_backoff=10)
+        assert policy.delay('GET', 'Job', 1, res=make_response(503, {'Retry-After': '4'})) == 4
+        assert policy.delay('GET', 'Job', 1, res=make_response(429, {'Retry-After': '99'})) == 10
+        date = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        assert policy.delay('GET', 'Job', 1, res=make_response(503, {'Retry-After': date})) == 0
+
+    def test_delay_budget(self):
+        policy = RetryPolicy(budget=RetryBudget(ratio=0, min_retries=1))
+        assert policy.delay('GET', 'Job', 1) is not None
+        assert policy.delay('GET', 'Job', 1) is None
+
+
+class TestBaseSessionRetry(unittest.TestCase):
+    def setUp(self):
+        test_data = test_helper.mock_session(BaseSession)
+        self.service = test_data['Service']
+        self.session = test_data['Session']
+        self.session.retry_policy = RetryPolicy(backoff=0)
+
+    def test_request_status(self):
+        with requests_mock.mock() as m:
+            m.get(self.service + '/Client', [{'status_code': 503}, {'json': {'ok': True}}])
+            assert self.session.request('GET', 'Client').json() == {'ok': True}
+            assert m.call_count == 2
+            assert m.request_history[0].timeout == (10, 300)
+
+    def test_request_connection_error(self):
+        with requests_mock.mock() as m:
+            m.get(self.service + '/Client', [{'exc': requests.ConnectionError},
+                                             {'exc': requests.ConnectTimeout},
+                                             {'json': {}}])
+            self.session.request('GET', 'Client')
+            assert m.call_count == 3
+            m.get(self.service + '/Client', exc=requests.ReadTimeout)
+            with pytest.raises(PinkopyError):
+                self.session.request('GET', 'Client')
+
+    def test_request_not_idempotent(self):
+        with requests_mock.mock() as m:
+            m.put(self.service + '/Client', status_code=503)
+            with pytest.raises(requests.HTTPError):
+                self.session.request('PUT', 'Client')
+            assert m.call_count == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from pinkopy.cache import SessionCache
+from pinkopy.commvault import CommvaultSession
+from pinkopy.records import Client, JobDetail
+from pinkopy.store import SQLiteStore
+from pinkopy.testing import Fleet, SimulatedCommServe
+
+
+class TestSQLiteStoreMethods(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_set(self):
+        store = SQLiteStore(self.path, namespace='a')
+        store.set(('get_clients',), [{'client': 1}], ttl=60)
+        # another process opening the same file
+        other = SQLiteStore(self.path, namespace='a')
+        found, value, expires = other.get(('get_clients',))
+        assert found
+        assert value == [{'client': 1}]
+        assert expires > time.time()
+        assert not SQLiteStore(self.path, namespace='b').get(('get_clients',))[0]
+
+    def test_stale(self):
+        store = SQLiteStore(self.path, max_stale=60)
+        store.set(('get_clients',), 'clients', ttl=-1)
+        found, value, expires = store.get(('get_clients',))
+        assert found and expires < time.time()
+        store = SQLiteStore(self.path, max_stale=0)
+        assert not store.get(('get_clients',))[0]
+
+    def test_stale_bounded_by_ttl(self):
+        store = SQLiteStore(self.path)
+        store.set(('get_clients',), 'clients', ttl=-30)
+        assert store.get(('get_clients',), ttl=60)[0]
+        assert not store.get(('get_clients',), ttl=10)[0]
+
+    def test_records(self):
+        store = SQLiteStore(self.path)
+        client = Client(client_id='1', name='one', hostname='one.example.com')
+        detail = JobDetail(raw={'generalInfo': {'jobId': 5}}, job_id='5', status='Completed',
+                           vm_status=[{'vmName': 'vm1'}])
+        store.set(('get_clients',), [client, {'plain': 1}], ttl=60)
+        store.set(('get_job_details', '5'), detail, ttl=60)
+        clients = store.get(('get_clients',))[1]
+        assert clients == [client, {'plain': 1}]
+        assert isinstance(clients[0], Client)
+        assert clients[0].raw is None
+        detail_value = store.get(('get_job_details', '5'))[1]
+        assert detail_value == detail
+        assert detail_value.raw == {'generalInfo': {'jobId': 5}}
+
+    def test_unstorable(self):
+        store = SQLiteStore(self.path)
+        store.set(('get_clients',), object(), ttl=60)
+        assert not store.get(('get_clients',))[0]
+
+    def test_pickled_entry_dropped(self):
+        store = SQLiteStore(self.path)
+        with store.connection as conn:
+            conn.execute('INSERT INTO entries (key, expires, value) VALUES (?, ?, ?)',
+                         (store._key(('get_clients',)), time.time() + 60,
+                          sqlite3.Binary(pickle.dumps(['old'], pickle.HIGHEST_PROTOCOL))))
+        assert not store.get(('get_clients',))[0]
+        row = store.connection.execute('SELECT COUNT(*) FROM entries').fetchone()
+        assert row[0] == 0
+
+    def test_invalidate(self):
+        store = SQLiteStore(self.path)
+        store.set(('get_subclients', '1'), 'one', ttl=60)
+        store.set(('get_subclients', '2'), 'two', ttl=60)
+        store.set(('get_clients',), 'clients', ttl=60)
+        store.delete(('get_subclients', '1'))
+        assert not store.get(('get_subclients', '1'))[0]
+        store.invalidate('get_subclients')
+        assert not store.get(('get_subclients', '2'))[0]
+        assert store.get(('get_clients',))[0]
+        store.clear()
+        assert not store.get(('get_clients',))[0]
+
+    def test_result_modes(self):
+        with SimulatedCommServe(Fleet(clients=2)) as server:
+            config = {'service': server.url, 'user': 'user', 'pw': 'pw',
+                      'cache_path': self.path}
+            with CommvaultSession(use_records=True, **config) as commvault:
+                assert commvault.get_clients()[0].raw is None
+            with CommvaultSession(**config) as commvault:
+                assert commvault.get_client('1')['client']['clientEntity']['clientId'] == 1
+            with CommvaultSession(use_records=True, keep_raw=True, **config) as commvault:
+                assert commvault.get_clients()[0]['client'] is not None
+            # each mode fetched once, then read from the file
+            assert server.requests['Client'] == 3
+            with CommvaultSession(**config) as commvault:
+                assert isinstance(commvault.get_clients()[0], dict)
+            assert server.requests['Client'] == 3
+
+    def test_session_cache(self):
+        calls = []
+
+        def get_clients():
+            calls.append(1)
+            return ['client{}'.format(len(calls))]
+
+        cache = SessionCache(store=SQLiteStore(self.path), ttl=60)
+        assert cache.wrap('get_clients', get_clients)() == ['client1']
+        # new process, cold memory
+        cache = SessionCache(store=SQLiteStore(self.path), ttl=60)
+        assert cache.wrap('get_clients', get_clients)() == ['client1']
+        assert len(calls) == 1
+        # stale on disk: served while refreshed behind
+        SQLiteStore(self.path).set(('get_clients',), ['old'], ttl=-1)
+        cache = SessionCache(store=SQLiteStore(self.path), ttl=60)
+        wrapped = cache.wrap('get_clients', get_clients)
+        assert wrapped() == ['old']
+        for _ in range(100):
+            if cache.peek('get_clients')[0]:
+                break
+            time.sleep(0.01)
+        assert wrapped() == ['client2']
+        assert SQLiteStore(self.path).get(('get_clients',))[1] == ['client2']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import json
+import unittest
+
+import pytest
+
+from pinkopy.streaming import iter_json_items
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestModuleMethods(unittest.TestCase):
+    def test_iter_json_items(self):
+        items = [{'id': n, 'name': 'a "quoted" [bracket] {brace}', 'n': [n, 1.5, None]}
+                 for n in range(20)] + [12345, 'text']
+        doc = json.dumps({'other': {'jobs': ['wrong']}, 'odd\\"key': [1],
+                          'jobs': items, 'totalRecords': 22})
+        for size in (1, 7, 64, len(doc)):
+            result = list(iter_json_items(chunked(doc, size), [('jobs',)]))
+            assert result == items
+
+    def test_iter_json_items_scalars(self):
+        items = [-3, 2.5e3, -0.25e-2, True, False, None, 12, 'a', {'b': -1.5}, [10], 7]
+        doc = '{"jobs": [-3, 2.5e3, -0.25E-2, true, false, null, 12, "a", {"b": -1.5}, [10], 7]}'
+        for size in (1, 2, 3):
+            assert list(iter_json_items(chunked(doc, size), [('jobs',)])) == items
+            compact = doc.replace(' ', '')
+            assert list(iter_json_items(chunked(compact, size), [('jobs',)])) == items
+
+    def test_iter_json_items_nested(self):
+        doc = json.dumps({'JobManager_JobListResponse': {'jobs': [{'a': 1}, {'b': 2}]}})
+        paths = [('jobs',), ('JobManager_JobListResponse', 'jobs')]
+        assert list(iter_json_items(chunked(doc, 5), paths)) == [{'a': 1}, {'b': 2}]
+
+    def test_iter_json_items_empty(self):
+        assert list(iter_json_items(['{"jobs": [ ]}'], [('jobs',)])) == []
+
+    def test_iter_json_items_missing(self):
+        with pytest.raises(KeyError):
+            list(iter_json_items(['{"other": []}'], [('jobs',)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import pytest
+import requests
+
+from pinkopy.commvault import CommvaultSession
+from pinkopy.records import JobSummary
+from pinkopy.retry import RetryPolicy
+from pinkopy.testing import Fleet, SimulatedCommServe
+
+
+class TestFleetMethods(unittest.TestCase):
+    def test_jobs(self):
+        fleet = Fleet(clients=3, jobs_per_client=10, now=1000000)
+        jobs = fleet.jobs('2')
+        assert len(jobs) == 10
+        assert jobs == Fleet(clients=3, jobs_per_client=10, now=1000000).jobs('2')
+        assert fleet.job(jobs[4]['jobId']) == jobs[4]
+        assert fleet.job_details('9000000') is None
+
+
+class TestSimulatedCommServe(unittest.TestCase):
+    def session(self, server, **kwargs):
+        return CommvaultSession(service=server.url, user='user', pw='pw', **kwargs)
+
+    def test_dialects(self):
+        fleet = Fleet(clients=4, jobs_per_client=6)
+        for dialect in ('json', 'legacy'):
+            with SimulatedCommServe(fleet, dialect=dialect) as server:
+                with self.session(server, use_records=True) as commvault:
+                    clients = commvault.get_clients()
+                    assert [c.client_id for c in clients] == ['1', '2', '3', '4']
+                    assert commvault.get_client_properties('2')
+                    assert len(commvault.get_subclients('3')) == 3
+                    jobs = commvault.get_jobs('3', last=2)
+                    assert [j.job_id for j in jobs] == [j.job_id for j in
+                                                        commvault.iter_jobs('3', last=2)]
+                    details = commvault.get_job_details(jobs[0].job_id)
+                    assert details.job_id == jobs[0].job_id
+                    with pytest.raises(requests.HTTPError):
+                        commvault.get_job_details('9000000')
+
+    def test_faults(self):
+        with SimulatedCommServe(Fleet(clients=2)) as server:
+            with self.session(server, use_cache=False,
+                              retry_policy=RetryPolicy(backoff=0)) as commvault:
+                server.expire_tokens()
+                server.fail(503, route='Client')
+                assert len(commvault.get_clients()) == 2
+                assert server.requests['Login'] == 2
+                assert server.requests['Client'] == 3
+
+    def test_lookup_time(self):
+        fleet = Fleet(clients=1, jobs_per_client=30, history=30 * 86400)
+        with SimulatedCommServe(fleet) as server:
+            with self.session(server, use_cache=False) as commvault:
+                jobs = [JobSummary.coerce(j) for j in
+                        commvault.get_jobs('1', lookup_time=3 * 86400)]
+                assert 0 < len(jobs) < 30
+
+
+if __name__ == '__main__':
+    unittest.main()
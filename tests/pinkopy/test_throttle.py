@@ -0,0 +1,110 @@
+import threading
+import time
+import unittest
+
+import requests_mock
+
+from pinkopy.base_session import BaseSession
+from pinkopy.throttle import Governor, TokenBucket, bulk, current_priority, route_of
+from tests.pinkopy import test_helper
+
+
+class TestModuleMethods(unittest.TestCase):
+    def test_route_of(self):
+        assert route_of('Job') == 'Job'
+        assert route_of('/Client/12') == 'Client'
+        assert route_of('JobDetails?x=1') == 'JobDetails'
+
+    def test_bulk(self):
+        assert bulk(current_priority)() == 'bulk'
+        assert current_priority() == 'interactive'
+
+
+class TestTokenBucketMethods(unittest.TestCase):
+    def test_delay(self):
+        bucket = TokenBucket(10, burst=2)
+        now = bucket.updated
+        bucket.take(now)
+        bucket.take(now)
+        assert abs(bucket.delay(now) - 0.1) < 1e-9
+        assert bucket.delay(now + 0.11) == 0
+
+
+class TestGovernorMethods(unittest.TestCase):
+    def test_rate(self):
+        governor = Governor(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(6):
+            with governor.slot('Job'):
+                pass
+        assert time.monotonic() - start >= 0.09
+        info = governor.info('Job')
+        assert info.requests == 6
+        # the first request took the burst token at once
+        assert 4 <= info.waited <= 5
+        assert info.in_flight == 0
+
+    def test_not_waited(self):
+        governor = Governor(rate=1000, burst=10)
+        for _ in range(5):
+            assert governor.acquire('Job') == 0
+            governor.release('Job')
+        info = governor.info('Job')
+        assert (info.requests, info.waited, info.wait_total) == (5, 0, 0)
+
+    def test_max_in_flight(self):
+        governor = Governor(routes={'JobDetails': {'max_in_flight': 1}})
+        governor.acquire('JobDetails')
+        done = threading.Event()
+
+        def details():
+            with governor.slot('JobDetails'):
+                done.set()
+
+        thread = threading.Thread(target=details)
+        thread.start()
+        # other routes are not held up
+        with governor.slot('Client'):
+            pass
+        assert not done.wait(0.05)
+        assert governor.info('JobDetails').queued == 1
+        governor.release('JobDetails')
+        assert done.wait(1)
+        thread.join()
+        assert governor.info('JobDetails').wait_max > 0
+
+    def test_fair(self):
+        governor = Governor(max_in_flight=1, interactive_share=2)
+        governor.acquire('Job')
+        order = []
+
+        def call(name, priority):
+            with governor.slot('Job', priority):
+                order.append(name)
+
+        threads = [threading.Thread(target=call, args=('b{}'.format(n), 'bulk'))
+                   for n in range(2)]
+        threads += [threading.Thread(target=call, args=('i{}'.format(n), 'interactive'))
+                    for n in range(4)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        governor.release('Job')
+        for thread in threads:
+            thread.join()
+        assert order == ['i0', 'i1', 'b0', 'i2', 'i3', 'b1']
+
+
+class TestBaseSessionGovernor(unittest.TestCase):
+    def test_request(self):
+        test_data = test_helper.mock_session(BaseSession)
+        base_session = test_data['Session']
+        base_session.governor = Governor(routes={'Client': {'rate': 100}})
+        with requests_mock.mock() as m:
+            m.get(test_data['Service'] + '/Client/12', json={})
+            base_session.request('GET', 'Client/12')
+        assert base_session.governor.stats()['Client'].requests == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+import requests_mock
+from requests.adapters import HTTPAdapter
+
+from pinkopy.transport import HTTPTransport
+
+
+class TestHTTPTransportMethods(unittest.TestCase):
+    def test__init__(self):
+        transport = HTTPTransport(pool_maxsize=32)
+        assert transport.adapter._pool_maxsize == 32
+        assert transport.session.get_adapter('https://example.com') is transport.adapter
+        assert transport.session.headers['Connection'] == 'keep-alive'
+
+    def test__init__adapter(self):
+        adapter = HTTPAdapter()
+        transport = HTTPTransport(adapter=adapter, keep_alive=False)
+        assert transport.session.get_adapter('http://example.com') is adapter
+        assert transport.session.headers['Connection'] == 'close'
+
+    def test_request(self):
+        transport = HTTPTransport()
+        with requests_mock.mock() as m:
+            m.get('http://example.com/Client', json={'ok': True})
+            res = transport.request('GET', 'http://example.com/Client')
+            assert res.json() == {'ok': True}
+
+    def test_close(self):
+        with HTTPTransport() as transport:
+            assert not transport.closed
+        assert transport.closed
+
+
+if __name__ == '__main__':
+    unittest.main()
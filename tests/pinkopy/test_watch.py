@@ -0,0 +1,78 @@
+import unittest
+
+import requests
+
+from pinkopy.watch import JobWatcher
+
+
+def make_job(job_id, status, start_time, percent=0):
+    return {
+        'jobSummary': {
+            'jobId': job_id,
+            'status': status,
+            'jobStartTime': start_time,
+            'percentComplete': percent
+        }
+    }
+
+
+class FakeJobs(object):
+    def __init__(self):
+        self.responses = {}
+        self.calls = []
+
+    def get_jobs(self, client_id, job_filter=None, last=None, lookup_time=None):
+        self.calls.append((client_id, lookup_time))
+        response = self.responses[client_id]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class TestJobWatcherMethods(unittest.TestCase):
+    def setUp(self):
+        self.jobs = FakeJobs()
+        self.jobs.responses['1'] = [make_job('1', 'Completed', 10)]
+        self.jobs.responses['2'] = [make_job('2', 'Running', 20)]
+        self.watcher = JobWatcher(self.jobs, ['1', '2'], min_interval=60,
+                                  max_interval=300)
+
+    def test_poll_baseline(self):
+        assert self.watcher.poll(now=1000) == []
+        assert sorted(self.jobs.calls) == [('1', None), ('2', None)]
+        # idle client backs off, active client does not
+        assert self.watcher.states['1'].next_poll == 1120
+        assert self.watcher.states['2'].next_poll == 1060
+
+    def test_poll_events(self):
+        self.watcher.poll(now=1000)
+        self.jobs.responses['2'] = [make_job('2', 'Running', 20, percent=50),
+                                    make_job('3', 'Running', 30)]
+        events = self.watcher.poll(now=1060)
+        assert [(e.kind, e.client_id) for e in events] == [('changed', '2'), ('new', '2')]
+        assert self.jobs.calls[-1] == ('2', 120)
+        # unchanged jobs are not reported again
+        assert self.watcher.poll(now=1120) == []
+
+    def test_poll_not_due(self):
+        self.watcher.poll(now=1000)
+        self.watcher.poll(now=1060)
+        assert [c for c, _ in self.jobs.calls].count('1') == 1
+        for now in (1120, 1360, 1660):
+            self.watcher.poll(now=now)
+        assert self.watcher.states['1'].interval == 300
+
+    def test_poll_error(self):
+        self.jobs.responses['1'] = requests.HTTPError('nope')
+        events = self.watcher.poll(now=1000)
+        assert [(e.kind, e.client_id) for e in events] == [('error', '1')]
+        assert isinstance(events[0].error, requests.HTTPError)
+
+    def test_emit_initial(self):
+        watcher = JobWatcher(self.jobs, ['1'], emit_initial=True)
+        events = watcher.poll(now=1000)
+        assert [(e.kind, e.job) for e in events] == [('new', self.jobs.responses['1'][0])]
+
+
+if __name__ == '__main__':
+    unittest.main()